@@ -0,0 +1,352 @@
+__projectName__ = 'TPE-Price-Changing-Tool'
+__organization__ = 'Tractor Parts Express'
+
+
+"""
+Benchmark Summary:
+This script measures how fast the price changing tool (source.py) runs on catalogs of a given size.
+It writes synthetic TPE, Tisco, and discount input files in the same formats as the real "IN - *.txt" files, runs the
+full pipeline on them, and reports the wall time, throughput, and memory use of each stage.
+Results can be saved as a baseline, and later runs compared against it so that slowdowns are caught before a release.
+
+Examples:
+	python benchmark.py										(10k and 100k SKUs)
+	python benchmark.py --scales 10000 100000 1000000 --save-baseline benchmark-baseline.json
+	python benchmark.py --baseline benchmark-baseline.json	(exits with status 1 on a regression)
+	python benchmark.py --scales 100000 --check-streaming	(exits with status 1 if streaming output differs)
+"""
+
+
+import argparse
+import contextlib
+import io
+import json
+import math
+import os
+import random
+import sys
+import tempfile
+import time
+
+import source
+
+try:
+	import resource
+except ImportError:
+	resource = None		# not available on Windows: peak RSS is not reported there
+
+
+# stages as named in run summaries
+STAGE_NAMES = ['load', 'discount', 'snapshot', 'categorize', 'match', 'price', 'polish', 'validate', 'write', 'history']
+DEFAULT_SCALES = [10000, 100000]
+TISCO_PER_TPE = 2.4				# the real Tisco list has about 2.4 products per TPE product
+DISCOUNTS_PER_TISCO = 0.007		# and about 0.7% of Tisco products are discounted
+MATCH_RATE = 0.97				# share of TPE part numbers that are found in the Tisco list
+BENCHMARK_PROFILE = {
+	'singlePacks': {'willModify': True, 'priceBasedOn': 'TISCO', 'baseMultiplier': 1.40, 'weightMultiplier': 0.30},
+	'multiPacks': {'willModify': True, 'priceBasedOn': 'TISCO', 'baseMultiplier': 1.20, 'weightMultiplier': 0.50},
+	'roundUpAmount': 99}
+
+
+#################################
+# OBJECT AND FUNCTION SUMMARIES #
+#################################
+# generateCatalog()........ writes synthetic "IN - *.txt" files for a catalog of the given size.
+# makePartNumber()......... makes a random part number in one of the styles found in the real Tisco list.
+# makeTpeName()............ makes a random TPE product name ending in "$price. Part number X".
+# makeSku()................ makes a TPE sku for a part number, in one of the styles found in the real SKU list.
+# formatTiscoPrice()....... formats a price the way the Tisco price list does (" 1,234.56 ").
+# formatTpePrice()......... formats a price the way the TPE price list does ("1,234.99").
+# runBenchmark()........... runs the whole pipeline on a synthetic catalog and returns per-stage results.
+# checkStreaming()......... runs a synthetic catalog normally and in streaming mode and lists the differing outputs.
+# getPeakRss()............. returns the peak resident memory of this process, in bytes.
+# printResults()........... prints the results for one catalog size as a table.
+# compareWithBaseline().... compares results against a saved baseline and lists any regressions.
+# main()................... entry point: parses options, runs each size, and saves or checks the baseline.
+
+
+def generateCatalog(directory, tpeCount, seed=2014):
+	"""
+	This function writes synthetic "IN - *.txt" files for a catalog of tpeCount TPE products into directory.
+	The Tisco list is about 2.4 times as long, about 0.7% of it is discounted, and about 97% of TPE part numbers
+	can be found in it, as in the real files. Names carry "N pack." markers, excluded category keywords, "$" price
+	tokens, and a final "Part number X"; Tisco prices of $1,000 and up are comma-formatted.
+	"""
+	rng = random.Random(seed)
+	tiscoCount = int(tpeCount * TISCO_PER_TPE)
+
+	# Tisco part numbers are unique; TPE products mostly reuse them
+	partNumbers = set()
+	while len(partNumbers) < tiscoCount:
+		partNumbers.add(makePartNumber(rng))
+	partNumbers = sorted(partNumbers)
+	tiscoPrices = [round(rng.lognormvariate(2.8, 1.3), 2) for _ in partNumbers]
+
+	with open(os.path.join(directory, 'IN - Tisco Product Numbers.txt'), 'w') as prodNumFile, \
+			open(os.path.join(directory, 'IN - Tisco Prices.txt'), 'w') as priceFile:
+		prodNumFile.write('\n'.join(partNumbers) + '\n')
+		priceFile.write('\n'.join([formatTiscoPrice(price) for price in tiscoPrices]) + '\n')
+
+	discounted = rng.sample(range(tiscoCount), max(1, int(tiscoCount * DISCOUNTS_PER_TISCO)))
+	with open(os.path.join(directory, 'IN - Discount Product Numbers.txt'), 'w') as prodNumFile, \
+			open(os.path.join(directory, 'IN - Discount Prices.txt'), 'w') as priceFile:
+		prodNumFile.write('\n'.join([partNumbers[i] for i in discounted]) + '\n')
+		priceFile.write('\n'.join([format(tiscoPrices[i] * 0.9, '.2f') for i in discounted]) + '\n')
+
+	names, skus, prices, weights = [], [], [], []
+	for i in range(tpeCount):
+		if rng.random() < MATCH_RATE:
+			partNumber = partNumbers[rng.randrange(tiscoCount)]
+		else:
+			partNumber = makePartNumber(rng) + 'X'
+		price = math.floor(rng.lognormvariate(3.2, 1.2)) + 0.99
+		names.append(makeTpeName(rng, partNumber, price))
+		skus.append(makeSku(rng, partNumber))
+		prices.append(formatTpePrice(price))
+		weights.append(rng.choice(['0', '0', '0', '1', '2.5', '10', '13.82', '50']))
+
+	for fileName, lines in (('IN - TPE Names.txt', names), ('IN - TPE SKUs.txt', skus),
+							('IN - TPE Prices.txt', prices), ('IN - TPE Weights.txt', weights)):
+		with open(os.path.join(directory, fileName), 'w') as outfile:
+			outfile.write('\n'.join(lines))
+
+
+def makePartNumber(rng):
+	"""
+	This function makes a random part number in one of the styles found in the real Tisco list
+	("000032", "8N18204B", "D8NN17750AA", "MBK636-030", "3637307M91").
+	Called by generateCatalog().
+	"""
+	style = rng.randrange(5)
+	letters = 'ABCDEFGHJKLMNPRSTVWXYZ'
+	if style == 0:
+		return str(rng.randrange(10 ** 6)).zfill(6)
+	if style == 1:
+		return str(rng.randrange(1, 10)) + rng.choice(letters) + str(rng.randrange(10 ** 5)) + rng.choice(letters)
+	if style == 2:
+		return ''.join(rng.choice(letters) for _ in range(rng.randrange(2, 5))) + str(rng.randrange(10 ** 6))
+	if style == 3:
+		return rng.choice(letters) * 2 + str(rng.randrange(1000)) + '-' + str(rng.randrange(1000)).zfill(3)
+	return str(rng.randrange(10 ** 6, 10 ** 7)) + 'M' + str(rng.randrange(10, 100))
+
+
+def makeTpeName(rng, partNumber, price):
+	"""
+	This function makes a random TPE product name ending in "$price. Part number X".
+	About one name in five is a multi-pack ("N pack.") and about one in fifty names an excluded category.
+	Called by generateCatalog().
+	"""
+	words = []
+	if rng.random() < 0.1:
+		words.append('***OUT OF STOCK***')
+	words.append(rng.choice(['Engine.', 'Electrical system.', 'Fuel System.', 'Hydraulic pump.',
+							 'Cutting and Mower Parts.', 'Harvesting and Planting.']))
+	words.append(rng.choice(['Nut.', 'Bolt with Nut.', 'Gasket set.', 'Fuel pump.', 'Piston rings.', 'Tine.']))
+	if rng.random() < 0.02:
+		words.append(rng.choice(['Carburetor.', 'Starter.', 'Rim.', 'Radiator.']))
+	if rng.random() < 0.2:
+		words.append(str(rng.choice([2, 4, 10, 25])) + ' pack.')
+	words.append('$' + format(price, '.2f') + '.')
+	words.append('Part number ' + partNumber)
+	return ' '.join(words)
+
+
+def makeSku(rng, partNumber):
+	"""
+	This function makes a TPE sku for a part number, in one of the styles found in the real SKU list
+	("tD8NN17750AA", "6X10300ALTHtcmp773psn5000601rldchg").
+	Called by generateCatalog().
+	"""
+	if rng.random() < 0.15:
+		return 't' + partNumber + 'cmp' + str(rng.randrange(1000)) + 'n' + str(rng.randrange(10 ** 7)) + 'rldchg'
+	return 't' + partNumber
+
+
+def formatTiscoPrice(price):
+	""" This function formats a price the way the Tisco price list does (" 1,234.56 "). Called by generateCatalog(). """
+	return ' ' + format(price, ',.2f') + ' '
+
+
+def formatTpePrice(price):
+	""" This function formats a price the way the TPE price list does ("1,234.99"). Called by generateCatalog(). """
+	return format(price, ',.2f')
+
+
+def runBenchmark(tpeCount, traceMemory=False, keepDirectory=None):
+	"""
+	This function generates a catalog of tpeCount TPE products, runs the whole pipeline on it once, and returns a
+	dictionary of per-stage seconds, rows, rows per second, and peak memory, plus the total time and peak RSS.
+	Stage measurements are taken from the run summary that source.runPipeline() returns.
+	The Tisco cache is turned off and output files are rendered one at a time, so stage times are comparable.
+	Called by main().
+	"""
+	with tempfile.TemporaryDirectory(prefix='tpe-benchmark-') as scratch:
+		directory = keepDirectory or scratch
+		os.makedirs(directory, exist_ok=True)
+		generateCatalog(directory, tpeCount)
+
+		source.OUTPUT_THREADS = 1
+		session = source.PricingSession()
+		session.setChoicesFromProfile(BENCHMARK_PROFILE)
+		with contextlib.redirect_stdout(io.StringIO()):
+			start = time.perf_counter()
+			summary = source.runPipeline(session, directory, inputDirectory=directory, useCache=False,
+										 traceMemory=traceMemory)
+			total = time.perf_counter() - start
+
+	stages = {}
+	for stage in STAGE_NAMES:
+		measured = summary['stages'].get(stage, {'seconds': 0.0, 'rowsIn': 0, 'peakTracedMemory': None})
+		seconds = measured['seconds']
+		stages[stage] = {'seconds': seconds, 'rows': measured['rowsIn'],
+						 'rowsPerSecond': measured['rowsIn'] / seconds if seconds > 0 else 0.0,
+						 'peakMemory': measured['peakTracedMemory']}
+	return {'tpeCount': tpeCount, 'total': total, 'peakRss': getPeakRss(), 'stages': stages}
+
+
+def checkStreaming(tpeCount):
+	"""
+	This function generates a catalog of tpeCount TPE products, runs the whole pipeline on it once normally and once in
+	streaming mode, and returns the names of the output files that differ between the two runs. Catalogs larger than
+	source.STREAM_CHUNK_SIZE are repriced a chunk at a time by the streaming run, so this checks that chunking changes
+	neither the rows of any report nor their order.
+	Called by main().
+	"""
+	with tempfile.TemporaryDirectory(prefix='tpe-benchmark-') as directory:
+		generateCatalog(directory, tpeCount)
+		outputDirectories = [os.path.join(directory, 'normal'), os.path.join(directory, 'streaming')]
+		for outputDirectory, streaming in zip(outputDirectories, (False, True)):
+			os.makedirs(outputDirectory)
+			session = source.PricingSession()
+			session.setChoicesFromProfile(BENCHMARK_PROFILE)
+			with contextlib.redirect_stdout(io.StringIO()):
+				source.runPipeline(session, outputDirectory, inputDirectory=directory, useCache=False,
+								   streaming=streaming)
+
+		differences = []
+		for fileName in sorted(os.listdir(outputDirectories[0])):
+			if not fileName.endswith('.txt'):
+				continue		# the run summary, snapshot, and price history record how each run was made
+			contents = []
+			for outputDirectory in outputDirectories:
+				path = os.path.join(outputDirectory, fileName)
+				if os.path.exists(path):
+					with open(path, 'rb') as outputFile:
+						contents.append(outputFile.read())
+			if len(contents) < 2 or contents[0] != contents[1]:
+				differences.append(fileName)
+	return differences
+
+
+def getPeakRss():
+	"""
+	This function returns the peak resident memory of this process so far, in bytes, or None where it is unknown.
+	Called by runBenchmark().
+	"""
+	if resource is None:
+		return None
+	peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+	return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def printResults(result):
+	"""
+	This function prints the results for one catalog size as a table.
+	Called by main().
+	"""
+	print('\n' + format(result['tpeCount'], ',') + ' TPE SKUs: ' + format(result['total'], '.3f') + ' s total' +
+		  ('' if result['peakRss'] is None else ', peak RSS ' + format(result['peakRss'] / 2 ** 20, '.1f') + ' MiB'))
+	print('STAGE'.ljust(14) + 'SECONDS'.rjust(10) + 'ROWS'.rjust(12) + 'ROWS/S'.rjust(14) + 'PEAK MiB'.rjust(12))
+	for stage in STAGE_NAMES:
+		values = result['stages'][stage]
+		peak = '-' if values['peakMemory'] is None else format(values['peakMemory'] / 2 ** 20, '.1f')
+		print(stage.ljust(14) + format(values['seconds'], '.4f').rjust(10) + str(values['rows']).rjust(12) +
+			  format(values['rowsPerSecond'], ',.0f').rjust(14) + peak.rjust(12))
+
+
+def compareWithBaseline(results, baseline, tolerance, minSeconds):
+	"""
+	This function compares results against a saved baseline and returns a list of regression messages.
+	A stage regresses when it takes more than (1 + tolerance) times its baseline time; stages faster than minSeconds
+	in the baseline are skipped, since timings that short are mostly noise.
+	Called by main().
+	"""
+	regressions = []
+	for result in results:
+		baselineResult = baseline.get('results', {}).get(str(result['tpeCount']))
+		if baselineResult is None:
+			continue
+		for stage in STAGE_NAMES:
+			if stage not in baselineResult['stages']:
+				continue
+			before = baselineResult['stages'][stage]['seconds']
+			after = result['stages'][stage]['seconds']
+			if before >= minSeconds and after > before * (1 + tolerance):
+				regressions.append(format(result['tpeCount'], ',') + ' SKUs, ' + stage + ': ' + format(before, '.4f') +
+								   ' s -> ' + format(after, '.4f') + ' s (+' + format(after / before - 1, '.0%') + ')')
+	return regressions
+
+
+def main(argv=None):
+	"""
+	This function is the entry point of the benchmark.
+	It runs each requested catalog size, prints the results, and saves or checks a baseline.
+	The exit status is 1 if a regression against the baseline was found, or if a streaming run wrote different reports.
+	"""
+	parser = argparse.ArgumentParser(description='Benchmark the TPE price changing pipeline on synthetic catalogs.')
+	parser.add_argument('--scales', nargs='+', type=int, default=DEFAULT_SCALES, metavar='SKUS',
+						help='numbers of TPE SKUs to benchmark (default: 10000 100000)')
+	parser.add_argument('--trace-memory', action='store_true',
+						help='record the peak traced memory of each stage (makes every stage slower)')
+	parser.add_argument('--keep-files', metavar='DIR', help='write the synthetic catalog and outputs here and keep them')
+	parser.add_argument('--save-baseline', metavar='FILE', help='save the results as a baseline')
+	parser.add_argument('--baseline', metavar='FILE', help='compare the results against a saved baseline')
+	parser.add_argument('--tolerance', type=float, default=0.25,
+						help='allowed slowdown per stage before it counts as a regression (default: 0.25)')
+	parser.add_argument('--min-seconds', type=float, default=0.05,
+						help='ignore stages faster than this in the baseline (default: 0.05)')
+	parser.add_argument('--check-streaming', action='store_true',
+						help='also check that a streaming run of each size writes the same reports as a normal run')
+	arguments = parser.parse_args(argv)
+	if arguments.trace_memory and arguments.baseline:
+		parser.error('--trace-memory slows every stage down, so it cannot be combined with --baseline')
+
+	results = []
+	for tpeCount in arguments.scales:
+		keepDirectory = None
+		if arguments.keep_files:
+			keepDirectory = os.path.join(arguments.keep_files, str(tpeCount))
+		results.append(runBenchmark(tpeCount, arguments.trace_memory, keepDirectory))
+		printResults(results[-1])
+
+	status = 0
+	if arguments.check_streaming:
+		for tpeCount in arguments.scales:
+			differences = checkStreaming(tpeCount)
+			if differences:
+				print('\nSTREAMING OUTPUT DIFFERS at ' + format(tpeCount, ',') + ' SKUs: ' + ', '.join(differences))
+				status = 1
+			else:
+				print('\nStreaming output matches at ' + format(tpeCount, ',') + ' SKUs')
+
+	if arguments.save_baseline:
+		with open(arguments.save_baseline, 'w') as baselineFile:
+			json.dump({'python': sys.version.split()[0], 'numpy': source.numpy is not None,
+					   'results': {str(result['tpeCount']): result for result in results}}, baselineFile, indent=1)
+		print('\nBaseline saved to ' + arguments.save_baseline)
+
+	if arguments.baseline:
+		with open(arguments.baseline) as baselineFile:
+			regressions = compareWithBaseline(results, json.load(baselineFile), arguments.tolerance,
+											  arguments.min_seconds)
+		if regressions:
+			print('\nREGRESSIONS:')
+			for regression in regressions:
+				print('  ' + regression)
+			return 1
+		print('\nNo regressions against ' + arguments.baseline)
+	return status
+
+
+if __name__ == '__main__':
+	sys.exit(main())
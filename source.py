@@ -2,8 +2,8 @@ __projectName__ = 'TPE-Price-Changing-Tool'
 __organization__ = 'Tractor Parts Express'
 __author__ = 'Matt Presley'
 __contact__ = 'mpresley2653@gmail.com'
-__version__ = '1.03'
-__date__ = '5-23-2014'
+__version__ = '1.04'
+__date__ = '10-17-2026'
 
 
 """
@@ -11,6 +11,21 @@ Program Summary:
 The purpose of this application is to facilitate the process of changing prices for Tractor Parts Express ("TPE").
 The user is expected to prepare input files with data from TPE's database and with data sent to TPE by Tisco.
 The system reads in this data and outputs files with updated product info, which can then be uploaded to TPE's database.
+Run with no options to be asked for pricing choices, or pass a pricing profile / pricing options to run unattended
+(see "source.py --help"). It can also be imported, and a PricingSession kept warm to price preloaded catalogs many times.
+
+
+What's new in version 1.04:
+- The tool can be imported as a library: a PricingSession holds the catalogs and pricing choices of one job.
+- Pricing profiles and command line options run it unattended; see "source.py --help".
+- Large catalogs can be repriced in streaming mode, or on several worker processes.
+- Incremental runs reprice only the products whose inputs changed, and upload only the rows that changed.
+- Other suppliers' price lists can be merged with Tisco's, and part numbers can be matched approximately.
+- Inputs can be read from an SQLite input database. Uploads can also be exported as CSV or Excel files.
+- New prices are checked against guard rails before anything is written, and every run is kept in a price
+	history that can be rolled back.
+- Watch mode reprices whenever the input files change.
+- Totals: The system now uses 19 classes, 124 functions, and 3,705 lines of code (including comments and whitespace).
 
 
 What's new in version 1.03:
@@ -23,33 +38,113 @@ What's new in version 1.03:
 """
 
 
+import argparse
+import cProfile
+import csv
+import hashlib
+import heapq
+import json
 import math
-
-
-# lists to hold various types of items
-fileStreams = []		# holds all input and output file streams
-TiscoProducts = [] 		# holds ALL Tisco products
-DiscountProducts = [] 	# holds only discounted Tisco products
-TpeProducts = [] 		# holds all products from TPE's current inventory
-MissingProducts = [] 	# TPE products for which a match is not found
-ExcludedProducts = [] 	# TPE products which are not to be modified due to type exclusion
-UpdatedProducts = [] 	# TPE products which are have their prices updated
-SinglePackProducts = []	# single-pack products ready to have prices updated
-MultiPackProducts = []	# multi-pack products ready to have prices updated
+import mmap
+import os
+import pickle
+import re
+import secrets
+import sqlite3
+import sys
+import tempfile
+import time
+import tracemalloc
+import zlib
+from array import array
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import contextmanager, nullcontext
+from itertools import islice, zip_longest
+from sys import intern
+from urllib.request import pathname2url
+
+try:
+	import numpy
+except ImportError:
+	numpy = None		# optional: the pricing columns fall back to the standard array module
+
+try:
+	import openpyxl
+except ImportError:
+	openpyxl = None		# optional: needed only for XLSX exports
+
+try:
+	import resource
+except ImportError:
+	resource = None		# Unix only: peak resident memory is not reported without it
+
+try:
+	import tomllib
+except ImportError:
+	tomllib = None		# optional: Python 3.11+ only, needed for TOML pricing profiles
+
+
+# settings shared by every PricingSession (all other state belongs to a session)
 ExcludedCategories = ['carburetor.', 'starter.', 'rim.', 'radiator.'] # hard-coding these for now
-prodNumList = []		# product numbers only
-skuList = []			# skus only
-priceList = []			# prices only
-weightList = []			# weights only
+REPORT_CHUNK_SIZE = 4096	# number of report rows formatted and written per write() call
+OUTPUT_THREADS = 8			# maximum number of output files rendered at the same time
+SNAPSHOT_VERSION = 1		# format version of "OUT - Last Run Snapshot.json"
+STREAM_CHUNK_SIZE = 65536	# products sorted per spilled run, and repriced per chunk, by streaming runs
+MERGE_FAN_IN = 64			# most spilled runs merged at once by the external sort of streaming runs
+REPORT_LABELS = ('PRODUCT NUMBER     ', 'SKU     ', 'PRICE     ', 'WEIGHT     ', 'NAME')
+MIN_SHARD_SIZE = 1024		# fewest products sent to a worker process at once by parallel runs
+TISCO_CACHE_NAME = 'IN - Tisco Catalog.cache'		# binary cache of the discounted Tisco list, kept with the inputs
+TISCO_CACHE_MAGIC = b'TPE-TISCO-CACHE-2\n'
+TISCO_CACHE_SOURCES = ['IN - Tisco Product Numbers.txt', 'IN - Tisco Prices.txt',
+					   'IN - Discount Product Numbers.txt', 'IN - Discount Prices.txt']
+TPE_INPUT_FILES = ['IN - TPE Names.txt', 'IN - TPE SKUs.txt', 'IN - TPE Prices.txt', 'IN - TPE Weights.txt']
+INPUT_DATABASE_SCHEMA = """
+	CREATE TABLE tpeProducts (name TEXT NOT NULL, sku TEXT NOT NULL, price REAL NOT NULL, weight REAL NOT NULL);
+	CREATE TABLE supplierProducts (supplier TEXT NOT NULL, prodNum TEXT NOT NULL, price REAL NOT NULL);
+	CREATE TABLE supplierDiscounts (supplier TEXT NOT NULL, prodNum TEXT NOT NULL, price REAL NOT NULL);"""
+PRICE_HISTORY_NAME = 'OUT - Price History.sqlite3'	# append-only store of the prices of every run
+PRICE_HISTORY_SCHEMA = """
+	CREATE TABLE IF NOT EXISTS runs (runId INTEGER PRIMARY KEY AUTOINCREMENT, recordedAt TEXT NOT NULL,
+		mode TEXT NOT NULL, roundUpAmount INTEGER NOT NULL, matchMode TEXT NOT NULL, suppliers TEXT NOT NULL);
+	CREATE TABLE IF NOT EXISTS prices (runId INTEGER NOT NULL REFERENCES runs, sku TEXT NOT NULL,
+		oldName TEXT NOT NULL, newName TEXT NOT NULL, oldPrice REAL NOT NULL, newPrice REAL NOT NULL,
+		basis TEXT NOT NULL, baseMultiplier REAL NOT NULL, weightMultiplier REAL NOT NULL);
+	CREATE INDEX IF NOT EXISTS pricesBySku ON prices (sku, runId);
+	CREATE INDEX IF NOT EXISTS pricesByRun ON prices (runId);
+	CREATE TRIGGER IF NOT EXISTS keepRuns BEFORE UPDATE ON runs BEGIN SELECT RAISE(ABORT, 'append-only'); END;
+	CREATE TRIGGER IF NOT EXISTS keepRunRows BEFORE DELETE ON runs BEGIN SELECT RAISE(ABORT, 'append-only'); END;
+	CREATE TRIGGER IF NOT EXISTS keepPrices BEFORE UPDATE ON prices BEGIN SELECT RAISE(ABORT, 'append-only'); END;
+	CREATE TRIGGER IF NOT EXISTS keepPriceRows BEFORE DELETE ON prices BEGIN SELECT RAISE(ABORT, 'append-only'); END;"""
+HISTORY_LABELS = ('RUN     ', 'RECORDED AT     ', 'OLD PRICE     ', 'NEW PRICE     ', 'BASIS     ', 'MULTIPLIERS     ',
+				  'NAME')
+SUPPLIER_POLICIES = ('preferred', 'cheapest', 'recent')	# ways of picking one supplier price per part number
+MATCH_MODES = ('exact', 'normalized', 'fuzzy')			# how far TPE part numbers may differ from supplier ones
+FUZZY_MIN_LENGTH = 5		# shortest part number (letters and digits only) matched with a one-character difference
+MIN_MATCH_CONFIDENCE = 0.9	# approximate matches less certain than this are held for review instead of being priced
+EXPORT_FORMATS = ('csv', 'xlsx')		# file formats of the ShopSite upload files
+SHOPSITE_COLUMNS = ('Name', 'SKU', 'Price')		# header row of the ShopSite upload files
+REVIEW_LABELS = ('SKU     ', 'OLD PRICE     ', 'NEW PRICE     ', 'CHANGE     ', 'SUPPLIER PRICE     ', 'FLAGS     ',
+				 'NAME')
+PRICE_FORMAT = re.compile(r'\d+\.\d\d$')		# what every new price should look like: dollars and two-digit cents
+MATCH_REPORT_LABELS = ('PRODUCT NUMBER     ', 'SKU     ', 'MATCHED NUMBER     ', 'CONFIDENCE     ', 'NAME')
+WATCH_POLL_SECONDS = 1.0		# how often watch mode looks at the input files
+WATCH_SETTLE_SECONDS = 2.0		# how long changed input files must stay unchanged before watch mode reads them
+workerSession = None		# in a worker process of a parallel run, the PricingSession set up by startWorker()
 
 
 #################################
 # OBJECT AND FUNCTION SUMMARIES #
 #################################
 # Product.................. object that holds info about a single product
+# NameTemplate............. object that records where the price sits in a product name, for splicing in new prices
+# GuardRails............... object that holds the limits new prices are checked against
+# GuardRailError........... error raised when a run is stopped by the guard rails.
 # UserInputs............... object that holds user input for a given category of products
-# openFileStreams()........ opens file streams and consolidates them into a list
-# openStream()............. opens an input or output file stream and adds it to a list.
+# TiscoCatalog............. object that indexes Tisco products by part number for constant-time lookups
+# ProductClassifier........ object that flags product names as multi-pack and/or excluded using precompiled keywords
+# SupplierFeed............. object that holds the lines of one more supplier's price and discount lists
+# PricingSession........... object that owns the catalogs, pricing choices, and results of a repricing job (library API)
+# openFileStreams()........ opens the eight input files and returns their streams as a list.
 # closeFileStreams()....... closes all open file streams in the given list.
 # getUserInputs().......... asks the user which types of products they want to change and how.
 # getPreferences()......... gets user input for either single-pack or multi-pack preferences.
@@ -59,23 +154,143 @@ weightList = []			# weights only
 # getWeightMultiplier().... asks the user by how much to increase the price per pound.
 # printUserChoices()....... prints out the user's choices for confirmation and testing.
 # getTpeProducts()......... reads in TPE product info from files and populates a list of Products.
-# getComponent()........... reads in a list containing a single member type and appends each to its Product object.
+# readTpeProducts()........ reads the four TPE input files together and yields one Product per line.
+# findBadTpeValue()........ describes what could not be read in one row of the TPE input files.
+# makeTpeProduct()......... builds a Product from one line of each TPE input file.
+# buildTpeProduct()........ builds a Product from a TPE product's cleaned-up fields.
 # getTiscoProducts()....... populates an empty list of Products with information from input text files.
+# readTiscoProducts()...... reads a Tisco part number file and price file together and yields one Product per line.
 # applyTiscoDiscounts().... applies discounts to any matching products in the "full" Tisco list.
+# normalizePartNumber().... returns the key under which a part number is stored in and looked up from a TiscoCatalog.
+# PartNumberIndex.......... object that finds supplier part numbers differing from a TPE one only in formatting
+# makeCanonicalPartNumber() reduces a part number to the canonical key PartNumberIndex stores it under.
+# makeDeletions().......... returns every string made by deleting one character of a key.
+# isOneEditApart()......... returns whether two strings differ by exactly one inserted, deleted, or changed character.
+# repriceProducts()........ categorizes and prices a list of TPE products under a session's pricing choices.
+# copyProducts()........... copies a list of Products, so a run does not modify the catalog it was loaded into.
 # categorizeAndExcludeProducts() sorts TPE products into a set of pre-defined categories and removes select products.
 # updatePrices()........... updates the prices of all TPE products in the given list.
 # findMatchingProducts()... finds products (based on part number) that are found in both the TPE and Tisco lists.
+# findSupplierMatch()...... finds the supplier product matching a TPE product under the session's match mode.
+# findApproximateMatch()... looks up the approximate match of a TPE product without an exact one.
+# getPartNumberIndex()..... returns a session's PartNumberIndex, building it the first time.
 # polishUpPrices()......... adds the final touches to prices after the primary modifications have been made.
+# makePriceColumn()........ packs a sequence of floats into a NumPy array, or an array('d') when NumPy is missing.
+# calculatePrices()........ applies base and per-pound multipliers to whole price/weight columns in one pass.
+# polishPriceColumn()...... applies the "round up" rules to a whole price column and returns the final price strings.
 # printAllInfo()........... prints out a formatted list containing all members of a product list.
-# findMaxLength().......... reads in a list and finds the maximum number of characters of any element in the list.
-# writeLabel()............. writes a column header and blank spaces after it based on the longest item in the column.
-# writeProductInfo()....... writes all information about a single product to an output file.
+# printMatchReport()....... prints out a formatted list of approximately matched products and their matches.
+# validatePrices()......... flags new prices that break the guard rails, for the review report.
+# findPriceAnomalies()..... runs the numeric guard-rail checks over whole price columns.
+# checkGuardRails()........ stops a run whose share of flagged prices is over the limit.
+# writePriceReview()....... writes the review report of flagged prices.
+# makeReportFormat()....... returns the format string for one row of a product report.
+# findColumnWidth()........ finds the width of a report column from its label and the longest item in it.
 # generateUploadFiles().... writes product names, prices, and skus to three text files for copy/pasting into Excel.
+# writeUploadFile()........ writes one member of every product, one per line, to an upload file.
+# makeExportJobs()......... returns the output jobs that write a ShopSite upload file in each export format.
+# readExportRows()......... yields the ShopSite upload row of every product in a list.
+# writeCsvExport()......... writes one ShopSite upload file as CSV.
+# writeXlsxExport()........ writes one ShopSite upload file as an Excel workbook, in write-only mode.
+# findChangedProducts().... returns the products whose price or name differs from their original ones.
+# renderOutputFiles()...... renders several output files concurrently into temporary files.
+# renderOutputFile()....... runs one output job against a new temporary file.
+# openTempFile()........... creates a hidden temporary file next to an output file, to be renamed over it later.
+# publishOutputFiles()..... atomically renames rendered temporary files over their final names.
+# discardOutputFiles()..... removes rendered temporary files that will not be published.
+# runPipeline()............ runs the whole repricing job once on a session and writes every output file.
+# runStages().............. runs the stages of one repricing job in order and returns the run summary.
+# openWorkerPool()......... starts a pool of worker processes that share the Tisco index, for repriceInParallel().
+# startWorker()............ sets up the PricingSession of a new worker process.
+# repriceInParallel()...... categorizes and prices TPE products on a pool of worker processes, in deterministic order.
+# repriceShard()........... reprices one shard of TPE products in a worker process.
+# runStreamingStages()..... runs one repricing job a chunk at a time, with memory use bounded for any catalog size.
+# makeChunks()............. yields lists of up to a given number of items from an iterable.
+# spillSortedRuns()........ sorts products by name a chunk at a time and spills each chunk to a run file.
+# mergeSortedRuns()........ merges sorted run files and yields their products in name order.
+# spillRun()............... writes products to a run file.
+# readRun()................ yields the products stored in a run file.
+# TiscoIndex............... object that indexes the discounted Tisco list on disk (SQLite) for streaming runs
+# ReportSpool.............. object that spools report rows to disk while tracking their column widths
+# ReviewSpool.............. object that spools price review rows to disk while tracking their column widths
+# writeSpooledReview()..... writes spooled price review rows laid out as writePriceReview() would lay them out.
+# writeSpooledReport()..... writes spooled report rows laid out as printAllInfo() would lay them out.
+# writeSpooledUploadFile(). writes one member of every spooled report row to an upload file.
+# readSpooledExportRows().. yields the ShopSite upload row of every row of one or more ReportSpools.
+# RunStats................. object that holds the per-stage measurements and counters of one run
+# StageMeasurement......... object that holds the row counts of one stage while it runs
+# measureStage()........... times the code in its "with" block as a run of a named stage.
+# countEvent()............. adds to a named counter of a session's run.
+# getPeakRss()............. returns the peak resident memory of this process so far.
+# writeRunSummary()........ writes a run summary to an output file as JSON.
+# printRunSummary()........ prints one line per stage of a run summary.
+# makeSnapshotKey()........ returns the key a TPE product is stored under in the run snapshot.
+# hashProductInputs()...... hashes everything a TPE product's new price depends on.
+# hashPricingChoices()..... hashes a session's pricing choices.
+# loadSnapshot()........... reads the snapshot saved by the last run.
+# makeSnapshot()........... builds the snapshot of the current run.
+# writeSnapshot().......... writes a run snapshot to an output file as JSON.
+# PriceHistory............. object that adds the prices of one run to the append-only price history (SQLite)
+# openPriceHistory()....... opens the price history kept with the output files read-only.
+# findPriceHistory()....... returns every price a sku was given by the runs in the price history.
+# printPriceHistory()...... prints the price history of a sku as a table.
+# writeRollbackFiles()..... writes upload files restoring the names and prices from before a past run.
+# watchInputs()............ reprices incrementally whenever input files change, until interrupted.
+# InputWatcher............. object that polls input files for changes and debounces bursts of writes
+# getFeedPaths()........... returns the paths of the files of every input feed of a session.
+# reloadFeeds()............ reads changed feeds again and rebuilds a session's catalogs from the parsed feeds.
+# readFeed()............... reads the files of one input feed.
+# loadInputs()............. reads the inputs into a session's catalogs from a directory of files or an input database.
+# loadInputDatabase()...... reads an SQLite input database into a session's catalogs.
+# openInputDatabase()...... opens an SQLite input database read-only after checking its tables.
+# readDatabaseTpeProducts() yields a Product for every TPE row of an input database.
+# readDatabaseSupplierProducts() yields a Product for every row of one supplier in an input database table.
+# writeInputDatabase()..... copies the "IN - *.txt" files into a new SQLite input database.
+# loadInputFiles()......... reads every input file into a session's catalogs, using the Tisco cache if it is current.
+# loadCatalogs()........... fills a session's catalogs from lines of input and builds the discounted TiscoCatalog.
+# countCatalogRows()....... counts the products in a session's catalogs and the other suppliers' lists.
+# indexCatalogs().......... builds the discounted TiscoCatalog and merges the other suppliers into it.
+# getSupplierOrder()....... returns the names of a session's suppliers in order of preference.
+# getSupplierFileNames()... returns the names of a supplier's price and discount files.
+# getSupplierPaths()....... returns the paths of the input files of a supplier that are to be read.
+# getFeedTimestamp()....... returns when the newest of a supplier's files was last modified.
+# mergeSupplierCatalogs().. merges several suppliers' catalogs into one best-price catalog under a supplier policy.
+# getFileFingerprint()..... returns the size, modification time, and content hash of a file.
+# loadTiscoCache()......... returns the discounted Tisco products stored in the binary cache, if it is current.
+# readTiscoCacheHeader()... reads the header of a memory-mapped Tisco cache.
+# saveTiscoCache()......... writes the discounted Tisco products to the binary cache.
+# writeTiscoCache()........ writes the discounted Tisco products and their hash table to an open file.
+# MappedTiscoIndex......... object that looks up Tisco prices straight from the hash table in a memory-mapped cache
+# alignTo8()............... rounds a byte offset up to the next multiple of 8.
+# loadProfile()............ reads a pricing profile from a JSON or TOML file.
+# readProfileChoices()..... reads and checks the user choices held in a pricing profile.
+# readMatchMode().......... reads and checks the match mode of a pricing profile.
+# readMinMatchConfidence() reads the least confidence approximate matches are priced with in a pricing profile.
+# readGuardRails()......... reads the guard rails of a pricing profile.
+# makeUserInputs()......... builds and checks a UserInputs object from one section of a pricing profile.
+# readProfileNumber()...... returns a setting of a pricing profile section as a float.
+# compareScenarios()....... prices a session's catalog under several pricing profiles and tabulates the differences.
+# ScenarioResult........... object that holds the totals for one pricing scenario.
+# makeScenarioBases()...... gathers the base price and weight columns one product category needs for scenario pricing.
+# formatScenarioTable().... lays out scenario results as a text table.
+# writeScenarioTable()..... writes a formatted scenario comparison table to an output file.
+# parseArguments()......... reads the command line options for batch mode.
+# getProfileOverrides().... turns pricing options given on the command line into a partial profile.
+# main()................... entry point: runs batch profiles, or asks the user for their choices.
+# runCommand()............. does what the parsed command line options ask for.
 
 
 class Product:
-	""" This class holds all information about a single product in the TPE or Tisco inventory. """
-	def __init__(self: object, sku, name, prodNum, price, weight, isMultiPack, isExcluded, isSinglePack):
+	"""
+	This class holds all information about a single product in the TPE or Tisco inventory.
+	Attributes are kept in __slots__ rather than a per-object __dict__, since hundreds of thousands of these may be
+	alive at once; part numbers are interned when read so that TPE and Tisco records share one copy of each.
+	"""
+	__slots__ = ('sku', 'name', 'prodNum', 'price', 'weight', 'isSinglePack', 'isMultiPack', 'isExcluded',
+				 'nameTemplate', 'match')
+
+	def __init__(self: object, sku, name, prodNum, price, weight, isMultiPack, isExcluded, isSinglePack,
+				 nameTemplate=None):
 		self.sku = sku 						# string
 		self.name = name 					# string
 		self.prodNum = prodNum 				# string
@@ -84,6 +299,51 @@ class Product:
 		self.isSinglePack = isSinglePack	# boolean
 		self.isMultiPack = isMultiPack 		# boolean
 		self.isExcluded = isExcluded		# boolean
+		self.nameTemplate = nameTemplate	# NameTemplate of the name, or None until one is needed
+		self.match = None					# (matched part number, kind, confidence) of an approximate supplier match
+
+
+class NameTemplate:
+	"""
+	This class records where the price and the "Part number" label sit in a TPE product name, so that a new price can
+	be spliced into the name at those offsets instead of splitting the name into words and joining it back together.
+	The price is the number after the last '$' that comes before "Part number" (or the last one in the name, when the
+	label is missing or misspelled). Only its digits are replaced, so the '$', any punctuation glued to the price,
+	and the spacing of the rest of the name are kept as they are. A name without a price is left unchanged.
+	Templates never change once built, so copies of a Product share their template.
+	"""
+	__slots__ = ('name', 'priceStart', 'priceEnd', 'partNumberStart')
+
+	pricePattern = re.compile(r'\$(\d[\d,]*(?:\.\d+)?)')
+	partNumberPattern = re.compile(r'\bpart\s+number\b', re.IGNORECASE)
+
+	def __init__(self, name):
+		self.name = name
+		partNumber = self.partNumberPattern.search(name)
+		self.partNumberStart = partNumber.start() if partNumber else -1
+
+		price = None
+		if partNumber:
+			for price in self.pricePattern.finditer(name, 0, partNumber.start()):
+				pass
+		if price is None:
+			for price in self.pricePattern.finditer(name):
+				pass
+		self.priceStart, self.priceEnd = price.span(1) if price else (-1, -1)
+
+	def render(self, price):
+		""" Returns the name with the given price (a string) in place of the old one. """
+		if self.priceStart < 0:
+			return self.name
+		return self.name[:self.priceStart] + price + self.name[self.priceEnd:]
+
+	@staticmethod
+	def forProduct(product):
+		""" Returns the template of a Product's current name, building and caching one if it has none yet. """
+		template = product.nameTemplate
+		if template is None or template.name != product.name:
+			template = product.nameTemplate = NameTemplate(product.name)
+		return template
 
 
 class UserInputs:
@@ -95,45 +355,228 @@ class UserInputs:
 		self.weightMultiplier = weightMultiplier
 
 
-def openFileStreams():
-	"""	This function opens file streams and consolidates them into a list. Called by "Main". """
-	print('called openFileStreams()')
-
-	# input file streams
-	global finTiscoProdNums, finTiscoPrices, finDiscountProdNums, finDiscountPrices, finTpeNames, finTpeSkus, finTpePrices, finTpeWeights
-	finTiscoProdNums = openStream('IN - Tisco Product Numbers.txt', 'r')
-	finTiscoPrices = openStream('IN - Tisco Prices.txt', 'r')
-	finDiscountProdNums = openStream('IN - Discount Product Numbers.txt', 'r')
-	finDiscountPrices = openStream('IN - Discount Prices.txt', 'r')
-	finTpeNames = openStream('IN - TPE Names.txt', 'r')
-	finTpeSkus = openStream('IN - TPE SKUs.txt', 'r')
-	finTpePrices = openStream('IN - TPE Prices.txt', 'r')
-	finTpeWeights = openStream('IN - TPE Weights.txt', 'r')
-
-	# output file streams
-	global foutSkus, foutNames, foutPrices, foutMissingProds, foutExcludedProds, foutOriginalProducts, foutUpdatedProducts, foutTiscoProducts
-	foutSkus = openStream('OUT - Skus.txt', 'w')
-	foutNames = openStream('OUT - Names.txt', 'w')
-	foutPrices = openStream('OUT - Prices.txt', 'w')
-	foutMissingProds = openStream('OUT - Missing Products.txt', 'w')
-	foutExcludedProds = openStream('OUT - Excluded Products.txt', 'w')
-	foutOriginalProducts = openStream('OUT - Original Product List.txt', 'w')
-	foutUpdatedProducts = openStream('OUT - Updated Product List.txt', 'w')
-	foutTiscoProducts = openStream('OUT - Tisco Product List.txt', 'w')
-
-
-def openStream(file, readOrWrite):
-	"""	This function opens an input or output file stream and adds it to a list. Called by openFileStreams(). """
-	stream = open(file, readOrWrite)
-	fileStreams.append(stream)
-	return stream
-
-
-def closeFileStreams():
-	""" This function closes all open file streams in the given list. Called by "Main".	"""
-	for stream in fileStreams:
+class GuardRails:
+	"""
+	This class holds the limits that new prices are checked against before any output file is written (see
+	validatePrices()), and the share of flagged prices at which a run is stopped instead.
+	"""
+	def __init__(self, maxChangePercent=50.0, maxChangeAmount=50.0, maxFlaggedShare=None):
+		self.maxChangePercent = maxChangePercent	# largest change, as a percentage of the old price, not flagged
+		self.maxChangeAmount = maxChangeAmount		# largest change in dollars not flagged
+		self.maxFlaggedShare = maxFlaggedShare		# largest share (0-1) of repriced products flagged, or None
+
+
+class GuardRailError(ValueError):
+	"""
+	This class is the error raised when a run is stopped because too many of its new prices were flagged (see
+	checkGuardRails()). It is a ValueError, so callers that handle bad inputs handle it too.
+	"""
+
+
+class TiscoCatalog:
+	"""
+	This class indexes a list of Tisco Products by normalized part number so that matches and discounts can be
+	found with a single dictionary lookup instead of a scan over the whole list.
+	When a part number appears more than once, findProduct() returns the first entry (as the old linear scan did),
+	while applyDiscounts() updates every entry sharing that number, so the last discount in the list wins.
+	"""
+	def __init__(self, productList):
+		self.products = productList		# the indexed Product list, in file order
+		self.entries = {}				# normalized part number -> list of Products with that number
+		for product in productList:
+			key = normalizePartNumber(product.prodNum)
+			if key in self.entries:
+				self.entries[key].append(product)
+			else:
+				self.entries[key] = [product]
+
+	def findProduct(self, prodNum):
+		""" Returns the first Product with the given part number, or None if there is no such product. """
+		matches = self.entries.get(normalizePartNumber(prodNum))
+		if matches:
+			return matches[0]
+		return None
+
+	def applyDiscounts(self, discountProducts):
+		""" Overwrites the price of every indexed Product whose part number appears in the discount list. """
+		for discountProduct in discountProducts:
+			for product in self.entries.get(normalizePartNumber(discountProduct.prodNum), ()):
+				product.price = discountProduct.price
+
+
+class SupplierFeed:
+	"""
+	This class holds the lines of one more supplier's price list and discount list (open files or lists of strings, in
+	the formats of the Tisco files), with the time the feed was last updated, for the 'recent' supplier policy.
+	"""
+	def __init__(self, name, prodNums, prices, discountProdNums=(), discountPrices=(), timestamp=0):
+		self.name = name
+		self.prodNums = prodNums
+		self.prices = prices
+		self.discountProdNums = discountProdNums
+		self.discountPrices = discountPrices
+		self.timestamp = timestamp
+
+
+class PricingSession:
+	"""
+	This class holds everything one repricing job works on, so the tool can be used as a library as well as a script:
+	the TPE and Tisco catalogs, the pricing choices, and the product lists produced by the last run.
+	Catalogs are loaded once, from the "IN - *.txt" files (fromFiles) or from any iterables of lines in the same
+	formats (fromIterables), and can then be priced any number of times under different choices. Each run works on
+	copies of the TPE products, so the loaded catalogs are never modified. For example:
+		session = PricingSession.fromFiles('in', singlePacks=UserInputs(True, 'TISCO', 1.4, 0.3))
+		for roundUp in (88, 99):
+			session.setChoices(roundUpAmount=roundUp)
+			updated = session.reprice()
+	Sessions share no state, so several can be kept warm in one process.
+	Besides Tisco, the price lists of other suppliers can be loaded (see loadCatalogs()); they are merged, once per
+	load, into a single best-price tiscoCatalog under supplierPolicy, which every run and scenario then uses.
+	"""
+	def __init__(self, singlePacks=None, multiPacks=None, roundUpAmount=99, excludedCategories=None, suppliers=None,
+				 supplierPolicy='preferred', matchMode='exact', guardRails=None, minMatchConfidence=MIN_MATCH_CONFIDENCE):
+		# pricing choices
+		self.singlePacks = singlePacks or UserInputs(False, 'nothing', 0.0, 0.0)
+		self.multiPacks = multiPacks or UserInputs(False, 'nothing', 0.0, 0.0)
+		self.roundUpAmount = roundUpAmount
+		self.excludedCategories = ExcludedCategories if excludedCategories is None else list(excludedCategories)
+		self.matchMode = matchMode		# one of MATCH_MODES (see findSupplierMatch())
+		self.minMatchConfidence = minMatchConfidence	# least confidence an approximate match is priced with
+		self.guardRails = guardRails or GuardRails()	# limits new prices are checked against (see validatePrices())
+
+		# suppliers, in order of preference (Tisco comes first unless placed elsewhere), and how their prices are merged
+		self.suppliers = list(suppliers or [])
+		self.supplierPolicy = supplierPolicy
+
+		# catalogs
+		self.tiscoProducts = [] 		# holds ALL Tisco products (the merged best-price list, with other suppliers)
+		self.discountProducts = [] 		# holds only discounted Tisco products
+		self.tiscoCatalog = TiscoCatalog(self.tiscoProducts)	# part number index over tiscoProducts
+		self.tiscoIndexPath = None		# Tisco cache holding the same index, for worker processes, if there is one
+		self.partNumberIndex = None		# PartNumberIndex over tiscoCatalog, built when first needed
+		self.knownMatches = None		# in a worker process, id(product) -> approximate match found by the parent
+		self.tpeProducts = [] 			# holds all products from TPE's current inventory
+
+		# results of the last run
+		self.singlePackProducts = []	# single-pack products ready to have prices updated
+		self.multiPackProducts = []		# multi-pack products ready to have prices updated
+		self.updatedProducts = [] 		# TPE products which are have their prices updated
+		self.missingProducts = [] 		# TPE products for which a match is not found
+		self.excludedProducts = [] 		# TPE products which are not to be modified due to type exclusion
+		self.stats = None				# RunStats of the run in progress, or None outside runPipeline()
+
+	@classmethod
+	def fromFiles(cls, inputDirectory='.', useCache=True, **choices):
+		""" Returns a new session with its catalogs loaded from inputDirectory (see loadFiles()). """
+		session = cls(**choices)
+		session.loadFiles(inputDirectory, useCache)
+		return session
+
+	@classmethod
+	def fromIterables(cls, tpeNames, tpeSkus, tpePrices, tpeWeights, tiscoProdNums, tiscoPrices,
+					  discountProdNums=(), discountPrices=(), supplierFeeds=(), **choices):
+		""" Returns a new session with its catalogs loaded from iterables of lines (see loadIterables()). """
+		session = cls(**choices)
+		session.loadIterables(tpeNames, tpeSkus, tpePrices, tpeWeights, tiscoProdNums, tiscoPrices,
+							  discountProdNums, discountPrices, supplierFeeds)
+		return session
+
+	def loadFiles(self, inputDirectory='.', useCache=True):
+		"""
+		Replaces the catalogs with the contents of the "IN - *.txt" files in inputDirectory, or of the SQLite input
+		database it names (see loadInputs()).
+		"""
+		loadInputs(self, inputDirectory, useCache)
+
+	def loadIterables(self, tpeNames, tpeSkus, tpePrices, tpeWeights, tiscoProdNums, tiscoPrices,
+					  discountProdNums=(), discountPrices=(), supplierFeeds=()):
+		"""
+		Replaces the catalogs with the given lines, one iterable per input file (open files or lists of strings), in
+		the same formats as the "IN - *.txt" files. Other suppliers' lines are given as a list of SupplierFeeds.
+		"""
+		loadCatalogs(self, tpeNames, tpeSkus, tpePrices, tpeWeights, tiscoProdNums, tiscoPrices, discountProdNums,
+					 discountPrices, supplierFeeds=supplierFeeds)
+
+	def setChoices(self, singlePacks=None, multiPacks=None, roundUpAmount=None, excludedCategories=None,
+				   matchMode=None, guardRails=None, minMatchConfidence=None):
+		""" Changes the pricing choices given; the others are kept. """
+		if matchMode is not None:
+			self.matchMode = matchMode
+		if minMatchConfidence is not None:
+			self.minMatchConfidence = minMatchConfidence
+		if guardRails is not None:
+			self.guardRails = guardRails
+		if singlePacks is not None:
+			self.singlePacks = singlePacks
+		if multiPacks is not None:
+			self.multiPacks = multiPacks
+		if roundUpAmount is not None:
+			self.roundUpAmount = roundUpAmount
+		if excludedCategories is not None:
+			self.excludedCategories = list(excludedCategories)
+
+	def setChoicesFromProfile(self, profile):
+		"""
+		Sets every pricing choice from a pricing profile (see loadProfile()); a ValueError is raised for a bad value.
+		"""
+		self.singlePacks, self.multiPacks, self.roundUpAmount = readProfileChoices(profile)
+		self.excludedCategories = list(profile.get('excludedCategories') or ExcludedCategories)
+		self.matchMode = readMatchMode(profile)
+		self.minMatchConfidence = readMinMatchConfidence(profile)
+		self.guardRails = readGuardRails(profile)
+
+	def reprice(self):
+		"""
+		Prices copies of every TPE product under the current choices, without writing any files, and returns the
+		updated products. The missing and excluded products are left in missingProducts and excludedProducts.
+		"""
+		repriceProducts(self, copyProducts(self.tpeProducts))
+		return self.updatedProducts
+
+	def run(self, outputDirectory='.', incremental=False, profileCpuTo=None, traceMemory=False, workers=1,
+			exportFormats=(), exportChanges=False):
+		""" Prices every TPE product and writes the "OUT - *" files, as the script does; returns the run summary. """
+		return runPipeline(self, outputDirectory, incremental, profileCpuTo=profileCpuTo, traceMemory=traceMemory,
+						   workers=workers, exportFormats=exportFormats, exportChanges=exportChanges)
+
+	def clearCatalogs(self):
+		""" Empties the catalogs, and the results that were worked out from them. """
+		for productList in (self.tiscoProducts, self.discountProducts, self.tpeProducts):
+			productList.clear()
+		self.tiscoCatalog = TiscoCatalog(self.tiscoProducts)
+		self.tiscoIndexPath = None
+		self.partNumberIndex = None
+		self.clearResults()
+
+	def clearResults(self):
+		""" Empties the product lists left over from the last run. """
+		for productList in (self.singlePackProducts, self.multiPackProducts, self.updatedProducts,
+							self.missingProducts, self.excludedProducts):
+			productList.clear()
+
+
+def openFileStreams(inputDirectory='.'):
+	"""
+	This function opens the eight input files and returns their streams as a list, in the order
+	Tisco product numbers, Tisco prices, discount product numbers, discount prices, TPE names, TPE skus, TPE prices,
+	and TPE weights. If one cannot be opened, the ones already opened are closed again.
+	Called by loadInputFiles().
+	"""
+	streams = []
+	try:
+		for fileName in TISCO_CACHE_SOURCES + TPE_INPUT_FILES:
+			streams.append(open(os.path.join(inputDirectory, fileName), 'r'))
+	except BaseException:
+		closeFileStreams(streams)
+		raise
+	return streams
+
+
+def closeFileStreams(streams):
+	""" This function closes all open file streams in the given list. Called by loadInputFiles() and openFileStreams().	"""
+	for stream in streams:
 		stream.close()
-	print('called closeFileStreams()')
+	streams.clear()
 
 
 def getUserInputs():
@@ -143,12 +586,10 @@ def getUserInputs():
 			or based on the current TPE price. The user may alternatively exclude the category from modification.
 	The user is asked by what factor prices should be changed, how much to add based on weight, and how to
 			"round up" the final price.
-	Finally, a summary of the user's choices is displayed to the console.
-	Called by "Main".
+	Finally, a summary of the user's choices is displayed to the console, and (singlePacks, multiPacks, roundUpAmount)
+	is returned.
+	Called by main().
 	"""
-	print('called getUserInputs()')
-
-	global singlePacks, multiPacks, roundUpAmount
 	singlePacks = UserInputs(False, 'nothing', 0.0, 0.0)
 	multiPacks = UserInputs(False, 'nothing', 0.0, 0.0)
 
@@ -165,7 +606,8 @@ def getUserInputs():
 		roundUpAmount = int(roundUpAmount)
 
 	# print out inputs to the user for confirmation
-	printUserChoices()
+	printUserChoices(singlePacks, multiPacks, roundUpAmount)
+	return singlePacks, multiPacks, roundUpAmount
 
 
 def getPreferences(multiplicity, userInputs):
@@ -173,8 +615,6 @@ def getPreferences(multiplicity, userInputs):
 	This function gets user input for either single-pack or multi-pack preferences, and will be called twice.
 	Called by getUserInputs()
 	"""
-	print('Called getPreferences()')
-
 	# ask the user whether they want a product category modified
 	userInputs.willModify = getModify(multiplicity)
 
@@ -190,8 +630,6 @@ def getModify(multiplicity):
 	This function asks the user whether they want a product category (single-pack or multi-pack) to be modified or ignored.
 	Called by getPreferences().
 	"""
-	print("Called getModify()")
-
 	updateOrNot = input('Do you want to modify ' + multiplicity + ' items? (yes/no) ')
 	updateOrNot = updateOrNot.lower()
 	while updateOrNot != 'yes' and updateOrNot != 'y' and updateOrNot != 'no' and updateOrNot != 'n':
@@ -210,8 +648,6 @@ def getBase():
 	This function asks the user on what they want the prices based (TPE or TISCO).
 	Called by getPreferences().
 	"""
-	print("Called getBase()")
-
 	priceBasedOn = input('Which prices do you want the new prices based on? (TPE/Tisco)')
 	priceBasedOn = priceBasedOn.upper()
 	while priceBasedOn != 'TPE' and priceBasedOn != 'TISCO':
@@ -226,8 +662,6 @@ def getPriceMultiplier():
 	This function asks the user by what factor they would like the base price modified.
 	Called by getPreferences().
 	"""
-	print("Called getPriceMultiplier()")
-
 	multiplier = input('By what factor would you like to multiply the base price? (ex. \'1.45\' adds a 45% increase) ')
 	multiplier = float(multiplier)
 	while not (0.49 < multiplier < 2.01):
@@ -242,8 +676,6 @@ def getWeightMultiplier():
 	This function asks the user by how much to increase the price per pound.
 	Called by getPreferences().
 	"""
-	print("Called getBasePreference()")
-
 	dollarsPerPound = input('How much should the price increase per pound? (ex. \'0.30\' adds a 30 cents per pound) ')
 	dollarsPerPound = float(dollarsPerPound)
 	while not (dollarsPerPound >= 0.0):
@@ -253,8 +685,8 @@ def getWeightMultiplier():
 	return dollarsPerPound
 
 
-def printUserChoices():
-	""" This function prints out the user's choices for confirmation and testing. Called by getUserInputs(). """
+def printUserChoices(singlePacks, multiPacks, roundUpAmount):
+	""" This function prints out the user's choices for confirmation and testing. Called by getUserInputs() and main(). """
 
 	print("\nSINGLE-PACK PREFERENCES")
 	print("Update desired: " + str(singlePacks.willModify))
@@ -271,355 +703,3003 @@ def printUserChoices():
 	print("\n\"Round-up\" amount: " + str(roundUpAmount) + " cents.\n")
 
 
-def getTpeProducts():
+def getTpeProducts(productList, names, skus, prices, weights):
 	"""
 	This function reads in TPE product names and extracts the part numbers, populating a list of Product objects with
-	both names and numbers. It then adds the sku, price, and weight for each item.
-	Called by "Main".
+	both names and numbers, skus, prices, and weights, in a single pass over the four TPE input files.
+	Called by loadCatalogs() and readFeed().
 	"""
-	print('called getTpeProducts()')
-
 	# get names, product numbers, skus, prices, and weights for each product
-	getComponent(TpeProducts, finTpeNames, 'name', '\n')
-	getComponent(TpeProducts, finTpeSkus, 'sku', '\n')
-	getComponent(TpeProducts, finTpePrices, 'price', ',')
-	getComponent(TpeProducts, finTpeWeights, 'weight', ',')
+	productList.extend(readTpeProducts(names, skus, prices, weights))
 
-	# sort the TpeProducts list by product name alphabetically
-	TpeProducts.sort(key=lambda product: product.name)
+	# sort the product list by product name alphabetically
+	productList.sort(key=lambda product: product.name)
 
 
-def getComponent(productList, finList, memberType, charToRemove):
+def readTpeProducts(names, skus, prices, weights):
 	"""
-	This function reads in a list containing a single member type and appends each to its Product object.
-	Called by getTpeProducts().
+	This function reads the four TPE input files together, line by line, and yields one Product per line.
+	It is a generator, so callers can process products as they are read instead of building the whole list first.
+	If the files do not have the same number of lines, a ValueError naming the short file(s) is raised as soon
+	as the first one runs out; a line that cannot be read raises a ValueError naming the file and the line number.
+	Called by getTpeProducts(), runStreamingStages(), and writeInputDatabase().
 	"""
+	columns = (('IN - TPE Names.txt', names), ('IN - TPE SKUs.txt', skus),
+			   ('IN - TPE Prices.txt', prices), ('IN - TPE Weights.txt', weights))
+	lineNumber = 0
+	for row in zip_longest(*[column for label, column in columns]):
+		lineNumber += 1
+		if None in row:
+			shortFiles = [label for (label, column), item in zip(columns, row) if item is None]
+			raise ValueError('TPE input files are misaligned: ' + ', '.join(shortFiles) + ' ended before line ' +
+							 str(lineNumber) + '.')
+		name, sku, price, weight = row
+		try:
+			product = makeTpeProduct(name, sku, price, weight)
+		except (ValueError, IndexError):
+			raise ValueError('TPE input files have a bad value on line ' + str(lineNumber) + ': ' +
+							 findBadTpeValue(columns, row) + '.') from None
+		yield product
+
+
+def findBadTpeValue(columns, row):
+	"""
+	This function describes what makeTpeProduct() could not read in one row of the TPE input files: a blank name, or
+	a price or weight that is not a number, with the file it came from.
+	Called by readTpeProducts().
+	"""
+	if not row[0].split():
+		return '"' + columns[0][0] + '" has a blank name'
+	for (label, column), item in zip(columns[2:], row[2:]):
+		try:
+			float(item.replace(',', '').lstrip())
+		except ValueError:
+			return '"' + label + '" has ' + repr(item.strip()) + ', which is not a number'
+	return 'the line could not be read'
 
-	i = 0
-	for item in finList:
-		item = item.replace(charToRemove, '')
-		item = item.lstrip()
-
-		# get names and product numbers
-		if memberType == 'name':
-			words = item.split()
-			prodNumIndex = len(words)
-			newProduct = Product("", item, words[prodNumIndex - 1], 0, 0, False, False, False)
-			productList.append(newProduct)
 
-		# get skus
-		elif memberType == 'sku':
-			productList[i].sku = item
+def makeTpeProduct(name, sku, price, weight):
+	"""
+	This function builds a Product from one line of each TPE input file.
+	The part number is the last word of the product name (see buildTpeProduct()).
+	Called by readTpeProducts().
+	"""
+	name = name.replace('\n', '').lstrip()
+	sku = sku.replace('\n', '').lstrip()
+	price = float(price.replace(',', '').lstrip())
+	weight = float(weight.replace(',', '').lstrip())
+	return buildTpeProduct(name, sku, price, weight)
 
-		# get prices
-		elif memberType == 'price':
-			item = float(item)
-			productList[i].price = item
 
-		# get weights
-		elif memberType == 'weight':
-			item = float(item)
-			productList[i].weight = item
-		i += 1
+def buildTpeProduct(name, sku, price, weight):
+	"""
+	This function builds a Product from a TPE product's cleaned-up name, sku, price, and weight.
+	Called by makeTpeProduct() and readDatabaseTpeProducts().
+	"""
+	words = name.split()
+	return Product(sku, name, intern(words[len(words) - 1]), price, weight, False, False, False, NameTemplate(name))
 
 
-def getTiscoProducts(productList, prodNums, prices):
+def getTiscoProducts(productList, prodNums, prices, supplier='Tisco'):
     """
 	This function takes in an empty list of Products and populates it with information from input files.
-	Called by "Main".
+	The lines are read by readTiscoProducts(), so part number and price files that do not line up raise a ValueError
+	rather than leaving products without a price.
+	Called by loadCatalogs().
 	"""
-    print('called getTiscoProducts()')
-
     # fill productList with ALL products
-    for item in prodNums:
-        item = item.replace('\n', '')
-        newProduct = Product("", "", item, 0, 0, False, False, False)
-        productList.append(newProduct)
+    productList.extend(readTiscoProducts(prodNums, prices, supplier))
 
-    i = 0
-    for item in prices:
-        item = item.replace(',', '')
-        item = item.lstrip()
-        item = float(item)
-        productList[i].price = item
-        i += 1
 
+def readTiscoProducts(prodNums, prices, supplier='Tisco'):
+	"""
+	This function reads a part number file and a price file from Tisco (or another supplier) together, line by line,
+	and yields one Product per line, without building a list.
+	If the files do not have the same number of lines, a ValueError is raised as soon as the first one runs out.
+	Called by getTiscoProducts(), runStreamingStages(), writeInputDatabase(), and readFeed().
+	"""
+	lineNumber = 0
+	for prodNum, price in zip_longest(prodNums, prices):
+		lineNumber += 1
+		if prodNum is None or price is None:
+			raise ValueError(supplier + ' input files are misaligned: the ' +
+							 ('part number' if prodNum is None else 'price') + ' file ended before line ' +
+							 str(lineNumber) + '.')
+		yield Product("", "", intern(prodNum.replace('\n', '')), float(price.replace(',', '').lstrip()), 0, False, False,
+					  False)
+
+
+class ProductClassifier:
+	"""
+	This class flags product names as multi-pack and/or excluded by keyword.
+	The exclusion keywords are compiled into a set once, so each name is classified in a single scan over its words
+	no matter how many keywords there are. Words are split on single spaces and compared case-insensitively.
+	"""
+	def __init__(self, excludedCategories, multiPackMarker='pack.'):
+		self.excludedWords = frozenset(category.lower() for category in excludedCategories)
+		self.multiPackMarker = multiPackMarker.lower()
 
-def applyTiscoDiscounts(productList):
+	def classify(self, name):
+		""" Returns (isMultiPack, isExcluded) for the given product name. """
+		words = set(name.lower().split(' '))
+		return self.multiPackMarker in words, not self.excludedWords.isdisjoint(words)
+
+
+def applyTiscoDiscounts(catalog, discountProducts):
     """
-	This function applies discounts to any matching products in the "full" Tisco list.
-	Called by "Main".
+	This function applies discounts to any matching products in the "full" Tisco list, by way of its TiscoCatalog.
+	Called by indexCatalogs().
 	"""
-    print('called applyTiscoDiscounts()')
+    catalog.applyDiscounts(discountProducts)
+
 
-    for discountProduct in DiscountProducts:
-        for product in productList:
-            if product.prodNum == discountProduct.prodNum:
-                product.price = discountProduct.price
+def normalizePartNumber(prodNum):
+	"""
+	This function returns the key under which a part number is stored in and looked up from a TiscoCatalog.
+	Only surrounding whitespace (including stray carriage returns) is removed, so matching remains exact.
+	Called by TiscoCatalog, TiscoIndex, and MappedTiscoIndex.
+	"""
+	return prodNum.strip()
 
 
-def categorizeAndExcludeProducts(productList):
+class PartNumberIndex:
 	"""
-	This function sorts all TPE products into a set of pre-defined categories.
-	Each product is flagged as either a single-pack or multi-pack item.
-	Products that need to be excluded are flagged as such as well.
-	After flagging is complete, flagged products are moved to one of three different lists for further processing.
-	Called by "Main".
+	This class finds supplier part numbers that differ from a TPE part number only in formatting, for the
+	approximate match modes of findSupplierMatch(). Every part number of a TiscoCatalog is reduced once to a
+	canonical key of upper-case letters and digits, without leading zeros, so that '000032', '32', and '32.' or
+	'NCA700-38' and 'nca70038' share a key. A key shared by two different part numbers is ambiguous and never
+	matched. A TPE sku that starts with a part number (e.g. 't.NCA700-38cmp221psn000101pwrldchg') is tried too.
+	For fuzzy matching, addNearKeys() also indexes every key with each one of its characters deleted, so that the
+	keys one insertion, deletion, or substitution away from a part number are found with a few dictionary lookups
+	instead of a scan over the catalog. Only a single such key is taken as a match.
+	The index holds part numbers rather than Products, so worker processes can look up their prices in a
+	MappedTiscoIndex.
+	"""
+	skuPattern = re.compile(r't?\.?(.+?)(?:t?cmp.*)?$')
+
+	def __init__(self, tiscoCatalog):
+		self.aliases = {}		# canonical key -> part number, or None if the key is ambiguous
+		for matches in tiscoCatalog.entries.values():
+			key = makeCanonicalPartNumber(matches[0].prodNum)
+			self.aliases[key] = None if key in self.aliases else matches[0].prodNum
+		self.nearKeys = None	# canonical key with one character deleted -> canonical keys, once addNearKeys() is called
+
+	def addNearKeys(self):
+		""" Indexes the one-character deletions of every key, for findMatch() with fuzzy set; does nothing twice. """
+		if self.nearKeys is not None:
+			return
+		self.nearKeys = {}
+		for key, prodNum in self.aliases.items():
+			if prodNum is not None and len(key) >= FUZZY_MIN_LENGTH - 1:
+				for variant in makeDeletions(key):
+					self.nearKeys.setdefault(variant, []).append(key)
+
+	def findMatch(self, prodNum, sku, fuzzy=False):
+		"""
+		Returns (matched part number, kind, confidence) for a TPE part number and sku with no exact supplier match,
+		or None. The kind is 'normalized' (confidence 0.95), 'sku' (0.85), or 'fuzzy' (at most 0.8, less for short
+		part numbers, where one character matters more). A part number of None is not trusted, so only the sku is
+		matched.
+		"""
+		key = makeCanonicalPartNumber(prodNum) if prodNum is not None else ''
+		if key and self.aliases.get(key) is not None:
+			return self.aliases[key], 'normalized', 0.95
+		skuKey = makeCanonicalPartNumber(self.skuPattern.match(sku).group(1)) if sku else ''
+		if skuKey and self.aliases.get(skuKey) is not None:
+			return self.aliases[skuKey], 'sku', 0.85
+		if not fuzzy or len(key) < FUZZY_MIN_LENGTH:
+			return None
+
+		# keys that lose a character to become this one, or that this one becomes by losing a character, or that
+		# share a deletion with it
+		candidates = set(self.nearKeys.get(key, ()))
+		for variant in makeDeletions(key):
+			if self.aliases.get(variant) is not None:
+				candidates.add(variant)
+			candidates.update(self.nearKeys.get(variant, ()))
+		candidates = [candidate for candidate in candidates if isOneEditApart(key, candidate)]
+		if len(candidates) != 1:
+			return None
+		return self.aliases[candidates[0]], 'fuzzy', round(0.8 * (1 - 1 / max(len(key), len(candidates[0]))), 2)
+
+
+def makeCanonicalPartNumber(prodNum):
+	"""
+	This function reduces a part number to the canonical key PartNumberIndex stores it under: its letters and digits,
+	upper-cased, without leading zeros.
+	Called by PartNumberIndex.
 	"""
-	print('called categorizeAndExcludeProducts()')
+	return ''.join([character for character in prodNum.upper() if character.isalnum()]).lstrip('0')
 
-	for product in productList:
-		product.isExcluded = False
-
-		# split each product name into words and search for keywords
-		prodName = product.name.split(' ')
-		for word in prodName:
-			word = word.lower()
-
-			# flag multi-pack items
-			if word == 'pack.':
-				product.isMultiPack = True
-
-			# flag items to be excluded
-			for category in ExcludedCategories:
-				if word == category:
-					product.isExcluded = True
-
-		# flag single-pack items
-		if not product.isMultiPack:
-			product.isSinglePack = True
-
-		# move all remaining items into one of three lists: SinglePackProducts, MultiPackProducts, or ExcludedProducts
-		if product.isExcluded:
-			ExcludedProducts.append(product)			# products excluded by category
-		elif product.isSinglePack and singlePacks.willModify:
-			SinglePackProducts.append(product)
-		elif product.isMultiPack and multiPacks.willModify:
-			MultiPackProducts.append(product)
-		else:
-			ExcludedProducts.append(product)			# products excluded by quantity
+
+def makeDeletions(key):
+	""" This function returns every string made by deleting one character of a key. Called by PartNumberIndex. """
+	return {key[:position] + key[position + 1:] for position in range(len(key))}
 
 
-def updatePrices(singlePackProducts, multiPackProducts):
+def isOneEditApart(first, second):
 	"""
-	This function updates the prices of all non-excluded TPE products.
+	This function returns whether two different strings differ by exactly one inserted, deleted, or substituted
+	character.
+	Called by PartNumberIndex.findMatch().
+	"""
+	if len(first) > len(second):
+		first, second = second, first
+	if len(second) - len(first) > 1:
+		return False
+	position = 0
+	while position < len(first) and first[position] == second[position]:
+		position += 1
+	if len(first) == len(second):
+		return first[position + 1:] == second[position + 1:]
+	return first[position:] == second[position + 1:]
+
+
+def repriceProducts(session, productList):
+	"""
+	This function categorizes and prices the given TPE products in place under the session's pricing choices, after
+	emptying the session's result lists, which it then fills.
+	Called by runStages(), runStreamingStages(), repriceShard(), and PricingSession.reprice().
+	"""
+	session.clearResults()
+
+	# sort TPE products into categories and exlude products that are not to be modified
+	categorizeAndExcludeProducts(session, productList)
+
+	# update prices
+	updatePrices(session)
+
+
+def copyProducts(productList):
+	"""
+	This function returns a copy of every Product in a list, so a run can modify products without touching the catalog
+	they were loaded into.
+	Called by runStages(), reloadFeeds(), and PricingSession.reprice().
+	"""
+	return [Product(product.sku, product.name, product.prodNum, product.price, product.weight, product.isMultiPack,
+					product.isExcluded, product.isSinglePack, product.nameTemplate) for product in productList]
+
+
+def categorizeAndExcludeProducts(session, productList):
+	"""
+	This function sorts all TPE products into a set of pre-defined categories.
+	Each product is flagged as either a single-pack or multi-pack item.
+	Products that need to be excluded are flagged as such as well.
+	Keywords are matched by a ProductClassifier compiled once per call from the session's excludedCategories.
+	After flagging is complete, flagged products are moved to one of three different lists of the session for further
+	processing.
+	Called by repriceProducts().
+	"""
+	with measureStage(session.stats, 'categorize', len(productList)) as stage:
+		singlePackProducts = session.singlePackProducts
+		multiPackProducts = session.multiPackProducts
+		excludedProducts = session.excludedProducts
+		singlePacks = session.singlePacks
+		multiPacks = session.multiPacks
+		queuedBefore = len(singlePackProducts) + len(multiPackProducts)
+		classifier = ProductClassifier(session.excludedCategories)
+
+		for product in productList:
+
+			# flag multi-pack items, items to be excluded, and single-pack items
+			product.isMultiPack, product.isExcluded = classifier.classify(product.name)
+			product.isSinglePack = not product.isMultiPack
+
+			# move all remaining items into one of three lists: singlePackProducts, multiPackProducts, or excludedProducts
+			if product.isExcluded:
+				excludedProducts.append(product)			# products excluded by category
+			elif product.isSinglePack and singlePacks.willModify:
+				singlePackProducts.append(product)
+			elif product.isMultiPack and multiPacks.willModify:
+				multiPackProducts.append(product)
+			else:
+				excludedProducts.append(product)			# products excluded by quantity
+
+		stage.rowsOut = len(singlePackProducts) + len(multiPackProducts) - queuedBefore
+
+
+def updatePrices(session):
+	"""
+	This function updates the prices of all non-excluded TPE products of the session.
 	Single-pack items are addressed first and then multi-pack items second, if neither category has been excluded.
 	Then all updated products are merged back into a single list and final touches are made.
-	Called by "Main".
-	"""
-	print('called updatePrices()')
-
-	# update single-pack products and append to UpdatedProducts list
-	if singlePacks.willModify:
-		if singlePacks.priceBasedOn == 'TISCO':
-			findMatchingProducts(singlePackProducts)
-		for product in singlePackProducts:
-			product.price *= singlePacks.baseMultiplier
-			product.price += product.weight * singlePacks.weightMultiplier
-			UpdatedProducts.append(product)
-
-	# update multi-pack products and append to UpdatedProducts list
-	if multiPacks.willModify:
-		if multiPacks.priceBasedOn == 'TISCO':
-			findMatchingProducts(multiPackProducts)
-		for product in multiPackProducts:
-			product.price *= multiPacks.baseMultiplier
-			product.price += product.weight * multiPacks.weightMultiplier
-			UpdatedProducts.append(product)
+	Called by repriceProducts().
+	"""
+	updatedProducts = session.updatedProducts
+	baseMultipliers = []	# per-product base multiplier, parallel to updatedProducts
+	weightMultipliers = []	# per-product price increase per pound, parallel to updatedProducts
+
+	# queue single-pack and then multi-pack products in the updatedProducts list
+	for userInputs, productList in ((session.singlePacks, session.singlePackProducts),
+									(session.multiPacks, session.multiPackProducts)):
+		if userInputs.willModify:
+			if userInputs.priceBasedOn == 'TISCO':
+				findMatchingProducts(session, productList)
+			updatedProducts.extend(productList)
+			baseMultipliers.extend([userInputs.baseMultiplier] * len(productList))
+			weightMultipliers.extend([userInputs.weightMultiplier] * len(productList))
+
+	with measureStage(session.stats, 'price', len(updatedProducts)):
+		# update single- and multi-pack prices together in one pass over the price and weight columns
+		newPrices = calculatePrices(
+			makePriceColumn([product.price for product in updatedProducts]),
+			makePriceColumn([product.weight for product in updatedProducts]),
+			makePriceColumn(baseMultipliers),
+			makePriceColumn(weightMultipliers))
 
 	# "polish up" final prices and modify product names to reflect the updated prices
-	polishUpPrices(UpdatedProducts)
+	polishUpPrices(session, updatedProducts, newPrices)
 
 
-def findMatchingProducts(tpeProducts):
+def findMatchingProducts(session, tpeProducts):
 	"""
 	This function finds products (based on part number) that are found in both the TPE and Tisco lists.
 	Any matching products have the TPE price change to match Tisco's price
-	Any products without matches are added to a different list: MissingProducts
+	Any products without matches are added to a different list of the session: missingProducts
+	Unless the session's match mode is 'exact', products without an exact match are matched approximately where
+	possible (see findSupplierMatch()), and the match is recorded in the product. Approximate matches less certain
+	than the session's minMatchConfidence are held for review: the product goes to missingProducts with its match.
 	Called by updatePrices().
 	"""
-	print('called findMatchingProducts()')
+	with measureStage(session.stats, 'match', len(tpeProducts)) as stage:
+		tiscoCatalog = session.tiscoCatalog
+		approximate = session.matchMode != 'exact'
+		matchedProducts = []
+		for tpeItem in tpeProducts:
+			tiscoItem = tiscoCatalog.findProduct(tpeItem.prodNum)
+			if tiscoItem is None and approximate:
+				tiscoItem, tpeItem.match = findSupplierMatch(session, tpeItem)
+
+			# if a match is found, update the TPE price to the Tisco price
+			if tiscoItem is not None:
+				tpeItem.price = tiscoItem.price
+				matchedProducts.append(tpeItem)
 
-	for tpeItem in tpeProducts:
-		tpeNum = tpeItem.prodNum
-		matchFound = False
+			# if a match is not found, move the TPE product to missingProducts
+			else:
+				session.missingProducts.append(tpeItem)
 
-		# if a match is found, update the TPE price to the Tisco price
-		for tiscoItem in TiscoProducts:
-			if tiscoItem.prodNum == tpeNum:
-				tpeItem.price = tiscoItem.price
-				matchFound = True
-				break
+		if approximate:
+			countEvent(session.stats, 'heldMatches', len([product for product in tpeProducts if product.match is not None
+														  and product.match[2] < session.minMatchConfidence]))
 
-		# if a match is not found, copy the TPE product to MissingProducts
-		if not matchFound:
-			MissingProducts.append(tpeItem)
-			tpeProducts.remove(tpeItem)
+		# keep only the matched products in the caller's list
+		tpeProducts[:] = matchedProducts
+		stage.rowsOut = len(matchedProducts)
+		countEvent(session.stats, 'matched', len(matchedProducts))
+		countEvent(session.stats, 'missing', stage.rowsIn - len(matchedProducts))
+		if approximate:
+			countEvent(session.stats, 'approximateMatches', len([product for product in matchedProducts
+																  if product.match is not None]))
 
 
-def polishUpPrices(productList):
+def findSupplierMatch(session, product):
+	"""
+	This function finds the supplier product matching a TPE product under the session's match mode, and returns it
+	with a description of the match: (None, None) if there is none, (product, None) for an exact match, and
+	(product, (matched part number, kind, confidence)) for an approximate one. The 'exact' mode only matches equal
+	part numbers; 'normalized' also matches part numbers that differ only in formatting, or a sku that starts with a
+	supplier part number; 'fuzzy' also matches a part number one character away from a single supplier part number
+	(see PartNumberIndex).
+	The part number taken from a name is only matched approximately if the name labels it ("Part number X"): the last
+	word of an unlabeled name, such as a kit's list of contents, is often a component rather than the product.
+	A match less certain than the session's minMatchConfidence is held for review, and returned as (None, match).
+	Called by findMatchingProducts(), hashProductInputs(), validatePrices(), and makeScenarioBases().
+	"""
+	tiscoItem = session.tiscoCatalog.findProduct(product.prodNum)
+	if tiscoItem is not None or session.matchMode == 'exact':
+		return tiscoItem, None
+	match = findApproximateMatch(session, product)
+	if match is None:
+		return None, None
+	if match[2] < session.minMatchConfidence:
+		return None, match
+	return session.tiscoCatalog.findProduct(match[0]), match
+
+
+def findApproximateMatch(session, product):
+	"""
+	This function looks up a TPE product without an exact match in the session's PartNumberIndex, and returns its
+	approximate match as (matched part number, kind, confidence), or None. In a worker process the lookups have
+	already been made by the parent (see repriceInParallel()), and the match is taken from session.knownMatches.
+	Called by findSupplierMatch() and repriceInParallel().
+	"""
+	if session.knownMatches is not None:
+		return session.knownMatches.get(id(product))
+	labeled = NameTemplate.forProduct(product).partNumberStart >= 0
+	return getPartNumberIndex(session).findMatch(product.prodNum if labeled else None, product.sku,
+												 session.matchMode == 'fuzzy')
+
+
+def getPartNumberIndex(session):
+	"""
+	This function returns the session's PartNumberIndex, building it over the session's tiscoCatalog the first time.
+	Called by findApproximateMatch().
+	"""
+	if session.partNumberIndex is None:
+		session.partNumberIndex = PartNumberIndex(session.tiscoCatalog)
+	if session.matchMode == 'fuzzy':
+		session.partNumberIndex.addNearKeys()
+	return session.partNumberIndex
+
+
+def polishUpPrices(session, productList, prices=None):
 	"""
 	This function adds the final touches to prices after the primary modifications have been made.
 	Prices ending in "0" (10, 20, 200, etc) will cost $1 less.
 	Everything is "rounded up" a number of cents set by the user.
-	Product names are changed to reflect new prices.
+	Product names are changed to reflect new prices, by splicing each new price into the name's NameTemplate.
+	The price arithmetic is done column-wise by polishPriceColumn(); prices may be passed in as an already-built
+	column, otherwise they are read from the products.
 	Called by updatePrices().
 	"""
-	print('called polishUpPrices()')
+	with measureStage(session.stats, 'polish', len(productList)):
+		if prices is None:
+			prices = makePriceColumn([product.price for product in productList])
+		finalPrices = polishPriceColumn(prices, session.roundUpAmount)
 
-	for product in productList:
+		for product, finalPrice in zip(productList, finalPrices):
+			product.price = finalPrice
 
-		# remove the extra cents
-		product.price = math.floor(product.price)
+			# modify product name to include new price
+			product.name = NameTemplate.forProduct(product).render(str(finalPrice))
 
-		# for prices ending in multiples of 10, add $1 to avoid "10.99" issue
-		testPrice = str(product.price)
-		if testPrice[len(testPrice) - 1] == '0':
-			product.price += 1
 
-		# "round up" to 99 cents
-		product.price = int(product.price)
-		product.price = str(product.price) + "." + str(roundUpAmount)
+def makePriceColumn(values):
+	"""
+	This function packs a sequence of floats into a column for calculatePrices() and polishPriceColumn().
+	A float64 NumPy array is used when NumPy is installed, otherwise an array('d') from the standard library.
+	Called by updatePrices(), polishUpPrices(), validatePrices(), and compareScenarios().
+	"""
+	if numpy is not None:
+		return numpy.fromiter(values, dtype=numpy.float64, count=len(values))
+	return array('d', values)
 
-		# for prices specifically just near $100, set them to exactly $100.00
-		if 98 < float(product.price) < 104:
-			product.price = '100.00'
 
-		# modify product name to include new price
-		i = 0
-		words = product.name.split()
-		newPrice = str(product.price)
-		for word in words:
-			if word[0] == '$':
-				words[i] = '$' + newPrice + '.'
-			i+=1
-		product.name = " ".join(words)
+def calculatePrices(prices, weights, baseMultipliers, weightMultipliers):
+	"""
+	This function multiplies each base price by its multiplier and adds its weight surcharge, for whole columns at once.
+	The operations are done in the same order as the old per-product loop (price * base, then + weight * per-pound),
+	so results are identical to the last bit.
+	Called by updatePrices(), validatePrices(), and compareScenarios().
+	"""
+	if numpy is not None:
+		return prices * baseMultipliers + weights * weightMultipliers
+	return array('d', [price * baseMultiplier + weight * weightMultiplier for price, weight, baseMultiplier, weightMultiplier
+						in zip(prices, weights, baseMultipliers, weightMultipliers)])
+
+
+def polishPriceColumn(prices, roundUpAmount):
+	"""
+	This function applies the "round up" rules to a whole column of prices and returns the final price strings:
+	the cents are dropped, whole-dollar amounts ending in "0" go up by $1, the "round up" cents are appended,
+	and anything between $98 and $104 becomes "100.00".
+	A price of N dollars and R cents falls strictly inside ($98, $104) exactly when 98 < N <= 103, or N == 98 and R > 0.
+	Called by polishUpPrices() and compareScenarios().
+	"""
+	centsSuffix = '.' + str(roundUpAmount)
+	lowestSnapped = 98 if float('98' + centsSuffix) > 98 else 99
+
+	if numpy is not None:
+		wholeDollars = numpy.floor(prices).astype(numpy.int64)
+		wholeDollars += (wholeDollars % 10 == 0)
+		snapToHundred = (wholeDollars >= lowestSnapped) & (wholeDollars <= 103)
+		return ['100.00' if snap else str(dollars) + centsSuffix
+				for dollars, snap in zip(wholeDollars.tolist(), snapToHundred.tolist())]
+
+	finalPrices = []
+	for price in prices:
+		dollars = math.floor(price)
+		if dollars % 10 == 0:
+			dollars += 1
+		if lowestSnapped <= dollars <= 103:
+			finalPrices.append('100.00')
+		else:
+			finalPrices.append(str(dollars) + centsSuffix)
+	return finalPrices
+
+
+def validatePrices(session, productList, originals):
+	"""
+	This function checks the new prices of repriced products against their old prices and the session's guard rails,
+	and returns a review row for every product that looks wrong, with the reasons it was flagged:
+		- 'increase >N%' / 'decrease >N%' and 'change >$N': the change is beyond the percentage or dollar limit,
+		- 'decrease': the new price is lower than the old one, by less than the percentage limit,
+		- 'below cost': the new price is lower than the (discounted) supplier price,
+		- 'snapped to 100': the $98-$104 rule brought the price down to 100.00 from a higher calculated price, and
+		- 'format': the price does not have two-digit cents (a "round up" amount under 10 gives '.5' for '.05').
+	The numeric checks are done column-wise, like calculatePrices(). originals maps each product's id to its old
+	(name, price).
+	Called by runStages() and runStreamingStages().
+	"""
+	with measureStage(session.stats, 'validate', len(productList)) as stage:
+		guardRails = session.guardRails
+		costs = []
+		bases = []
+		for product in productList:
+			supplierItem = findSupplierMatch(session, product)[0]
+			costs.append(math.nan if supplierItem is None else supplierItem.price)
+			userInputs = session.multiPacks if product.isMultiPack else session.singlePacks
+			bases.append(costs[-1] if userInputs.priceBasedOn == 'TISCO' else originals[id(product)][1])
+		flags = findPriceAnomalies(
+			makePriceColumn([originals[id(product)][1] for product in productList]),
+			makePriceColumn([float(product.price) for product in productList]),
+			makePriceColumn(costs),
+			calculatePrices(
+				makePriceColumn(bases),
+				makePriceColumn([product.weight for product in productList]),
+				makePriceColumn([(session.multiPacks if product.isMultiPack else session.singlePacks).baseMultiplier
+								 for product in productList]),
+				makePriceColumn([(session.multiPacks if product.isMultiPack else session.singlePacks).weightMultiplier
+								 for product in productList])),
+			guardRails)
+		labels = ('increase >' + format(guardRails.maxChangePercent, 'g') + '%',
+				  'decrease >' + format(guardRails.maxChangePercent, 'g') + '%',
+				  'change >$' + format(guardRails.maxChangeAmount, 'g'), 'decrease', 'below cost', 'snapped to 100')
+
+		reviewRows = []
+		for product, cost, productFlags in zip(productList, costs, zip(*flags)):
+			reasons = [label for label, flagged in zip(labels, productFlags) if flagged]
+			price = str(product.price).lstrip()
+			if not PRICE_FORMAT.match(price):
+				reasons.append('format')
+			if reasons:
+				oldPrice = originals[id(product)][1]
+				change = float(price) - oldPrice
+				reviewRows.append((product.sku, format(oldPrice, '.2f'), price,
+								   format(change, '+.2f') + (' (' + format(change / oldPrice, '+.1%') + ')'
+															 if oldPrice else ''),
+								   '-' if math.isnan(cost) else format(cost, '.2f'), ', '.join(reasons), product.name))
+		stage.rowsOut = len(reviewRows)
+		countEvent(session.stats, 'flaggedForReview', len(reviewRows))
+	return reviewRows
+
+
+def findPriceAnomalies(oldPrices, newPrices, costs, calculatedPrices, guardRails):
+	"""
+	This function runs the numeric guard-rail checks over whole columns of prices at once, and returns one list of
+	flags per check, in the order: increase beyond the percentage limit, decrease beyond it, change beyond the dollar
+	limit, any smaller decrease, below cost, and snapped down to 100.00. Unknown costs are NaN, which are never flagged.
+	Called by validatePrices().
+	"""
+	percent = guardRails.maxChangePercent / 100.0
+	amount = guardRails.maxChangeAmount
+	if numpy is not None:
+		changes = newPrices - oldPrices
+		largeDecreases = -changes > oldPrices * percent
+		with numpy.errstate(invalid='ignore'):
+			masks = [changes > oldPrices * percent, largeDecreases, numpy.abs(changes) > amount,
+					 (changes < 0) & ~largeDecreases, newPrices < costs, (newPrices == 100.0) & (calculatedPrices > 100.0)]
+		return [mask.tolist() for mask in masks]
+	changes = [newPrice - oldPrice for newPrice, oldPrice in zip(newPrices, oldPrices)]
+	return [[change > oldPrice * percent for change, oldPrice in zip(changes, oldPrices)],
+			[-change > oldPrice * percent for change, oldPrice in zip(changes, oldPrices)],
+			[abs(change) > amount for change in changes],
+			[0 > change >= -oldPrice * percent for change, oldPrice in zip(changes, oldPrices)],
+			[newPrice < cost for newPrice, cost in zip(newPrices, costs)],
+			[newPrice == 100.0 and calculated > 100.0 for newPrice, calculated in zip(newPrices, calculatedPrices)]]
+
+
+def checkGuardRails(guardRails, flaggedCount, repricedCount, reviewJob):
+	"""
+	This function stops a run whose share of flagged prices is over the guard rails' limit, by raising a GuardRailError
+	after writing the review report alone (reviewJob is its renderOutputFiles() job), so it can be looked over while
+	the last run's output files are left as they were.
+	Called by runStages() and runStreamingStages().
+	"""
+	if guardRails.maxFlaggedShare is None or not repricedCount:
+		return
+	share = flaggedCount / repricedCount
+	if share > guardRails.maxFlaggedShare:
+		publishOutputFiles(renderOutputFiles([reviewJob]))
+		raise GuardRailError(str(flaggedCount) + ' of ' + str(repricedCount) + ' new prices (' + format(share, '.1%') +
+							 ') were flagged, more than the limit of ' + format(guardRails.maxFlaggedShare, '.1%') +
+							 '; nothing else was written. See "' + os.path.basename(reviewJob[0]) + '".')
+
+
+def writePriceReview(reviewRows, outfile):
+	"""
+	This function prints out a formatted list of the new prices flagged by validatePrices(), with the reasons for each.
+	Rows are written to the file in large chunks.
+	Called by runStages().
+	"""
+	if not reviewRows:
+		outfile.write('List is empty!\n\n\n')
+	rowFormat = makeReportFormat([findColumnWidth(label, [row[column] for row in reviewRows])
+								  for column, label in enumerate(REVIEW_LABELS[:-1])])
+	outfile.write(rowFormat.format(*REVIEW_LABELS))
+	for start in range(0, len(reviewRows), REPORT_CHUNK_SIZE):
+		outfile.write(''.join([rowFormat.format(*row) for row in reviewRows[start:start + REPORT_CHUNK_SIZE]]))
 
 
 def printAllInfo(productList, outfile):
 	"""
 	This function prints out a formatted list containing all members of a Product list.
-	Called by "Main".
+	Column widths are worked out from this list alone, and rows are written to the file in large chunks.
+	Called by runStages().
 	"""
-	print('called printAllInfo()')
+	if not productList:
+		outfile.write('List is empty!\n\n\n')
+
+	# find the width of each column in this product list
+	rowFormat = makeReportFormat([
+		findColumnWidth(REPORT_LABELS[0], [product.prodNum for product in productList]),
+		findColumnWidth(REPORT_LABELS[1], [product.sku for product in productList]),
+		findColumnWidth(REPORT_LABELS[2], [str(product.price).lstrip() + '\n' for product in productList]),
+		findColumnWidth(REPORT_LABELS[3], [str(product.weight).lstrip() + '\n' for product in productList])])
+
+	# write labels
+	outfile.write(rowFormat.format(*REPORT_LABELS))
 
+	# write each product's information, a chunk of rows at a time
+	for start in range(0, len(productList), REPORT_CHUNK_SIZE):
+		outfile.write(''.join([rowFormat.format(product.prodNum, product.sku, str(product.price), str(product.weight),
+												product.name)
+							   for product in productList[start:start + REPORT_CHUNK_SIZE]]))
+
+
+def printMatchReport(productList, outfile, minMatchConfidence=0.0):
+	"""
+	This function prints out a formatted list of products that were matched to a supplier product approximately,
+	with the supplier part number each was matched to and the kind and confidence of the match. Matches less certain
+	than minMatchConfidence were held for review rather than priced, and are marked as such.
+	Called by runStages().
+	"""
 	if not productList:
 		outfile.write('List is empty!\n\n\n')
+	confidences = [format(product.match[2], '.2f') + ' ' + product.match[1] +
+				   (' (held, not priced)' if product.match[2] < minMatchConfidence else '') for product in productList]
 
-	# split products into their member components
-	for product in productList:
-		prodNumList.append(product.prodNum)
-		skuList.append(product.sku)
-		priceList.append(str(product.price).lstrip() + '\n')
-		weightList.append(str(product.weight).lstrip() + '\n')
+	# find the width of each column in this product list
+	rowFormat = makeReportFormat([
+		findColumnWidth(MATCH_REPORT_LABELS[0], [product.prodNum for product in productList]),
+		findColumnWidth(MATCH_REPORT_LABELS[1], [product.sku for product in productList]),
+		findColumnWidth(MATCH_REPORT_LABELS[2], [product.match[0] for product in productList]),
+		findColumnWidth(MATCH_REPORT_LABELS[3], confidences)])
 
-	# find maximum length for each member in the overall product list
-	prodNumLength = findMaxLength(prodNumList)
-	skuLength = findMaxLength(skuList)
-	priceLength = findMaxLength(priceList)
-	weightLength = findMaxLength(weightList)
+	# write labels, then each product's match
+	outfile.write(rowFormat.format(*MATCH_REPORT_LABELS))
+	outfile.write(''.join([rowFormat.format(product.prodNum, product.sku, product.match[0], confidence, product.name)
+						   for product, confidence in zip(productList, confidences)]))
 
-	# write labels
-	prodNumLength = writeLabel(outfile, 'PRODUCT NUMBER     ', prodNumLength)
-	skuLength = writeLabel(outfile, 'SKU     ', skuLength)
-	priceLength = writeLabel(outfile, 'PRICE     ', priceLength)
-	weightLength = writeLabel(outfile, 'WEIGHT     ', weightLength)
-	outfile.write('NAME\n')
 
-	# write each product's information
-	for product in productList:
-		writeProductInfo(outfile, product.prodNum, prodNumLength)
-		writeProductInfo(outfile, product.sku, skuLength)
-		writeProductInfo(outfile, str(product.price), priceLength)
-		writeProductInfo(outfile, str(product.weight), weightLength)
-		outfile.write(product.name + '\n')
+def makeReportFormat(widths):
+	"""
+	This function returns the format string for one row of a product report, given the widths of every column but the
+	last (four, in most reports), which is left unpadded.
+	Called by printAllInfo(), printMatchReport(), writePriceReview(), writeSpooledReview(), and writeSpooledReport().
+	"""
+	return (''.join(['{' + str(column) + ':<' + str(width) + '}' for column, width in enumerate(widths)]) +
+			'{' + str(len(widths)) + '}\n')
 
 
-def findMaxLength(itemList):
+def findColumnWidth(label, items):
 	"""
-	This function reads in a list and finds the maximum number of characters of any element in the list.
-	Called by printAllInfo().
+	This function finds the width of a report column: the longest item plus 5 spaces, but never less than the label.
+	Called by printAllInfo(), printMatchReport(), writePriceReview(), and formatScenarioTable().
 	"""
 	maxLength = 0
-	for item in itemList:
+	for item in items:
 		if len(item) > maxLength:
 			maxLength = len(item)
-	return maxLength + 5
+	return max(maxLength + 5, len(label))
 
 
-def writeLabel(outfile, label, maxLength):
+def generateUploadFiles(productList, outputDirectory='.', prefix='OUT - '):
 	"""
-	This function writes a column header and blank spaces after it based on the longest item in the column.
-	Called by printAllInfo().
+	This function writes product names, prices, and skus to three separate text files for copy/pasting into Excel.
+	The files are rendered concurrently and returned as pending files for publishOutputFiles().
+	The prefix sets the start of the file names ("OUT - Delta " for incremental runs).
+	Called by runStages() and writeRollbackFiles().
 	"""
-	outfile.write(label)
-	if maxLength > len(label):
-		for i in range(0, maxLength - len(label)):
-			outfile.write(' ')
-	else:
-		maxLength = len(label)
-	return maxLength
+	return renderOutputFiles([
+		(os.path.join(outputDirectory, prefix + 'Names.txt'), writeUploadFile, productList, lambda product: product.name),
+		(os.path.join(outputDirectory, prefix + 'Skus.txt'), writeUploadFile, productList, lambda product: product.sku),
+		(os.path.join(outputDirectory, prefix + 'Prices.txt'), writeUploadFile, productList, lambda product: str(product.price).lstrip())])
 
 
-def writeProductInfo(outfile, member, maxLength):
+def writeUploadFile(productList, outfile, getMember):
 	"""
-	This function writes all information about a single product to an output file.
-	Called by printAllInfo().
+	This function writes one member of every product, one per line, to an upload file.
+	Called by generateUploadFiles().
 	"""
-	outfile.write(str(member))
-	for i in range(0, maxLength - len(member)):
-		outfile.write(" ")
+	for start in range(0, len(productList), REPORT_CHUNK_SIZE):
+		outfile.write(''.join([getMember(product) + '\n' for product in productList[start:start + REPORT_CHUNK_SIZE]]))
 
 
-def generateUploadFiles(productList):
+def makeExportJobs(source, readRows, outputDirectory, exportFormats, baseName):
 	"""
-	This function writes product names, prices, and skus to three separate text files for copy/pasting into Excel.
-	Called by "Main".
+	This function returns the renderOutputFiles() jobs that write a ShopSite upload file named baseName in each of the
+	given formats ('csv' or 'xlsx'). The rows are read from source with readRows(), as (name, sku, price) tuples.
+	Called by runStages() and runStreamingStages().
+	"""
+	writers = {'csv': writeCsvExport, 'xlsx': writeXlsxExport}
+	return [(os.path.join(outputDirectory, baseName + '.' + exportFormat), writers[exportFormat], source, readRows)
+			for exportFormat in exportFormats]
+
+
+def readExportRows(productList):
+	"""
+	This function yields the ShopSite upload row of every product in a list.
+	Called by writeCsvExport() and writeXlsxExport().
 	"""
-	print('called generateUploadFiles()')
 	for product in productList:
-		foutNames.write(product.name + '\n')
-		foutSkus.write(product.sku + '\n')
-		foutPrices.write(str(product.price).lstrip() + '\n')
+		yield product.name, product.sku, str(product.price).lstrip()
 
 
-##############################
-#           "MAIN"           #
-##############################
+def writeCsvExport(source, outfile, readRows):
+	"""
+	This function writes one ShopSite upload file as CSV: a header of SHOPSITE_COLUMNS, then one row per product,
+	streamed straight from the source.
+	Called by makeExportJobs().
+	"""
+	writer = csv.writer(outfile, lineterminator='\n')
+	writer.writerow(SHOPSITE_COLUMNS)
+	writer.writerows(readRows(source))
 
-# ask user which types of products they want to modify and how
-getUserInputs()
 
-# open all file streams
-openFileStreams()
+def writeXlsxExport(source, outfile, readRows):
+	"""
+	This function writes one ShopSite upload file as an Excel workbook with a single sheet laid out like the CSV file.
+	The workbook is written in openpyxl's write-only mode, so memory use does not grow with the number of rows.
+	Called by makeExportJobs().
+	"""
+	workbook = openpyxl.Workbook(write_only=True)
+	sheet = workbook.create_sheet('Products')
+	sheet.append(SHOPSITE_COLUMNS)
+	for row in readRows(source):
+		sheet.append(row)
+	# the workbook is a binary zip file, so it goes to the file underneath the text stream
+	workbook.save(outfile.buffer)
 
-# read in info from text files
-getTiscoProducts(TiscoProducts, finTiscoProdNums, finTiscoPrices)
-getTiscoProducts(DiscountProducts, finDiscountProdNums, finDiscountPrices)
-getTpeProducts()
 
-# apply discounts to items in TiscoProducts
-applyTiscoDiscounts(TiscoProducts)
+def findChangedProducts(productList, originals):
+	"""
+	This function returns the products of a list whose price or name differs from the original one recorded in
+	originals, a dictionary of id(product) -> (name, price) taken before the products were repriced.
+	Called by runStages() and runStreamingStages().
+	"""
+	changedProducts = []
+	for product in productList:
+		name, price = originals[id(product)]
+		if product.name != name or float(product.price) != price:
+			changedProducts.append(product)
+	return changedProducts
 
-# generate full product lists before making modifications, for comparison
-printAllInfo(TpeProducts, foutOriginalProducts)
-printAllInfo(TiscoProducts, foutTiscoProducts)
 
-# sort TPE products into categories and exlude products that are not to be modified
-categorizeAndExcludeProducts(TpeProducts)
+def renderOutputFiles(jobs):
+	"""
+	This function renders several output files at once on a pool of threads.
+	Each job is (file name, writer function, product list, *extra arguments); the writer is called as
+	writer(productList, outfile, *extra) on a temporary file in the same directory as the final file.
+	Nothing is moved into place here: a dictionary of temporary file -> final file is returned for
+	publishOutputFiles(). If any job fails, every temporary file from this call is removed and the error is re-raised.
+	Called by runStages(), runStreamingStages(), generateUploadFiles(), checkGuardRails(), and
+	compareScenarios().
+	"""
+	pendingFiles = {}
+	with ThreadPoolExecutor(max_workers=max(1, min(OUTPUT_THREADS, len(jobs)))) as pool:
+		futures = []
+		for fileName, writer, productList, *extra in jobs:
+			futures.append(pool.submit(renderOutputFile, fileName, writer, productList, extra))
+		errors = []
+		for future in futures:
+			try:
+				tempName, fileName = future.result()
+				pendingFiles[tempName] = fileName
+			except Exception as error:
+				errors.append(error)
+
+	if errors:
+		discardOutputFiles(pendingFiles)
+		raise errors[0]
+	return pendingFiles
+
+
+def renderOutputFile(fileName, writer, productList, extra):
+	"""
+	This function runs one output job against a new temporary file and returns (temporary file, final file).
+	The temporary file is removed if the writer fails.
+	Called by renderOutputFiles().
+	"""
+	outfile, tempName = openTempFile(fileName, 'w')
+	try:
+		with outfile:
+			writer(productList, outfile, *extra)
+	except BaseException:
+		os.remove(tempName)
+		raise
+	return tempName, fileName
 
-# update prices
-updatePrices(SinglePackProducts, MultiPackProducts)
 
-# print final output into files for uploading to ShopSite
-generateUploadFiles(UpdatedProducts)
+def openTempFile(fileName, mode):
+	"""
+	This function creates a new, uniquely named hidden file next to fileName, to be renamed over it once complete.
+	Unlike tempfile.mkstemp(), the file gets the usual permissions for new files. Returns (open file, temporary name).
+	Called by renderOutputFile(), saveTiscoCache(), and writeInputDatabase().
+	"""
+	directory, baseName = os.path.split(os.path.abspath(fileName))
+	while True:
+		tempName = os.path.join(directory, '.' + baseName + '.' + secrets.token_hex(4) + '.tmp')
+		try:
+			return open(tempName, mode.replace('w', 'x')), tempName
+		except FileExistsError:
+			continue
+
+
+def publishOutputFiles(pendingFiles):
+	"""
+	This function atomically renames rendered temporary files over their final "OUT - *.txt" names.
+	Called by runStages(), runStreamingStages(), checkGuardRails(), compareScenarios(), and
+	writeRollbackFiles().
+	"""
+	for tempName, fileName in pendingFiles.items():
+		os.replace(tempName, fileName)
+	pendingFiles.clear()
+
 
-# print formatted lists of products
-printAllInfo(UpdatedProducts, foutUpdatedProducts)
-printAllInfo(MissingProducts, foutMissingProds)
-printAllInfo(ExcludedProducts, foutExcludedProds)
+def discardOutputFiles(pendingFiles):
+	"""
+	This function removes rendered temporary files that will not be published, leaving the old output untouched.
+	Called by runStages(), runStreamingStages(), and renderOutputFiles().
+	"""
+	for tempName in pendingFiles:
+		if os.path.exists(tempName):
+			os.remove(tempName)
+	pendingFiles.clear()
+
+
+def runPipeline(session, outputDirectory='.', incremental=False, inputDirectory=None, useCache=True, profileCpuTo=None,
+				traceMemory=False, streaming=False, spillDirectory=None, workers=1, exportFormats=(), exportChanges=False):
+	"""
+	This function runs the whole repricing job once under the session's pricing choices and writes every output file.
+	If inputDirectory is given, the session's catalogs are (re)loaded from it (or from the SQLite input database it
+	names, see loadInputs()) first, as part of the run; otherwise the catalogs already loaded are used. The catalogs
+	are not modified, so it can be called repeatedly on one session.
+	Every run saves a snapshot of its inputs and results, and adds its prices to the price history (see PriceHistory).
+	In incremental mode, only products whose inputs changed since
+	that snapshot (or all of them, if the pricing choices changed) are categorized and repriced, and only the rows whose
+	new price or name differs from the last run go to the "OUT - Delta *.txt" upload files. The Updated, Missing, and
+	Excluded reports then cover just the repriced products.
+	In streaming mode (see runStreamingStages()) the products are instead read from inputDirectory (or the current
+	directory) and processed a chunk at a time, leaving the session's catalogs alone; it cannot be incremental, and
+	reads only Tisco's price list, matching part numbers exactly.
+	Unless the match mode is 'exact', approximate matches are listed in "OUT - Approximate Matches.txt", including the
+	ones held for review (see findSupplierMatch()), which are left out of the upload files.
+	Each stage is measured by a RunStats, whose summary is printed, written to "OUT - Run Summary.json", and returned.
+	If profileCpuTo is set the run is also profiled with cProfile, and if traceMemory is set tracemalloc is
+	switched on so that each stage reports its peak Python memory.
+	With more than one worker, products are repriced on a pool of that many processes (see repriceInParallel()).
+	For each of exportFormats ('csv' or 'xlsx') the upload rows are also written to one ShopSite upload file,
+	"OUT - ShopSite Upload" (or "OUT - Delta ShopSite Upload" in incremental mode), and, if exportChanges is set, the
+	rows whose price or name differs from the original product list to "OUT - ShopSite Changes".
+	Called by main(), watchInputs(), and PricingSession.run().
+	"""
+	if 'xlsx' in exportFormats and openpyxl is None:
+		raise ValueError('XLSX exports need the openpyxl package.')
+	session.stats = RunStats()
+	profiler = None
+	if traceMemory:
+		tracemalloc.start()
+	if profileCpuTo:
+		profiler = cProfile.Profile()
+		profiler.enable()
+	try:
+		if streaming:
+			if incremental:
+				raise ValueError('Streaming runs cannot be incremental.')
+			if len(getSupplierOrder(session)) > 1 or session.matchMode != 'exact':
+				raise ValueError('Streaming runs read only the Tisco price list, and match part numbers exactly.')
+			summary = runStreamingStages(session, inputDirectory or '.', outputDirectory, spillDirectory, workers,
+										 exportFormats, exportChanges)
+		else:
+			if inputDirectory is not None:
+				loadInputs(session, inputDirectory, useCache)
+			summary = runStages(session, outputDirectory, incremental, workers, exportFormats, exportChanges)
+	finally:
+		if profiler is not None:
+			profiler.disable()
+			profiler.dump_stats(profileCpuTo)
+		if traceMemory:
+			tracemalloc.stop()
+		session.stats = None
+	printRunSummary(summary)
+	return summary
+
+
+def runStages(session, outputDirectory, incremental, workers=1, exportFormats=(), exportChanges=False):
+	"""
+	This function runs the stages of one repricing job in order and returns the run summary.
+	New prices are checked against the session's guard rails (see validatePrices()) before any output file is written;
+	the flagged ones are listed in "OUT - Price Review.txt", and the run is stopped if there are too many of them.
+	The prices of the run are added to the price history (see PriceHistory) only if every output file is written.
+	Called by runPipeline().
+	"""
+	stats = session.stats
+	pendingFiles = {}	# rendered temporary output files waiting to be moved into place
+
+	# the run works on copies of the TPE products, so the session's catalog can be priced again
+	tpeProducts = copyProducts(session.tpeProducts)
+
+	with measureStage(stats, 'snapshot', len(tpeProducts)):
+		productKeys = {id(product): makeSnapshotKey(product) for product in tpeProducts}
+		inputHashes = {id(product): hashProductInputs(product, session) for product in tpeProducts}
+		settingsHash = hashPricingChoices(session)
+	snapshotPath = os.path.join(outputDirectory, 'OUT - Last Run Snapshot.json')
+	history = None
+
+	try:
+		# generate full product lists before making modifications, for comparison
+		with measureStage(stats, 'write', len(tpeProducts) + len(session.tiscoProducts)):
+			pendingFiles.update(renderOutputFiles([
+				(os.path.join(outputDirectory, 'OUT - Original Product List.txt'), printAllInfo, session.tpeProducts),
+				(os.path.join(outputDirectory, 'OUT - Tisco Product List.txt'), printAllInfo, session.tiscoProducts)]))
+
+		# in incremental mode, only work on products whose inputs changed since the last run; if the pricing choices
+		# changed, every product is repriced, but the delta still only holds the rows that differ from the last run
+		lastRun = loadSnapshot(snapshotPath) if incremental else None
+		lastProducts = lastRun['products'] if lastRun is not None else {}
+		if lastRun is not None and lastRun['settings'] == settingsHash:
+			productsToPrice = [product for product in tpeProducts
+							   if lastProducts.get(productKeys[id(product)], [None])[0] != inputHashes[id(product)]]
+			countEvent(stats, 'changedSinceLastRun', len(productsToPrice))
+		else:
+			productsToPrice = tpeProducts
+
+		# categorize the products and update their prices
+		originals = {id(product): (product.name, product.price) for product in productsToPrice}
+		if workers > 1:
+			with openWorkerPool(session, workers) as pool:
+				repriceInParallel(session, productsToPrice, pool, workers)
+		else:
+			repriceProducts(session, productsToPrice)
+		updatedProducts = session.updatedProducts
+
+		# check the new prices against the guard rails, and stop here if too many of them look wrong
+		reviewRows = validatePrices(session, updatedProducts, originals)
+		reviewJob = (os.path.join(outputDirectory, 'OUT - Price Review.txt'), writePriceReview, reviewRows)
+		checkGuardRails(session.guardRails, len(reviewRows), len(updatedProducts), reviewJob)
+
+		with measureStage(stats, 'write', len(updatedProducts) + len(session.missingProducts) +
+						  len(session.excludedProducts)):
+			# print final output into files for uploading to ShopSite
+			if incremental:
+				changedProducts = [product for product in updatedProducts
+								   if lastProducts.get(productKeys[id(product)], [None, None, None])[1:] !=
+								   [product.price, product.name]]
+				countEvent(stats, 'deltaRows', len(changedProducts))
+				pendingFiles.update(generateUploadFiles(changedProducts, outputDirectory, 'OUT - Delta '))
+				exportJobs = makeExportJobs(changedProducts, readExportRows, outputDirectory, exportFormats,
+											'OUT - Delta ShopSite Upload')
+			else:
+				pendingFiles.update(generateUploadFiles(updatedProducts, outputDirectory))
+				exportJobs = makeExportJobs(updatedProducts, readExportRows, outputDirectory, exportFormats,
+											'OUT - ShopSite Upload')
+
+			# write the same rows to ShopSite upload files, and the rows that differ from the original product list
+			if exportChanges:
+				exportJobs += makeExportJobs(findChangedProducts(updatedProducts, originals), readExportRows,
+											 outputDirectory, exportFormats, 'OUT - ShopSite Changes')
+			if exportJobs:
+				pendingFiles.update(renderOutputFiles(exportJobs))
+
+			# print formatted lists of products
+			pendingFiles.update(renderOutputFiles([
+				reviewJob,
+				(os.path.join(outputDirectory, 'OUT - Updated Product List.txt'), printAllInfo, updatedProducts),
+				(os.path.join(outputDirectory, 'OUT - Missing Products.txt'), printAllInfo, session.missingProducts),
+				(os.path.join(outputDirectory, 'OUT - Excluded Products.txt'), printAllInfo, session.excludedProducts)]))
+			if session.matchMode != 'exact':
+				pendingFiles.update(renderOutputFiles([
+					(os.path.join(outputDirectory, 'OUT - Approximate Matches.txt'), printMatchReport,
+					 [product for product in updatedProducts + session.missingProducts if product.match is not None],
+					 session.minMatchConfidence)]))
+
+			# save this run's inputs and results for the next incremental run
+			snapshot = makeSnapshot(settingsHash, tpeProducts, productKeys, inputHashes, lastProducts, productsToPrice,
+									updatedProducts)
+			pendingFiles.update(renderOutputFiles([(snapshotPath, writeSnapshot, snapshot)]))
+
+		# add this run's prices to the price history, to be committed once the output files are in place
+		with measureStage(stats, 'history', len(updatedProducts)):
+			history = PriceHistory(os.path.join(outputDirectory, PRICE_HISTORY_NAME), session,
+								   'incremental' if incremental else 'full')
+			history.addPrices(session, updatedProducts, originals)
+
+		# save the measurements of this run
+		for counter, productList in (('tpeProducts', session.tpeProducts), ('tiscoProducts', session.tiscoProducts),
+									 ('discountProducts', session.discountProducts), ('updated', updatedProducts),
+									 ('excluded', session.excludedProducts)):
+			stats.counters[counter] = len(productList)
+		summary = stats.makeSummary()
+		pendingFiles.update(renderOutputFiles([(os.path.join(outputDirectory, 'OUT - Run Summary.json'),
+												writeRunSummary, summary)]))
+
+		# move every output file into place only once all of them have been written
+		publishOutputFiles(pendingFiles)
+		history.commit()
+	finally:
+		discardOutputFiles(pendingFiles)
+		if history is not None:
+			history.close()
+	return summary
+
+
+@contextmanager
+def openWorkerPool(session, workers, tiscoIndex=None):
+	"""
+	This function starts a pool of worker processes for repriceInParallel() and shuts it down at the end of its "with"
+	block. Each worker gets a copy of the session's pricing choices, but no copy of the Tisco index: workers open the
+	on-disk TiscoIndex given (for streaming runs), or else map the hash table in the session's Tisco cache into memory,
+	so that every process shares one copy of it. Without a current cache the table is written to a temporary file.
+	Workers get no PartNumberIndex either: approximate matches are looked up by the parent (see repriceInParallel()).
+	Called by runStages() and runStreamingStages().
+	"""
+	choices = {'singlePacks': session.singlePacks, 'multiPacks': session.multiPacks,
+			   'roundUpAmount': session.roundUpAmount, 'excludedCategories': session.excludedCategories,
+			   'matchMode': session.matchMode, 'minMatchConfidence': session.minMatchConfidence}
+	with tempfile.TemporaryDirectory(prefix='tpe-workers-') as scratch:
+		if tiscoIndex is not None:
+			indexKind, indexPath = 'sqlite', tiscoIndex.path
+		elif session.tiscoIndexPath is not None:
+			indexKind, indexPath = 'mapped', session.tiscoIndexPath
+		else:
+			indexKind, indexPath = 'mapped', os.path.join(scratch, TISCO_CACHE_NAME)
+			with open(indexPath, 'wb') as indexFile:
+				writeTiscoCache(indexFile, [], session.tiscoCatalog)
+		with ProcessPoolExecutor(max_workers=workers, initializer=startWorker,
+								 initargs=(choices, indexKind, indexPath)) as pool:
+			yield pool
+
+
+def startWorker(choices, indexKind, indexPath):
+	"""
+	This function sets up the PricingSession of a new worker process, with the given pricing choices and the shared
+	Tisco index.
+	Called in each worker process started by openWorkerPool().
+	"""
+	global workerSession
+	workerSession = PricingSession(**choices)
+	if indexKind == 'sqlite':
+		workerSession.tiscoCatalog = TiscoIndex(indexPath, readOnly=True)
+	else:
+		workerSession.tiscoCatalog = MappedTiscoIndex(indexPath)
+
+
+def repriceInParallel(session, productList, pool, workers):
+	"""
+	This function categorizes and prices TPE products in place, like repriceProducts(), on a pool of worker processes.
+	The list is cut into shards (about four per worker, but at least MIN_SHARD_SIZE products each), which are repriced
+	concurrently and merged back in order, so the session ends up with the same results as after a serial run.
+	Unless the match mode is 'exact', the approximate matches of the products without an exact one are looked up here,
+	before sharding, and sent along with their shards, so that no worker needs a copy of the PartNumberIndex.
+	Called by runStages() and runStreamingStages().
+	"""
+	session.clearResults()
+	with measureStage(session.stats, 'parallel', len(productList)):
+		shardSize = max(MIN_SHARD_SIZE, math.ceil(len(productList) / (workers * 4)))
+		shards = [productList[start:start + shardSize] for start in range(0, len(productList), shardSize)]
+		knownMatches = [[] for shard in shards]		# per shard, (position, approximate match) pairs
+		if session.matchMode != 'exact':
+			for shard, shardMatches in zip(shards, knownMatches):
+				for position, product in enumerate(shard):
+					if session.tiscoCatalog.findProduct(product.prodNum) is None:
+						match = findApproximateMatch(session, product)
+						if match is not None:
+							shardMatches.append((position, match))
+		results = pool.map(repriceShard, [[(product.name, product.prodNum, product.price, product.weight)
+										   for product in shard] for shard in shards], knownMatches)
+
+		# merge the shards back in order; single-pack products come before multi-pack ones, as in updatePrices()
+		updated = {False: [], True: []}		# isMultiPack -> updated products
+		missing = {False: [], True: []}		# isMultiPack -> products without a Tisco match
+		for shard, result in zip(shards, results):
+			for product, flags in zip(shard, result['flags']):
+				product.isMultiPack = bool(flags & 1)
+				product.isExcluded = bool(flags & 2)
+				product.isSinglePack = not product.isMultiPack
+			for position, price, name in result['updated']:
+				product = shard[position]
+				product.price = price
+				product.name = name
+				updated[product.isMultiPack].append(product)
+			for position, match in result['matches']:
+				shard[position].match = match
+			for position in result['missing']:
+				missing[shard[position].isMultiPack].append(shard[position])
+			session.excludedProducts.extend([shard[position] for position in result['excluded']])
+			if session.stats is not None:
+				session.stats.addStages(result['stages'], result['counters'])
+
+	session.singlePackProducts.extend(updated[False])
+	session.multiPackProducts.extend(updated[True])
+	session.updatedProducts.extend(updated[False] + updated[True])
+	session.missingProducts.extend(missing[False] + missing[True])
+
+
+def repriceShard(rows, knownMatches=()):
+	"""
+	This function reprices one shard of TPE products, given as (name, part number, price, weight) rows, in a worker
+	process, with the (shard position, approximate match) pairs the parent found for the shard. It returns what
+	repriceInParallel() needs to merge the shard back: the multi-pack (1) and excluded (2) flags of every product, the
+	shard position, new price, and new name of each updated product, the position and match of each approximately
+	matched one, the positions of the missing and excluded products, and the worker's measurements.
+	Called in a worker process by repriceInParallel().
+	"""
+	session = workerSession
+	products = [Product("", name, prodNum, price, weight, False, False, False) for name, prodNum, price, weight in rows]
+	positions = {id(product): position for position, product in enumerate(products)}
+	session.knownMatches = {id(products[position]): match for position, match in knownMatches}
+	session.stats = RunStats()
+	try:
+		session.tiscoCatalog.prefetch([product.prodNum for product in products])
+		repriceProducts(session, products)
+		return {'flags': bytes([product.isMultiPack | product.isExcluded << 1 for product in products]),
+				'updated': [(positions[id(product)], product.price, product.name) for product in session.updatedProducts],
+				'matches': [(positions[id(product)], product.match)
+							for product in session.updatedProducts + session.missingProducts if product.match is not None],
+				'missing': [positions[id(product)] for product in session.missingProducts],
+				'excluded': [positions[id(product)] for product in session.excludedProducts],
+				'stages': session.stats.stages, 'counters': session.stats.counters}
+	finally:
+		session.clearResults()
+		session.knownMatches = None
+		session.stats = None
+
+
+def runStreamingStages(session, inputDirectory, outputDirectory, spillDirectory=None, workers=1, exportFormats=(),
+					   exportChanges=False):
+	"""
+	This function runs one repricing job in streaming mode, for catalogs too large to hold in memory, and returns the
+	run summary. No catalog is held in memory as a whole, so memory use stays bounded however many products there are:
+		- the discounted Tisco list is indexed on disk by a TiscoIndex,
+		- the TPE products are sorted by name with an external merge sort over runs spilled to disk,
+		- the sorted products flow through categorize -> match -> price -> polish a chunk at a time, using the same
+		  stage functions as a normal run, and
+		- each report's rows are spooled to disk, in order, until the whole report can be written.
+	The inputs are read from the "IN - *.txt" files in inputDirectory, or from an SQLite input database if
+	inputDirectory names a file (see loadInputs()).
+	Spilled files go to a temporary directory inside spillDirectory (or the system's temporary directory).
+	With more than one worker, each chunk is repriced on a pool of worker processes that share the on-disk index.
+	ShopSite upload files are exported as in a normal run (see runPipeline()), from the spooled rows.
+	The output files are the same as a normal run's, but no snapshot is saved, and the last one is removed, since it
+	no longer matches the upload files. Each chunk's prices are added to the price history as it is repriced, in one
+	transaction that is committed with the output files. New prices are checked chunk by chunk as in a normal run, and
+	the run is stopped before any output file is written if too many of them were flagged; flagged rows are spooled to
+	disk like the other reports.
+	Called by runPipeline().
+	"""
+	stats = session.stats
+	pendingFiles = {}	# rendered temporary output files waiting to be moved into place
+	tiscoCatalog = session.tiscoCatalog
+	inputPaths = [os.path.join(inputDirectory, fileName) for fileName in TISCO_CACHE_SOURCES + TPE_INPUT_FILES]
+	database = openInputDatabase(inputDirectory) if os.path.isfile(inputDirectory) else None
+	counters = {'tpeProducts': 0, 'tiscoProducts': 0, 'discountProducts': 0, 'updated': 0, 'excluded': 0}
+
+	history = PriceHistory(os.path.join(outputDirectory, PRICE_HISTORY_NAME), session, 'streaming')
+
+	with tempfile.TemporaryDirectory(prefix='tpe-stream-', dir=spillDirectory) as spillPath:
+		session.tiscoCatalog = tiscoIndex = TiscoIndex(os.path.join(spillPath, 'tisco.sqlite3'))
+		reports = {name: ReportSpool(os.path.join(spillPath, name + '.txt'))
+				   for name in ('original', 'tisco', 'singlesUpdated', 'multisUpdated', 'singlesMissing',
+								'multisMissing', 'excluded', 'singlesChanged', 'multisChanged')}
+		reports.update({name: ReviewSpool(os.path.join(spillPath, name + '.txt'))
+						for name in ('singlesReview', 'multisReview')})
+		try:
+			# index the discounted Tisco list on disk, then spool the Tisco report with the discounts applied
+			with measureStage(stats, 'discount') as stage:
+				if database is not None:
+					tiscoIndex.addProducts(readDatabaseSupplierProducts(database, 'supplierProducts', 'Tisco'))
+					tiscoIndex.addDiscounts(readDatabaseSupplierProducts(database, 'supplierDiscounts', 'Tisco'))
+				else:
+					with open(inputPaths[0]) as prodNums, open(inputPaths[1]) as prices:
+						tiscoIndex.addProducts(readTiscoProducts(prodNums, prices))
+					with open(inputPaths[2]) as prodNums, open(inputPaths[3]) as prices:
+						tiscoIndex.addDiscounts(readTiscoProducts(prodNums, prices, 'Tisco discount'))
+				for block in makeChunks(tiscoIndex.readProducts(), REPORT_CHUNK_SIZE):
+					reports['tisco'].add(block)
+				counters['tiscoProducts'] = tiscoIndex.productCount
+				counters['discountProducts'] = tiscoIndex.discountCount
+				stage.rowsIn = stage.rowsOut = counters['tiscoProducts'] + counters['discountProducts']
+
+			# sort the TPE products by name into runs on disk
+			if database is not None:
+				runs = spillSortedRuns(readDatabaseTpeProducts(database), spillPath, stats)
+			else:
+				with open(inputPaths[4]) as names, open(inputPaths[5]) as skus, open(inputPaths[6]) as prices, \
+						open(inputPaths[7]) as weights:
+					runs = spillSortedRuns(readTpeProducts(names, skus, prices, weights), spillPath, stats)
+
+			# merge the runs and reprice the sorted products a chunk at a time
+			with openWorkerPool(session, workers, tiscoIndex) if workers > 1 else nullcontext() as pool:
+				for chunk in makeChunks(mergeSortedRuns(runs, spillPath), STREAM_CHUNK_SIZE):
+					reports['original'].add(chunk)
+					originals = {id(product): (product.name, product.price) for product in chunk}
+					# the chunk's part numbers are looked up here for validatePrices() too, even when workers reprice it
+					tiscoIndex.prefetch([product.prodNum for product in chunk])
+					if pool is not None:
+						repriceInParallel(session, chunk, pool, workers)
+					else:
+						repriceProducts(session, chunk)
+					for isMultiPack, prefix in ((False, 'singles'), (True, 'multis')):
+						updatedProducts = [product for product in session.updatedProducts
+										   if product.isMultiPack == isMultiPack]
+						reports[prefix + 'Review'].add(validatePrices(session, updatedProducts, originals))
+						reports[prefix + 'Updated'].add(updatedProducts)
+						reports[prefix + 'Missing'].add([product for product in session.missingProducts
+														 if product.isMultiPack == isMultiPack])
+						if exportChanges:
+							reports[prefix + 'Changed'].add(findChangedProducts(updatedProducts, originals))
+					reports['excluded'].add(session.excludedProducts)
+					with measureStage(stats, 'history', len(session.updatedProducts)):
+						history.addPrices(session, session.updatedProducts, originals)
+					counters['tpeProducts'] += len(chunk)
+					counters['updated'] += len(session.updatedProducts)
+					counters['excluded'] += len(session.excludedProducts)
+			session.clearResults()
+			for report in reports.values():
+				report.close()
+			review = [reports['singlesReview'], reports['multisReview']]
+			reviewJob = (os.path.join(outputDirectory, 'OUT - Price Review.txt'), writeSpooledReview, review)
+			checkGuardRails(session.guardRails, review[0].count + review[1].count, counters['updated'], reviewJob)
+
+			# write every output file from the spooled rows; single-pack products come before multi-pack ones
+			updated = [reports['singlesUpdated'], reports['multisUpdated']]
+			missing = [reports['singlesMissing'], reports['multisMissing']]
+			with measureStage(stats, 'write', sum([report.count for report in reports.values()])):
+				pendingFiles.update(renderOutputFiles([
+					(os.path.join(outputDirectory, 'OUT - Original Product List.txt'), writeSpooledReport,
+					 [reports['original']]),
+					(os.path.join(outputDirectory, 'OUT - Tisco Product List.txt'), writeSpooledReport,
+					 [reports['tisco']]),
+					(os.path.join(outputDirectory, 'OUT - Names.txt'), writeSpooledUploadFile, updated,
+					 lambda row: row[4]),
+					(os.path.join(outputDirectory, 'OUT - Skus.txt'), writeSpooledUploadFile, updated,
+					 lambda row: row[1]),
+					(os.path.join(outputDirectory, 'OUT - Prices.txt'), writeSpooledUploadFile, updated,
+					 lambda row: row[2].lstrip()),
+					(os.path.join(outputDirectory, 'OUT - Updated Product List.txt'), writeSpooledReport, updated),
+					(os.path.join(outputDirectory, 'OUT - Missing Products.txt'), writeSpooledReport, missing),
+					(os.path.join(outputDirectory, 'OUT - Excluded Products.txt'), writeSpooledReport,
+					 [reports['excluded']]),
+					reviewJob]))
+				exportJobs = makeExportJobs(updated, readSpooledExportRows, outputDirectory, exportFormats,
+											'OUT - ShopSite Upload')
+				if exportChanges:
+					exportJobs += makeExportJobs([reports['singlesChanged'], reports['multisChanged']],
+												 readSpooledExportRows, outputDirectory, exportFormats,
+												 'OUT - ShopSite Changes')
+				if exportJobs:
+					pendingFiles.update(renderOutputFiles(exportJobs))
+
+			# save the measurements of this run
+			stats.counters.update(counters)
+			summary = stats.makeSummary()
+			pendingFiles.update(renderOutputFiles([(os.path.join(outputDirectory, 'OUT - Run Summary.json'),
+													writeRunSummary, summary)]))
+
+			# move every output file into place only once all of them have been written
+			publishOutputFiles(pendingFiles)
+			history.commit()
+			snapshotPath = os.path.join(outputDirectory, 'OUT - Last Run Snapshot.json')
+			if os.path.exists(snapshotPath):
+				os.remove(snapshotPath)
+		finally:
+			discardOutputFiles(pendingFiles)
+			history.close()
+			for report in reports.values():
+				report.close()
+			tiscoIndex.close()
+			if database is not None:
+				database.close()
+			session.tiscoCatalog = tiscoCatalog
+	return summary
+
+
+def makeChunks(iterable, size):
+	"""
+	This function yields lists of up to size items from an iterable, in order.
+	Called by the streaming stages.
+	"""
+	iterator = iter(iterable)
+	while True:
+		chunk = list(islice(iterator, size))
+		if not chunk:
+			return
+		yield chunk
+
+
+def spillSortedRuns(products, spillPath, stats=None):
+	"""
+	This function sorts products by name STREAM_CHUNK_SIZE at a time and spills each sorted chunk to a run file in
+	spillPath, returning the run file names in input order. This is the first half of an external merge sort.
+	Called by runStreamingStages().
+	"""
+	runs = []
+	with measureStage(stats, 'load') as stage:
+		for chunk in makeChunks(products, STREAM_CHUNK_SIZE):
+			chunk.sort(key=lambda product: product.name)
+			runs.append(spillRun(chunk, os.path.join(spillPath, 'run' + str(len(runs)) + '.pickle')))
+			stage.rowsIn += len(chunk)
+		stage.rowsOut = stage.rowsIn
+	return runs
+
+
+def mergeSortedRuns(runs, spillPath):
+	"""
+	This function merges run files written by spillSortedRuns() and yields their products in name order.
+	At most MERGE_FAN_IN runs are read at once; while there are more, the earliest ones are merged into a new run
+	first. Merging prefers earlier runs when names are equal, so the result is in the same order as a stable in-memory
+	sort (as in getTpeProducts()). This is the second half of an external merge sort.
+	Called by runStreamingStages().
+	"""
+	runs = list(runs)
+	while len(runs) > MERGE_FAN_IN:
+		merged = heapq.merge(*[readRun(run) for run in runs[:MERGE_FAN_IN]], key=lambda product: product.name)
+		runs = [spillRun(merged, os.path.join(spillPath, 'merged' + str(len(runs)) + '.pickle'))] + runs[MERGE_FAN_IN:]
+	yield from heapq.merge(*[readRun(run) for run in runs], key=lambda product: product.name)
+
+
+def spillRun(products, path):
+	"""
+	This function writes products to a run file, a block of REPORT_CHUNK_SIZE at a time, and returns its name.
+	Called by spillSortedRuns() and mergeSortedRuns().
+	"""
+	with open(path, 'wb') as runFile:
+		for block in makeChunks(products, REPORT_CHUNK_SIZE):
+			pickle.dump([(product.sku, product.name, product.prodNum, product.price, product.weight) for product in block],
+						runFile, pickle.HIGHEST_PROTOCOL)
+	return path
+
+
+def readRun(path):
+	"""
+	This function yields the products stored in a run file, in order, holding only one block in memory at a time.
+	Called by mergeSortedRuns().
+	"""
+	with open(path, 'rb') as runFile:
+		while True:
+			try:
+				block = pickle.load(runFile)
+			except EOFError:
+				return
+			for sku, name, prodNum, price, weight in block:
+				yield Product(sku, name, intern(prodNum), price, weight, False, False, False)
+
+
+class TiscoIndex:
+	"""
+	This class indexes Tisco products by normalized part number in an SQLite database on disk, for streaming runs whose
+	catalogs do not fit in memory. findProduct() answers like a TiscoCatalog's: the first product with a part number
+	is found, at the last discount price given for that number (if any).
+	Lookups for a whole chunk of products can be fetched in one query with prefetch() beforehand. Once built, the index
+	can be opened read-only by worker processes.
+	"""
+	def __init__(self, path, readOnly=False):
+		self.path = path
+		if readOnly:
+			# worker processes read the index through a shared memory map of the database file
+			self.connection = sqlite3.connect('file:' + pathname2url(os.path.abspath(path)) + '?mode=ro', uri=True)
+			self.connection.execute('PRAGMA mmap_size = ' + str(1 << 40))
+		else:
+			self.connection = sqlite3.connect(path)
+			self.connection.executescript("""
+				PRAGMA journal_mode = OFF;
+				PRAGMA synchronous = OFF;
+				CREATE TABLE rows (line INTEGER PRIMARY KEY, prodNum TEXT, key TEXT, price REAL);
+				CREATE TABLE products (key TEXT PRIMARY KEY, price REAL) WITHOUT ROWID;
+				CREATE TABLE discounts (key TEXT PRIMARY KEY, price REAL) WITHOUT ROWID;""")
+		self.connection.execute('CREATE TEMPORARY TABLE wanted (key TEXT PRIMARY KEY) WITHOUT ROWID')
+		self.productCount = 0		# Tisco lines read
+		self.discountCount = 0		# discount lines read, including repeated part numbers
+		self.prefetched = {}		# normalized part number -> (discounted) price or None, for the prefetched chunk
+
+	def addProducts(self, productList):
+		""" Indexes Tisco products, in order; where a part number repeats, the first product is the one found. """
+		self.connection.executemany('INSERT INTO rows VALUES (?, ?, ?, ?)',
+									((line, product.prodNum, normalizePartNumber(product.prodNum), product.price)
+									 for line, product in enumerate(productList)))
+		self.connection.execute('INSERT OR IGNORE INTO products SELECT key, price FROM rows ORDER BY line')
+		self.connection.commit()
+		self.productCount = self.connection.execute('SELECT count(*) FROM rows').fetchone()[0]
+
+	def addDiscounts(self, discountProducts):
+		""" Indexes discount prices, in order; where a part number repeats, the last discount wins. """
+		def countDiscounts():
+			for product in discountProducts:
+				self.discountCount += 1
+				yield normalizePartNumber(product.prodNum), product.price
+		self.connection.executemany('INSERT OR REPLACE INTO discounts VALUES (?, ?)', countDiscounts())
+		self.connection.commit()
+
+	def readProducts(self):
+		""" Yields every indexed Tisco product in file order, with discounts applied to it. """
+		for prodNum, price in self.connection.execute('SELECT rows.prodNum, coalesce(discounts.price, rows.price) FROM rows '
+													  'LEFT JOIN discounts USING (key) ORDER BY rows.line'):
+			yield Product("", "", prodNum, price, 0, False, False, False)
+
+	def prefetch(self, prodNums):
+		""" Looks up a batch of part numbers at once; until the next prefetch(), findProduct() answers them from memory. """
+		keys = {normalizePartNumber(prodNum) for prodNum in prodNums}
+		self.connection.execute('DELETE FROM wanted')
+		self.connection.executemany('INSERT INTO wanted VALUES (?)', ((key,) for key in keys))
+		self.prefetched = dict.fromkeys(keys)
+		self.prefetched.update(self.connection.execute(
+			'SELECT wanted.key, coalesce(discounts.price, products.price) FROM wanted JOIN products USING (key) '
+			'LEFT JOIN discounts USING (key)'))
+
+	def findProduct(self, prodNum):
+		""" Returns a Product with the (discounted) price of the given part number, or None if there is no such product. """
+		key = normalizePartNumber(prodNum)
+		if key in self.prefetched:
+			price = self.prefetched[key]
+		else:
+			row = self.connection.execute('SELECT coalesce(discounts.price, products.price) FROM products '
+										  'LEFT JOIN discounts USING (key) WHERE key = ?', (key,)).fetchone()
+			price = None if row is None else row[0]
+		if price is None:
+			return None
+		return Product("", "", prodNum, price, 0, False, False, False)
+
+	def close(self):
+		""" Closes the database. """
+		self.connection.close()
+
+
+class ReportSpool:
+	"""
+	This class spools the rows of a product report to a file on disk, in order, while keeping track of the longest value
+	in each column, so the report can later be written exactly as printAllInfo() would write it without holding the
+	products in memory.
+	"""
+	def __init__(self, path):
+		self.path = path
+		self.file = open(path, 'w', encoding='utf-8', newline='\n')
+		self.count = 0
+		self.lengths = [0, 0, 0, 0]		# longest part number, sku, price, and weight, as measured by printAllInfo()
+
+	def add(self, productList):
+		""" Adds the rows of a list of products to the end of the report, in order. """
+		if not productList:
+			return
+		rows = [(product.prodNum, product.sku, str(product.price), str(product.weight), product.name)
+				for product in productList]
+		prodNums, skus, prices, weights, names = zip(*rows)
+		self.lengths = [max(self.lengths[0], max(map(len, prodNums))), max(self.lengths[1], max(map(len, skus))),
+						max(self.lengths[2], max([len(price.lstrip()) for price in prices]) + 1),
+						max(self.lengths[3], max([len(weight.lstrip()) for weight in weights]) + 1)]
+		self.file.write(''.join(['\x1f'.join(row) + '\n' for row in rows]))
+		self.count += len(rows)
+
+	def close(self):
+		""" Finishes writing the spooled rows. """
+		self.file.close()
+
+	def readRows(self):
+		""" Yields the spooled rows in order, each as a list of part number, sku, price, weight, and name. """
+		with open(self.path, encoding='utf-8', newline='\n') as spoolFile:
+			for line in spoolFile:
+				yield line[:-1].split('\x1f')
+
+
+class ReviewSpool(ReportSpool):
+	"""
+	This class spools the rows of the price review report (see validatePrices()) to a file on disk, in order, while
+	keeping track of the longest value in each column, so the report can be written exactly as writePriceReview()
+	would write it without holding the flagged rows in memory.
+	"""
+	def __init__(self, path):
+		ReportSpool.__init__(self, path)
+		self.lengths = [0] * (len(REVIEW_LABELS) - 1)	# longest value in every column but the name
 
-# close all file streams
-closeFileStreams()
+	def add(self, reviewRows):
+		""" Adds review rows to the end of the report, in order. """
+		if not reviewRows:
+			return
+		self.lengths = [max(length, max([len(row[column]) for row in reviewRows]))
+						for column, length in enumerate(self.lengths)]
+		self.file.write(''.join(['\x1f'.join(row) + '\n' for row in reviewRows]))
+		self.count += len(reviewRows)
+
+
+def writeSpooledReview(reviews, outfile):
+	"""
+	This function writes the rows of one or more ReviewSpools, one after another, as a single price review report,
+	laid out the same way writePriceReview() lays out the same rows, a chunk at a time.
+	Called by runStreamingStages().
+	"""
+	if not any([review.count for review in reviews]):
+		outfile.write('List is empty!\n\n\n')
+	rowFormat = makeReportFormat([max(max([review.lengths[column] for review in reviews]) + 5, len(label))
+								  for column, label in enumerate(REVIEW_LABELS[:-1])])
+	outfile.write(rowFormat.format(*REVIEW_LABELS))
+	for review in reviews:
+		for block in makeChunks(review.readRows(), REPORT_CHUNK_SIZE):
+			outfile.write(''.join([rowFormat.format(*row) for row in block]))
+
+
+def writeSpooledReport(reports, outfile):
+	"""
+	This function writes the rows of one or more ReportSpools, one after another, as a single report laid out the same
+	way printAllInfo() lays out a list of the same products.
+	Called by runStreamingStages().
+	"""
+	if not any([report.count for report in reports]):
+		outfile.write('List is empty!\n\n\n')
+
+	# each column is as wide as its longest value plus 5 spaces, but never narrower than its label (see findColumnWidth())
+	rowFormat = makeReportFormat([max(max([report.lengths[column] for report in reports]) + 5, len(label))
+								  for column, label in enumerate(REPORT_LABELS[:4])])
+	outfile.write(rowFormat.format(*REPORT_LABELS))
+	for report in reports:
+		for block in makeChunks(report.readRows(), REPORT_CHUNK_SIZE):
+			outfile.write(''.join([rowFormat.format(*row) for row in block]))
+
+
+def writeSpooledUploadFile(reports, outfile, getMember):
+	"""
+	This function writes one member of every row of one or more ReportSpools, one per line, to an upload file.
+	Called by runStreamingStages().
+	"""
+	for report in reports:
+		for block in makeChunks(report.readRows(), REPORT_CHUNK_SIZE):
+			outfile.write(''.join([getMember(row) + '\n' for row in block]))
+
+
+def readSpooledExportRows(reports):
+	"""
+	This function yields the ShopSite upload row of every row of one or more ReportSpools, one after another.
+	Called by writeCsvExport() and writeXlsxExport() for streaming runs.
+	"""
+	for report in reports:
+		for row in report.readRows():
+			yield row[4], row[1], row[2].lstrip()
+
+
+class RunStats:
+	"""
+	This class holds the measurements of one pipeline run: for each stage, the number of times it ran, its total wall
+	time, the rows that went in and came out, and the peak resident (and, when traced, Python) memory seen by the end
+	of it; plus named counters such as the number of matched and missing products.
+	"""
+	def __init__(self):
+		self.startTime = time.time()
+		self.stages = {}		# stage name -> measurements, in the order the stages first ran
+		self.counters = {}		# counter name -> count
+
+	def addStage(self, name, seconds, rowsIn, rowsOut, peakTracedMemory):
+		""" Adds one run of a stage to its totals. """
+		stage = self.getStage(name)
+		stage['calls'] += 1
+		stage['seconds'] += seconds
+		stage['rowsIn'] += rowsIn
+		stage['rowsOut'] += rowsOut
+		stage['peakRss'] = getPeakRss()
+		if peakTracedMemory is not None:
+			stage['peakTracedMemory'] = max(stage['peakTracedMemory'] or 0, peakTracedMemory)
+
+	def addStages(self, stages, counters):
+		"""
+		Adds the stage totals and counters of a worker process's share of this run to this run's; stage times then
+		add up the time spent in every process.
+		"""
+		for name, other in stages.items():
+			stage = self.getStage(name)
+			for field in ('calls', 'seconds', 'rowsIn', 'rowsOut'):
+				stage[field] += other[field]
+			for field in ('peakRss', 'peakTracedMemory'):
+				if other[field] is not None:
+					stage[field] = max(stage[field] or 0, other[field])
+		for name, count in counters.items():
+			self.counters[name] = self.counters.get(name, 0) + count
+
+	def getStage(self, name):
+		""" Returns the totals of a stage, starting them at zero if it has not run yet. """
+		return self.stages.setdefault(name, {'calls': 0, 'seconds': 0.0, 'rowsIn': 0, 'rowsOut': 0,
+											 'peakRss': None, 'peakTracedMemory': None})
+
+	def makeSummary(self):
+		""" Returns the measurements as a dictionary ready to be written as JSON. """
+		return {'started': time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(self.startTime)),
+				'seconds': time.time() - self.startTime, 'peakRss': getPeakRss(),
+				'stages': self.stages, 'counters': self.counters}
+
+
+class StageMeasurement:
+	""" This class holds the row counts of one stage while it runs; the stage sets rowsOut if it differs from rowsIn. """
+	def __init__(self, rowsIn):
+		self.rowsIn = rowsIn
+		self.rowsOut = rowsIn
+
+
+@contextmanager
+def measureStage(runStats, name, rowsIn=0):
+	"""
+	This function times the code in its "with" block as a run of the named stage and adds it to runStats (a session's
+	stats). Outside runPipeline() (runStats is None) nothing is recorded.
+	Called by the pipeline stages.
+	"""
+	measurement = StageMeasurement(rowsIn)
+	if runStats is None:
+		yield measurement
+		return
+	if tracemalloc.is_tracing():
+		tracemalloc.reset_peak()
+	start = time.perf_counter()
+	try:
+		yield measurement
+	finally:
+		seconds = time.perf_counter() - start
+		peakTracedMemory = tracemalloc.get_traced_memory()[1] if tracemalloc.is_tracing() else None
+		runStats.addStage(name, seconds, measurement.rowsIn, measurement.rowsOut, peakTracedMemory)
+
+
+def countEvent(runStats, name, count=1):
+	"""
+	This function adds to a named counter of a session's run; outside runPipeline() (runStats is None) it does nothing.
+	Called by the pipeline stages.
+	"""
+	if runStats is not None:
+		runStats.counters[name] = runStats.counters.get(name, 0) + count
+
+
+def getPeakRss():
+	"""
+	This function returns the peak resident memory of this process so far, in bytes, or None where it is unknown.
+	Called by RunStats.
+	"""
+	if resource is None:
+		return None
+	peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+	return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def writeRunSummary(summary, outfile):
+	"""
+	This function writes a run summary to an output file as JSON.
+	Called by runStages() and runStreamingStages().
+	"""
+	json.dump(summary, outfile, indent=1)
+
+
+def printRunSummary(summary):
+	"""
+	This function prints one line per stage of a run summary, followed by its counters.
+	Called by runPipeline().
+	"""
+	traced = any(stage['peakTracedMemory'] is not None for stage in summary['stages'].values())
+	print()
+	print('STAGE'.ljust(14) + 'SECONDS'.rjust(10) + 'ROWS IN'.rjust(12) + 'ROWS OUT'.rjust(12) + 'PEAK RSS MiB'.rjust(15) +
+		  ('PEAK TRACED MiB'.rjust(18) if traced else ''))
+	for name, stage in summary['stages'].items():
+		peakRss = '-' if stage['peakRss'] is None else format(stage['peakRss'] / 2 ** 20, '.1f')
+		peakTraced = '-' if stage['peakTracedMemory'] is None else format(stage['peakTracedMemory'] / 2 ** 20, '.1f')
+		print(name.ljust(14) + format(stage['seconds'], '.3f').rjust(10) + str(stage['rowsIn']).rjust(12) +
+			  str(stage['rowsOut']).rjust(12) + peakRss.rjust(15) + (peakTraced.rjust(18) if traced else ''))
+	print('total'.ljust(14) + format(summary['seconds'], '.3f').rjust(10))
+	print(', '.join([name + ': ' + str(count) for name, count in summary['counters'].items()]))
+
+
+def makeSnapshotKey(product):
+	"""
+	This function returns the key a TPE product is stored under in the run snapshot: its sku and its name as read
+	from the input file (skus alone are not unique in TPE's inventory).
+	Called by runStages().
+	"""
+	return product.sku + '\t' + product.name
+
+
+def hashProductInputs(product, session):
+	"""
+	This function returns a hash of everything a TPE product's new price depends on: its name, sku, price, and weight,
+	and the (discounted) price of its Tisco match under the session's match mode, if any.
+	Called by runStages().
+	"""
+	tiscoItem, match = findSupplierMatch(session, product)
+	content = '\x1f'.join([product.name, product.sku, repr(product.price), repr(product.weight),
+							repr(tiscoItem.price) if tiscoItem is not None else ''])
+	return hashlib.blake2b(content.encode('utf-8'), digest_size=16).hexdigest()
+
+
+def hashPricingChoices(session):
+	"""
+	This function returns a hash of a session's pricing choices, so a snapshot taken under different choices is
+	never reused.
+	Called by runStages().
+	"""
+	choices = [[userInputs.willModify, userInputs.priceBasedOn, userInputs.baseMultiplier, userInputs.weightMultiplier]
+			   for userInputs in (session.singlePacks, session.multiPacks)]
+	content = [choices, session.roundUpAmount, sorted(category.lower() for category in session.excludedCategories)]
+	if session.matchMode != 'exact':
+		content.extend([session.matchMode, session.minMatchConfidence])
+	content = json.dumps(content)
+	return hashlib.blake2b(content.encode('utf-8'), digest_size=16).hexdigest()
+
+
+def loadSnapshot(path):
+	"""
+	This function reads the snapshot saved by the last run, or returns None if there is no usable snapshot.
+	Called by runStages().
+	"""
+	try:
+		with open(path) as snapshotFile:
+			snapshot = json.load(snapshotFile)
+	except (OSError, ValueError):
+		return None
+	if snapshot.get('version') != SNAPSHOT_VERSION:
+		return None
+	return snapshot
+
+
+def makeSnapshot(settingsHash, tpeProducts, productKeys, inputHashes, lastProducts, repricedProducts, updatedProducts):
+	"""
+	This function builds the snapshot of this run: for every TPE product, its input hash and its new price and name
+	(or None if it was not updated). Products that were not repriced this run keep their entry from the last snapshot.
+	Called by runStages().
+	"""
+	repricedIds = {id(product) for product in repricedProducts}
+	updatedIds = {id(product) for product in updatedProducts}
+	products = {}
+	for product in tpeProducts:
+		key = productKeys[id(product)]
+		if id(product) not in repricedIds:
+			products[key] = lastProducts[key]
+		elif id(product) in updatedIds:
+			products[key] = [inputHashes[id(product)], product.price, product.name]
+		else:
+			products[key] = [inputHashes[id(product)], None, None]
+	return {'version': SNAPSHOT_VERSION, 'settings': settingsHash, 'products': products}
+
+
+def writeSnapshot(snapshot, outfile):
+	"""
+	This function writes a run snapshot to an output file as JSON.
+	Called by runStages().
+	"""
+	json.dump(snapshot, outfile, separators=(',', ':'))
+
+
+class PriceHistory:
+	"""
+	This class adds the prices of one run to the price history, an SQLite database kept with the output files
+	(PRICE_HISTORY_NAME), so that past prices can be looked up by sku (see findPriceHistory()) and a run can be rolled
+	back (see writeRollbackFiles()). Each run gets a new run id, and one row per updated product holding its old and
+	new price and name, the basis of its price, and its multipliers. Rows are only ever added: triggers refuse any
+	update or delete. Nothing is stored until commit(), so a run that fails leaves no trace in the history.
+	"""
+	def __init__(self, path, session, mode):
+		self.connection = sqlite3.connect(path)
+		self.connection.executescript(PRICE_HISTORY_SCHEMA)
+		self.runId = self.connection.execute(
+			'INSERT INTO runs (recordedAt, mode, roundUpAmount, matchMode, suppliers) VALUES (?, ?, ?, ?, ?)',
+			(time.strftime('%Y-%m-%d %H:%M:%S'), mode, session.roundUpAmount, session.matchMode,
+			 ' '.join(getSupplierOrder(session)) + ' (' + session.supplierPolicy + ')')).lastrowid
+
+	def addPrices(self, session, productList, originals):
+		""" Adds a row for each updated product; originals maps each product's id to its old (name, price). """
+		rows = []
+		for product in productList:
+			userInputs = session.multiPacks if product.isMultiPack else session.singlePacks
+			oldName, oldPrice = originals[id(product)]
+			rows.append((self.runId, product.sku, oldName, product.name, float(oldPrice), float(product.price),
+						 userInputs.priceBasedOn, float(userInputs.baseMultiplier), float(userInputs.weightMultiplier)))
+		self.connection.executemany('INSERT INTO prices VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)', rows)
+
+	def commit(self):
+		""" Stores the run and every row added to it. """
+		self.connection.commit()
+
+	def close(self):
+		""" Closes the database, dropping anything not committed. """
+		self.connection.close()
+
+
+def openPriceHistory(outputDirectory):
+	"""
+	This function opens the price history kept in outputDirectory read-only; a ValueError is raised if there is none.
+	Called by findPriceHistory() and writeRollbackFiles().
+	"""
+	path = os.path.join(outputDirectory, PRICE_HISTORY_NAME)
+	if not os.path.isfile(path):
+		raise ValueError('There is no price history in ' + os.path.abspath(outputDirectory) + '.')
+	return sqlite3.connect('file:' + pathname2url(os.path.abspath(path)) + '?mode=ro', uri=True)
+
+
+def findPriceHistory(outputDirectory, sku):
+	"""
+	This function returns every price a sku was given by the runs in the price history, newest first, as
+	(run id, recorded at, old price, new price, basis, base multiplier, weight multiplier, new name) tuples.
+	Called by main().
+	"""
+	connection = openPriceHistory(outputDirectory)
+	try:
+		return connection.execute('SELECT runId, recordedAt, oldPrice, newPrice, basis, baseMultiplier, weightMultiplier, '
+								  'newName FROM prices JOIN runs USING (runId) WHERE sku = ? ORDER BY runId DESC',
+								  (sku,)).fetchall()
+	finally:
+		connection.close()
+
+
+def printPriceHistory(sku, history):
+	"""
+	This function prints the price history of a sku as a table, newest run first.
+	Called by main().
+	"""
+	if not history:
+		print('\nNo run has priced sku ' + sku + '.')
+		return
+	rows = [(str(runId), recordedAt, format(oldPrice, '.2f'), format(newPrice, '.2f'), basis,
+			 format(baseMultiplier, 'g') + ' + ' + format(weightMultiplier, 'g') + '/lb', name)
+			for runId, recordedAt, oldPrice, newPrice, basis, baseMultiplier, weightMultiplier, name in history]
+	widths = [max(len(label), max([len(row[column]) for row in rows]) + 5) for column, label in enumerate(HISTORY_LABELS)]
+	print('\nPrice history of sku ' + sku + ':')
+	for row in [HISTORY_LABELS] + rows:
+		print(''.join([value.ljust(width) for value, width in zip(row[:-1], widths)]) + row[-1])
+
+
+def writeRollbackFiles(outputDirectory, runId=None):
+	"""
+	This function writes upload files that undo one run of the price history (the last one, if runId is None): every
+	sku the run priced gets back the name and price it had before the run, in "OUT - Rollback Names.txt",
+	"OUT - Rollback Skus.txt", and "OUT - Rollback Prices.txt". The run id rolled back is returned.
+	The last run's snapshot no longer describes the live prices after a rollback, so it is deleted, and the next
+	incremental run reprices and uploads every product.
+	Called by main().
+	"""
+	connection = openPriceHistory(outputDirectory)
+	try:
+		if runId is None:
+			runId = connection.execute('SELECT max(runId) FROM runs').fetchone()[0]
+		if runId is None or connection.execute('SELECT 1 FROM runs WHERE runId = ?', (runId,)).fetchone() is None:
+			raise ValueError('The price history has no run ' + str(runId) + '.')
+		products = [Product(sku, oldName, '', format(oldPrice, '.2f'), 0, False, False, False)
+					for sku, oldName, oldPrice in connection.execute('SELECT sku, oldName, oldPrice FROM prices '
+																	 'WHERE runId = ? ORDER BY rowid', (runId,))]
+	finally:
+		connection.close()
+	publishOutputFiles(generateUploadFiles(products, outputDirectory, 'OUT - Rollback '))
+	snapshotPath = os.path.join(outputDirectory, 'OUT - Last Run Snapshot.json')
+	if os.path.exists(snapshotPath):
+		os.remove(snapshotPath)
+	return runId
+
+
+def watchInputs(session, inputDirectory='.', outputDirectory='.', pollSeconds=WATCH_POLL_SECONDS,
+				settleSeconds=WATCH_SETTLE_SECONDS, workers=1, exportFormats=(), exportChanges=False):
+	"""
+	This function runs the tool as a daemon until it is interrupted (Ctrl+C): it loads every input feed once, runs,
+	and then watches the input files (see InputWatcher). Whenever a feed's files change, only that feed is read again
+	(see reloadFeeds()), and an incremental run reprices just the products whose inputs changed and publishes fresh
+	output files. The parsed feeds and the catalogs stay warm in between; like any incremental run, each run reads the
+	last run's snapshot from the output directory.
+	A run that fails, for instance on a feed that is still being written or on the guard rails, is reported and
+	skipped, leaving the last output files in place, and the next change is waited for. Feeds that could not be read
+	stay pending, and are read again with the feeds of the next change, so no run is made from a feed that was
+	never loaded or has changed since it was last read.
+	Called by main().
+	"""
+	if os.path.isfile(inputDirectory):
+		raise ValueError('Watch mode reads "IN - *.txt" files, not an input database.')
+	feedPaths = getFeedPaths(session, inputDirectory)
+	watcher = InputWatcher(feedPaths, settleSeconds)
+	feedLists = {}		# feed -> its parsed products (see reloadFeeds())
+	pendingFeeds = list(feedPaths)		# feeds changed since they were last read successfully
+	try:
+		while True:
+			try:
+				start = time.perf_counter()
+				reloadFeeds(session, inputDirectory, pendingFeeds, feedLists)
+				print('\nRead ' + ', '.join(pendingFeeds) + ' in ' + format(time.perf_counter() - start, '.2f') + 's.')
+				pendingFeeds = []
+				runPipeline(session, outputDirectory, True, workers=workers, exportFormats=exportFormats,
+							exportChanges=exportChanges)
+			except (OSError, ValueError, sqlite3.Error) as error:
+				print('\nRun skipped: ' + str(error))
+			print('\nWatching ' + os.path.abspath(inputDirectory) + ' for changes (press Ctrl+C to stop)...')
+			changedFeeds = watcher.waitForChanges(pollSeconds)
+			pendingFeeds = [feed for feed in feedPaths if feed in pendingFeeds or feed in changedFeeds]
+	except KeyboardInterrupt:
+		print('\nStopped watching.')
+
+
+class InputWatcher:
+	"""
+	This class watches the files of each input feed for changes by polling their size and modification time, which
+	works on every platform and file system. Bursts of writes are debounced: a change is only reported once every
+	watched file has stayed the same for settleSeconds, so feeds that are still being copied or written in pieces
+	are not read half-finished. Files that are missing count as a state of their own.
+	"""
+	def __init__(self, feedPaths, settleSeconds=WATCH_SETTLE_SECONDS):
+		self.feedPaths = feedPaths				# feed -> paths of its files
+		self.settleSeconds = settleSeconds
+		self.fingerprints = self.readFingerprints()	# path -> (size, modification time) last reported, or None
+
+	def readFingerprints(self):
+		""" Returns the current (size, modification time) of every watched file, or None for a missing one. """
+		fingerprints = {}
+		for paths in self.feedPaths.values():
+			for path in paths:
+				try:
+					status = os.stat(path)
+					fingerprints[path] = (status.st_size, status.st_mtime_ns)
+				except OSError:
+					fingerprints[path] = None
+		return fingerprints
+
+	def waitForChanges(self, pollSeconds=WATCH_POLL_SECONDS):
+		""" Waits until some files change and then settle, and returns the feeds whose files changed, in order. """
+		lastSeen = self.fingerprints
+		changedAt = None
+		while True:
+			time.sleep(pollSeconds)
+			current = self.readFingerprints()
+			if current != lastSeen:
+				lastSeen = current
+				changedAt = time.monotonic()
+			elif changedAt is not None and time.monotonic() - changedAt >= self.settleSeconds:
+				changedFeeds = [feed for feed, paths in self.feedPaths.items()
+								if any([current[path] != self.fingerprints[path] for path in paths])]
+				self.fingerprints = current
+				if changedFeeds:
+					return changedFeeds
+				changedAt = None
+
+
+def getFeedPaths(session, inputDirectory='.'):
+	"""
+	This function returns the paths of the files of every input feed of a session, by feed: 'TPE' for the four TPE
+	files, then each supplier in order of preference (see getSupplierFileNames()).
+	Called by watchInputs().
+	"""
+	feedPaths = {'TPE': [os.path.join(inputDirectory, fileName) for fileName in TPE_INPUT_FILES]}
+	for supplier in getSupplierOrder(session):
+		feedPaths[supplier] = [os.path.join(inputDirectory, fileName) for fileName in getSupplierFileNames(supplier)]
+	return feedPaths
+
+
+def reloadFeeds(session, inputDirectory, feeds, feedLists):
+	"""
+	This function reads the given feeds again into feedLists, which keeps the parsed products of every feed between
+	calls: 'TPE' -> the TPE products, and each supplier -> (update time, products, discount products). The session's
+	catalogs are then rebuilt from feedLists. When only the TPE feed changed, the TPE catalog is simply replaced;
+	otherwise the supplier lists are indexed and merged again (see indexCatalogs()), from copies, since applying
+	discounts changes prices in place. Every feed is read before anything is replaced, so a feed that cannot be
+	read leaves the session as it was; a ValueError is raised if a feed of the session has never been read.
+	Called by watchInputs().
+	"""
+	newLists = {feed: readFeed(inputDirectory, feed) for feed in feeds}
+	missing = [feed for feed in ['TPE'] + getSupplierOrder(session) if feed not in feedLists and feed not in newLists]
+	if missing:
+		raise ValueError('The ' + ', '.join(missing) + ' feed has not been read yet.')
+	feedLists.update(newLists)
+	if set(feeds) != {'TPE'}:
+		session.clearCatalogs()
+		supplierLists = []
+		for supplier in getSupplierOrder(session):
+			timestamp, productList, discountList = feedLists[supplier]
+			if supplier == 'Tisco':
+				session.tiscoProducts.extend(copyProducts(productList))
+				session.discountProducts.extend(discountList)
+				tiscoTimestamp = timestamp
+			else:
+				supplierLists.append((supplier, timestamp, copyProducts(productList), discountList))
+		indexCatalogs(session, supplierLists, tiscoTimestamp if supplierLists else 0)
+	session.tpeProducts.clear()
+	session.tpeProducts.extend(feedLists['TPE'])
+
+
+def readFeed(inputDirectory, feed):
+	"""
+	This function reads the files of one input feed (see reloadFeeds()): the TPE products, sorted by name, for 'TPE',
+	and (update time, products, discount products) for a supplier, whose discount files are optional unless it is
+	Tisco. A ValueError is raised if a feed's files do not line up, as when one is caught halfway through being written.
+	Called by reloadFeeds().
+	"""
+	if feed == 'TPE':
+		productList = []
+		with open(os.path.join(inputDirectory, TPE_INPUT_FILES[0])) as names, \
+				open(os.path.join(inputDirectory, TPE_INPUT_FILES[1])) as skus, \
+				open(os.path.join(inputDirectory, TPE_INPUT_FILES[2])) as prices, \
+				open(os.path.join(inputDirectory, TPE_INPUT_FILES[3])) as weights:
+			getTpeProducts(productList, names, skus, prices, weights)
+		return productList
+	paths = getSupplierPaths(inputDirectory, feed)
+	lists = []
+	for prodNumPath, pricePath, label in zip(paths[0::2], paths[1::2], (feed, feed + ' discount')):
+		with open(prodNumPath) as prodNums, open(pricePath) as prices:
+			lists.append(list(readTiscoProducts(prodNums, prices, label)))
+	return (getFeedTimestamp(paths), lists[0], lists[1] if len(lists) > 1 else [])
+
+
+def loadInputs(session, inputPath='.', useCache=True):
+	"""
+	This function replaces the session's catalogs with the contents of an input source, read by the backend that
+	suits it: a directory is read as "IN - *.txt" files (see loadInputFiles()), and a file as an SQLite input database
+	(see loadInputDatabase()).
+	Called by runPipeline() and PricingSession.loadFiles().
+	"""
+	if os.path.isfile(inputPath):
+		loadInputDatabase(session, inputPath)
+	else:
+		loadInputFiles(session, inputPath, useCache)
+
+
+def loadInputDatabase(session, path):
+	"""
+	This function replaces the session's catalogs with the contents of an SQLite input database (see
+	INPUT_DATABASE_SCHEMA): TPE products in the tpeProducts table, and the price and discount lists of Tisco and of
+	the session's other suppliers in the supplierProducts and supplierDiscounts tables, each in row order. Whole
+	columns are read with one query per table and supplier, so rows are aligned by the database itself rather than
+	by line numbers. Feeds have no update times here, so the 'recent' supplier policy falls back to preference order.
+	Called by loadInputs().
+	"""
+	connection = openInputDatabase(path)
+	try:
+		session.clearCatalogs()
+		supplierLists = []		# (supplier name, timestamp, products, discount products) of each other supplier
+		with measureStage(session.stats, 'load') as stage:
+			session.tpeProducts.extend(readDatabaseTpeProducts(connection))
+			session.tpeProducts.sort(key=lambda product: product.name)
+			for supplier in getSupplierOrder(session):
+				productList = list(readDatabaseSupplierProducts(connection, 'supplierProducts', supplier))
+				discountList = list(readDatabaseSupplierProducts(connection, 'supplierDiscounts', supplier))
+				if supplier == 'Tisco':
+					session.tiscoProducts.extend(productList)
+					session.discountProducts.extend(discountList)
+				else:
+					supplierLists.append((supplier, 0, productList, discountList))
+			stage.rowsIn = stage.rowsOut = countCatalogRows(session, supplierLists)
+	finally:
+		connection.close()
+	indexCatalogs(session, supplierLists)
+
+
+def openInputDatabase(path):
+	"""
+	This function opens an SQLite input database read-only, after checking that it has the tables the tool reads;
+	a ValueError is raised if it does not.
+	Called by loadInputDatabase() and runStreamingStages().
+	"""
+	connection = sqlite3.connect('file:' + pathname2url(os.path.abspath(path)) + '?mode=ro', uri=True)
+	try:
+		tables = {name for (name,) in connection.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+	except sqlite3.DatabaseError as error:
+		connection.close()
+		raise ValueError(path + ' is not an SQLite input database (' + str(error) + ').')
+	missing = [table for table in ('tpeProducts', 'supplierProducts', 'supplierDiscounts') if table not in tables]
+	if missing:
+		connection.close()
+		raise ValueError(path + ' is not an input database: it has no ' + ', '.join(missing) + ' table.')
+	return connection
+
+
+def readDatabaseTpeProducts(connection):
+	"""
+	This function yields a Product for every row of the tpeProducts table of an input database, in row order.
+	A ValueError is raised for a row with a missing value.
+	Called by loadInputDatabase() and runStreamingStages().
+	"""
+	for rowNumber, row in enumerate(connection.execute('SELECT name, sku, price, weight FROM tpeProducts '
+													   'ORDER BY rowid'), 1):
+		if None in row:
+			raise ValueError('Row ' + str(rowNumber) + ' of the tpeProducts table has a missing value.')
+		name, sku, price, weight = row
+		yield buildTpeProduct(name.strip(), sku.strip(), float(price), float(weight))
+
+
+def readDatabaseSupplierProducts(connection, table, supplier):
+	"""
+	This function yields a Product for every row of one supplier in the supplierProducts or supplierDiscounts table
+	of an input database, in row order.
+	Called by loadInputDatabase() and runStreamingStages().
+	"""
+	for prodNum, price in connection.execute('SELECT prodNum, price FROM ' + table + ' WHERE supplier = ? '
+											 'ORDER BY rowid', (supplier,)):
+		if prodNum is None or price is None:
+			raise ValueError('A ' + supplier + ' row of the ' + table + ' table has a missing value.')
+		yield Product("", "", intern(prodNum), float(price), 0, False, False, False)
+
+
+def writeInputDatabase(inputDirectory, path, suppliers=()):
+	"""
+	This function copies the "IN - *.txt" files in inputDirectory, with the price and discount files of any other
+	suppliers named, into a new SQLite input database, which then replaces any file at path in one step.
+	Called by main().
+	"""
+	databaseFile, tempName = openTempFile(path, 'wb')
+	databaseFile.close()
+	try:
+		connection = sqlite3.connect(tempName)
+		try:
+			connection.executescript(INPUT_DATABASE_SCHEMA)
+			with open(os.path.join(inputDirectory, TPE_INPUT_FILES[0])) as names, \
+					open(os.path.join(inputDirectory, TPE_INPUT_FILES[1])) as skus, \
+					open(os.path.join(inputDirectory, TPE_INPUT_FILES[2])) as prices, \
+					open(os.path.join(inputDirectory, TPE_INPUT_FILES[3])) as weights:
+				connection.executemany('INSERT INTO tpeProducts VALUES (?, ?, ?, ?)',
+									   ((product.name, product.sku, product.price, product.weight)
+										for product in readTpeProducts(names, skus, prices, weights)))
+			for supplier in dict.fromkeys(['Tisco'] + list(suppliers)):
+				paths = getSupplierPaths(inputDirectory, supplier)
+				for table, prodNumPath, pricePath, label in zip(('supplierProducts', 'supplierDiscounts'), paths[0::2],
+																paths[1::2], (supplier, supplier + ' discount')):
+					with open(prodNumPath) as prodNums, open(pricePath) as prices:
+						connection.executemany('INSERT INTO ' + table + ' VALUES (?, ?, ?)',
+											   ((supplier, product.prodNum, product.price)
+												for product in readTiscoProducts(prodNums, prices, label)))
+			connection.commit()
+		finally:
+			connection.close()
+		os.replace(tempName, path)
+	except BaseException:
+		if os.path.exists(tempName):
+			os.remove(tempName)
+		raise
+
+
+def loadInputFiles(session, inputDirectory='.', useCache=True):
+	"""
+	This function replaces the session's catalogs with the contents of every input file, and builds the discounted
+	TiscoCatalog. When useCache is set, the discounted Tisco list is taken from the binary cache if the Tisco and
+	discount files have not changed since it was written, and the cache is rewritten otherwise.
+	The price and discount files of the session's other suppliers (see getSupplierFileNames()) are read as well, and
+	merged with Tisco's; the cache then holds the merged list.
+	Called by loadInputs().
+	"""
+	cachePath = os.path.join(inputDirectory, TISCO_CACHE_NAME)
+	sourcePaths = [os.path.join(inputDirectory, fileName) for fileName in TISCO_CACHE_SOURCES]
+
+	# other suppliers' files; their discount files are optional. The cache then holds the merged best-price list, so
+	# it also records which suppliers were merged, and how.
+	supplierPaths = {}
+	mergeSettings = None
+	for supplier in getSupplierOrder(session):
+		if supplier != 'Tisco':
+			supplierPaths[supplier] = getSupplierPaths(inputDirectory, supplier)
+	if supplierPaths:
+		feedPaths = dict(supplierPaths, Tisco=sourcePaths)
+		timestamps = {supplier: getFeedTimestamp(paths) for supplier, paths in feedPaths.items()}
+		sourcePaths = sourcePaths + [path for paths in supplierPaths.values() for path in paths]
+		mergeSettings = {'policy': session.supplierPolicy, 'suppliers': getSupplierOrder(session),
+						 'files': [os.path.basename(path) for path in sourcePaths]}
+		if session.supplierPolicy == 'recent':
+			mergeSettings['timestamps'] = [timestamps[supplier] for supplier in getSupplierOrder(session)]
+
+	with measureStage(session.stats, 'load'):
+		cachedProducts = loadTiscoCache(cachePath, sourcePaths, mergeSettings) if useCache else None
+	if cachedProducts is not None:
+		countEvent(session.stats, 'tiscoProductsFromCache', len(cachedProducts))
+
+	# open all file streams (other suppliers' only if their prices are not cached)
+	streams = openFileStreams(inputDirectory)
+	tiscoProdNums, tiscoPrices, discountProdNums, discountPrices, tpeNames, tpeSkus, tpePrices, tpeWeights = streams
+	supplierFeeds = []
+	try:
+		if cachedProducts is None:
+			for supplier, paths in supplierPaths.items():
+				for path in paths:
+					streams.append(open(path, 'r'))
+				supplierFeeds.append(SupplierFeed(supplier, *streams[-len(paths):], timestamp=timestamps[supplier]))
+		loadCatalogs(session, tpeNames, tpeSkus, tpePrices, tpeWeights, tiscoProdNums, tiscoPrices, discountProdNums,
+					 discountPrices, cachedProducts, supplierFeeds, timestamps['Tisco'] if supplierPaths else 0)
+	finally:
+		# close all file streams
+		closeFileStreams(streams)
+
+	# worker processes can share the index in the cache file, as long as it matches the catalogs in memory
+	session.tiscoIndexPath = cachePath if cachedProducts is not None else None
+	if cachedProducts is None and useCache:
+		with measureStage(session.stats, 'discount'):
+			if saveTiscoCache(cachePath, sourcePaths, session.tiscoCatalog, mergeSettings):
+				session.tiscoIndexPath = cachePath
+
+
+def loadCatalogs(session, tpeNames, tpeSkus, tpePrices, tpeWeights, tiscoProdNums, tiscoPrices, discountProdNums,
+				 discountPrices, tiscoProducts=None, supplierFeeds=(), tiscoTimestamp=0):
+	"""
+	This function empties the session's catalogs and fills them from iterables of lines in the formats of the
+	"IN - *.txt" files, then indexes the Tisco products by part number and applies the discounts to them.
+	Each SupplierFeed in supplierFeeds is read and discounted the same way, and all the suppliers' catalogs are then
+	merged into one best-price catalog under the session's supplier policy (see mergeSupplierCatalogs()), which
+	becomes the session's Tisco list and tiscoCatalog. tiscoTimestamp is the time the Tisco feed was last updated.
+	If tiscoProducts is given, it is used as the (already discounted and merged) Tisco list instead of tiscoProdNums,
+	tiscoPrices, and supplierFeeds.
+	Called by loadInputFiles() and PricingSession.loadIterables().
+	"""
+	session.clearCatalogs()
+	supplierLists = []		# (supplier name, timestamp, products, discount products) of each other supplier
+	with measureStage(session.stats, 'load') as stage:
+		if tiscoProducts is not None:
+			session.tiscoProducts.extend(tiscoProducts)
+		else:
+			getTiscoProducts(session.tiscoProducts, tiscoProdNums, tiscoPrices)
+			for feed in supplierFeeds:
+				supplierLists.append((feed.name, feed.timestamp, [], []))
+				getTiscoProducts(supplierLists[-1][2], feed.prodNums, feed.prices, feed.name)
+				getTiscoProducts(supplierLists[-1][3], feed.discountProdNums, feed.discountPrices, feed.name + ' discount')
+		getTiscoProducts(session.discountProducts, discountProdNums, discountPrices, 'Tisco discount')
+		getTpeProducts(session.tpeProducts, tpeNames, tpeSkus, tpePrices, tpeWeights)
+		stage.rowsIn = stage.rowsOut = countCatalogRows(session, supplierLists)
+
+	indexCatalogs(session, supplierLists, tiscoTimestamp, tiscoProducts is not None)
+
+
+def countCatalogRows(session, supplierLists):
+	"""
+	This function returns how many products a session's catalogs and the other suppliers' lists hold in all.
+	Called by loadCatalogs() and loadInputDatabase().
+	"""
+	rows = len(session.tiscoProducts) + len(session.discountProducts) + len(session.tpeProducts)
+	for supplier, timestamp, productList, discountList in supplierLists:
+		rows += len(productList) + len(discountList)
+	return rows
+
+
+def indexCatalogs(session, supplierLists, tiscoTimestamp=0, discounted=False):
+	"""
+	This function indexes the session's Tisco products by part number and applies the discounts to them (unless they
+	are already discounted), then merges the other suppliers' lists, given as (supplier name, timestamp, products,
+	discount products), into one best-price catalog with them (see mergeSupplierCatalogs()).
+	Called by loadCatalogs(), loadInputDatabase(), and reloadFeeds().
+	"""
+	# index Tisco products by part number and apply discounts to them (cached products are already discounted)
+	with measureStage(session.stats, 'discount', len(session.tiscoProducts)):
+		session.tiscoCatalog = TiscoCatalog(session.tiscoProducts)
+		if not discounted:
+			applyTiscoDiscounts(session.tiscoCatalog, session.discountProducts)
+
+	# merge every supplier's discounted catalog into one best-price catalog
+	if supplierLists:
+		with measureStage(session.stats, 'merge', len(session.tiscoProducts)) as stage:
+			catalogs = [('Tisco', session.tiscoCatalog, tiscoTimestamp)]
+			for supplier, timestamp, productList, discountList in supplierLists:
+				catalog = TiscoCatalog(productList)
+				applyTiscoDiscounts(catalog, discountList)
+				catalogs.append((supplier, catalog, timestamp))
+				stage.rowsIn += len(productList)
+			order = getSupplierOrder(session)
+			catalogs.sort(key=lambda entry: order.index(entry[0]) if entry[0] in order else len(order))
+			session.tiscoCatalog, wins = mergeSupplierCatalogs(catalogs, session.supplierPolicy)
+			session.tiscoProducts = session.tiscoCatalog.products
+			stage.rowsOut = len(session.tiscoProducts)
+		for supplier, count in wins.items():
+			countEvent(session.stats, 'bestPricesFrom' + supplier, count)
+
+
+def getSupplierOrder(session):
+	"""
+	This function returns the names of the session's suppliers in order of preference. Tisco is always a supplier,
+	and comes first unless the session lists it somewhere else.
+	Called by runPipeline(), loadInputFiles(), loadInputDatabase(), indexCatalogs(), getFeedPaths(),
+	reloadFeeds(), and PriceHistory.
+	"""
+	suppliers = list(dict.fromkeys(session.suppliers))
+	if 'Tisco' not in suppliers:
+		suppliers.insert(0, 'Tisco')
+	return suppliers
+
+
+def getSupplierFileNames(supplier):
+	"""
+	This function returns the names of a supplier's input files: product numbers, prices, discount product numbers,
+	and discount prices. Tisco's files keep their original names; another supplier's are named after it, e.g.
+	"IN - Acme Product Numbers.txt", "IN - Acme Prices.txt", and "IN - Acme Discount Prices.txt".
+	Called by getSupplierPaths() and getFeedPaths().
+	"""
+	if supplier == 'Tisco':
+		return TISCO_CACHE_SOURCES
+	return ['IN - ' + supplier + ' ' + fileName for fileName in ('Product Numbers.txt', 'Prices.txt',
+																 'Discount Product Numbers.txt', 'Discount Prices.txt')]
+
+
+def getSupplierPaths(inputDirectory, supplier):
+	"""
+	This function returns the paths of the input files of a supplier that are to be read (see getSupplierFileNames()).
+	The discount files of a supplier other than Tisco are optional, and left out if neither exists; a ValueError is
+	raised if only one of them does, rather than reading discounts without prices.
+	Called by loadInputFiles(), writeInputDatabase(), and readFeed().
+	"""
+	paths = [os.path.join(inputDirectory, fileName) for fileName in getSupplierFileNames(supplier)]
+	if supplier == 'Tisco':
+		return paths
+	missing = [path for path in paths[2:] if not os.path.exists(path)]
+	if len(missing) == 1:
+		raise ValueError(supplier + ' discount files are incomplete: "' + os.path.basename(missing[0]) +
+						 '" is missing.')
+	return paths[:2] if missing else paths
+
+
+def getFeedTimestamp(paths):
+	"""
+	This function returns when the newest of a supplier's files was last modified.
+	Called by loadInputFiles() and readFeed().
+	"""
+	return max([os.stat(path).st_mtime_ns for path in paths])
+
+
+def mergeSupplierCatalogs(catalogs, policy):
+	"""
+	This function merges the discounted catalogs of several suppliers into one best-price TiscoCatalog, holding a
+	single product per part number, and returns it with the number of part numbers taken from each supplier.
+	catalogs is a list of (supplier name, TiscoCatalog, timestamp) in order of preference. The policy decides which
+	supplier's price a part number gets:
+		- 'preferred': that of the first supplier, in order of preference, carrying the part number,
+		- 'cheapest': the lowest price of any supplier (the more preferred supplier's on a tie), or
+		- 'recent': that of the supplier whose feed was updated last (the more preferred supplier's on a tie).
+	Within one catalog, a repeated part number has the price that its findProduct() returns.
+	Called by indexCatalogs().
+	"""
+	if policy not in SUPPLIER_POLICIES:
+		raise ValueError('Unknown supplier policy ' + repr(policy) + ' (expected one of ' +
+						 ', '.join(SUPPLIER_POLICIES) + ').')
+	if policy == 'recent':
+		catalogs = sorted(catalogs, key=lambda entry: -entry[2])
+	cheapest = policy == 'cheapest'
+
+	best = {}	# normalized part number -> (Product, supplier name)
+	for supplier, catalog, timestamp in catalogs:
+		for key, matches in catalog.entries.items():
+			current = best.get(key)
+			if current is None or (cheapest and matches[0].price < current[0].price):
+				best[key] = (matches[0], supplier)
+
+	wins = dict.fromkeys([supplier for supplier, catalog, timestamp in catalogs], 0)
+	for product, supplier in best.values():
+		wins[supplier] += 1
+	return TiscoCatalog([product for product, supplier in best.values()]), wins
+
+
+def getFileFingerprint(path, withHash=True):
+	"""
+	This function returns the size, modification time, and (optionally) content hash of a file.
+	Called by loadTiscoCache() and writeTiscoCache().
+	"""
+	status = os.stat(path)
+	fingerprint = {'size': status.st_size, 'mtime': status.st_mtime_ns, 'hash': None}
+	if withHash:
+		with open(path, 'rb') as sourceFile:
+			fingerprint['hash'] = hashlib.blake2b(sourceFile.read(), digest_size=16).hexdigest()
+	return fingerprint
+
+
+def loadTiscoCache(cachePath, sourcePaths, mergeSettings=None):
+	"""
+	This function returns the discounted Tisco Products stored in the binary cache, or None if there is no cache or
+	it is out of date. The cache is current when every source file has the recorded size and either the recorded
+	modification time or, failing that, the recorded content hash, and when it was merged from other suppliers' lists
+	with the given settings (or from none, if mergeSettings is None).
+	Prices are read straight out of the memory-mapped file; only the Product objects themselves are created.
+	Called by loadInputFiles().
+	"""
+	try:
+		with open(cachePath, 'rb') as cacheFile:
+			cacheMap = mmap.mmap(cacheFile.fileno(), 0, access=mmap.ACCESS_READ)
+	except (OSError, ValueError):
+		return None
+
+	try:
+		header, pricesStart = readTiscoCacheHeader(cacheMap)
+		if len(header['sources']) != len(sourcePaths) or header.get('suppliers') != mergeSettings:
+			return None
+		for recorded, path in zip(header['sources'], sourcePaths):
+			current = getFileFingerprint(path, withHash=False)
+			if current['size'] != recorded['size']:
+				return None
+			if current['mtime'] != recorded['mtime'] and getFileFingerprint(path)['hash'] != recorded['hash']:
+				return None
+
+		# prices are float64 values starting at the first 8-byte boundary after the header, followed by part numbers
+		count = header['count']
+		pricesEnd = pricesStart + 8 * count
+		with memoryview(cacheMap) as cacheView, cacheView[pricesStart:pricesEnd].cast('d') as prices:
+			prodNums = bytes(cacheView[pricesEnd:pricesEnd + header['prodNumBytes']]).decode('utf-8').split('\n')
+			products = [Product("", "", intern(prodNum), price, 0, False, False, False)
+						for prodNum, price in zip(prodNums, prices)]
+	except (KeyError, ValueError, TypeError):
+		return None
+	finally:
+		cacheMap.close()
+
+	if len(products) != count:
+		return None
+	return products
+
+
+def readTiscoCacheHeader(cacheMap):
+	"""
+	This function reads the JSON header of a memory-mapped Tisco cache and returns it, with the offset of the first
+	8-byte boundary after it (where the prices start). A ValueError is raised if the file is not a cache this version
+	of the tool can read.
+	Called by loadTiscoCache() and MappedTiscoIndex.
+	"""
+	if cacheMap[:len(TISCO_CACHE_MAGIC)] != TISCO_CACHE_MAGIC:
+		raise ValueError('Not a Tisco cache, or one written by another version of the tool.')
+	headerStart = len(TISCO_CACHE_MAGIC) + 8
+	headerLength = int.from_bytes(cacheMap[len(TISCO_CACHE_MAGIC):headerStart], 'little')
+	header = json.loads(cacheMap[headerStart:headerStart + headerLength].decode('utf-8'))
+	if header['byteOrder'] != sys.byteorder:
+		raise ValueError('The Tisco cache was written on a machine with a different byte order.')
+	return header, alignTo8(headerStart + headerLength)
+
+
+def saveTiscoCache(cachePath, sourcePaths, catalog, mergeSettings=None):
+	"""
+	This function writes the discounted Tisco Products of a TiscoCatalog to the binary cache, replacing any old cache
+	in one step, and returns whether it succeeded.
+	A cache that cannot be written is skipped with a warning, since it only saves time.
+	Called by loadInputFiles().
+	"""
+	try:
+		cacheFile, tempName = openTempFile(cachePath, 'wb')
+		try:
+			with cacheFile:
+				writeTiscoCache(cacheFile, sourcePaths, catalog, mergeSettings)
+			os.replace(tempName, cachePath)
+		except BaseException:
+			os.remove(tempName)
+			raise
+	except OSError as error:
+		print('WARNING: could not write the Tisco cache (' + str(error) + ').')
+		return False
+	return True
+
+
+def writeTiscoCache(cacheFile, sourcePaths, catalog, mergeSettings=None):
+	"""
+	This function writes the discounted Tisco Products of a TiscoCatalog to an open binary file in the cache format:
+	a magic string, a JSON header with the fingerprints of the source files (and the settings the catalog was merged
+	from other suppliers with, if it was), the prices as float64 values, and the
+	part numbers as newline-separated UTF-8 text; then, for MappedTiscoIndex, a hash table over the normalized part
+	numbers. The hash table is an open-addressing table of int64 key numbers (-1 for an empty slot), probed linearly
+	from the CRC-32 of the key, followed by the int64 offsets of the keys, their float64 prices, and the UTF-8 keys.
+	Each key is stored once, with the price of its first product (the one TiscoCatalog.findProduct() returns).
+	Called by saveTiscoCache() and openWorkerPool().
+	"""
+	productList = catalog.products
+	prodNumBytes = '\n'.join([product.prodNum for product in productList]).encode('utf-8')
+
+	# build the hash table, at most half full so that probe sequences stay short
+	keys = [key.encode('utf-8') for key in catalog.entries]
+	keyOffsets = array('q', [0])
+	for key in keys:
+		keyOffsets.append(keyOffsets[-1] + len(key))
+	tableSize = 1 << max(3, (2 * len(keys)).bit_length())
+	mask = tableSize - 1
+	slots = array('q', [-1]) * tableSize
+	for number, key in enumerate(keys):
+		slot = zlib.crc32(key) & mask
+		while slots[slot] != -1:
+			slot = (slot + 1) & mask
+		slots[slot] = number
+
+	# work out where each section starts, so the header can record it
+	indexStart = alignTo8(8 * len(productList) + len(prodNumBytes))		# relative to the start of the prices
+	header = {'byteOrder': sys.byteorder, 'count': len(productList), 'prodNumBytes': len(prodNumBytes),
+			  'sources': [getFileFingerprint(path) for path in sourcePaths], 'suppliers': mergeSettings,
+			  'index': {'start': indexStart, 'tableSize': tableSize, 'keyCount': len(keys)}}
+	headerBytes = json.dumps(header).encode('utf-8')
+	headerEnd = len(TISCO_CACHE_MAGIC) + 8 + len(headerBytes)
+
+	cacheFile.write(TISCO_CACHE_MAGIC + len(headerBytes).to_bytes(8, 'little') + headerBytes)
+	cacheFile.write(bytes(alignTo8(headerEnd) - headerEnd))
+	cacheFile.write(array('d', [product.price for product in productList]).tobytes())
+	cacheFile.write(prodNumBytes)
+	cacheFile.write(bytes(indexStart - 8 * len(productList) - len(prodNumBytes)))
+	cacheFile.write(slots.tobytes())
+	cacheFile.write(keyOffsets.tobytes())
+	cacheFile.write(array('d', [catalog.entries[key][0].price for key in catalog.entries]).tobytes())
+	cacheFile.write(b''.join(keys))
+
+
+class MappedTiscoIndex:
+	"""
+	This class looks up discounted Tisco prices straight from the hash table of a memory-mapped Tisco cache (see
+	writeTiscoCache()), without reading the cache into memory. Worker processes use it so that they all share one
+	copy of the index through the operating system's page cache. findProduct() answers like a TiscoCatalog's.
+	"""
+	def __init__(self, path):
+		with open(path, 'rb') as cacheFile:
+			self.cacheMap = mmap.mmap(cacheFile.fileno(), 0, access=mmap.ACCESS_READ)
+		header, pricesStart = readTiscoCacheHeader(self.cacheMap)
+		index = header['index']
+		tableSize, keyCount = index['tableSize'], index['keyCount']
+		slotsStart = pricesStart + index['start']
+		offsetsStart = slotsStart + 8 * tableSize
+		keyPricesStart = offsetsStart + 8 * (keyCount + 1)
+		self.keysStart = keyPricesStart + 8 * keyCount
+		self.mask = tableSize - 1
+		view = memoryview(self.cacheMap)
+		self.slots = view[slotsStart:offsetsStart].cast('q')
+		self.keyOffsets = view[offsetsStart:keyPricesStart].cast('q')
+		self.prices = view[keyPricesStart:self.keysStart].cast('d')
+
+	def findProduct(self, prodNum):
+		""" Returns a Product with the (discounted) price of the given part number, or None if there is no such product. """
+		key = normalizePartNumber(prodNum).encode('utf-8')
+		slot = zlib.crc32(key) & self.mask
+		while True:
+			number = self.slots[slot]
+			if number < 0:
+				return None
+			start = self.keysStart + self.keyOffsets[number]
+			if self.cacheMap[start:self.keysStart + self.keyOffsets[number + 1]] == key:
+				return Product("", "", prodNum, self.prices[number], 0, False, False, False)
+			slot = (slot + 1) & self.mask
+
+	def prefetch(self, prodNums):
+		""" Does nothing: lookups are already served from memory. """
+
+
+def alignTo8(offset):
+	"""
+	This function rounds a byte offset up to the next multiple of 8.
+	Called by writeTiscoCache() and readTiscoCacheHeader().
+	"""
+	return (offset + 7) // 8 * 8
+
+
+def loadProfile(path):
+	"""
+	This function reads a pricing profile from a JSON file, or from a TOML file when the name ends in ".toml".
+	A profile looks like:
+		{"singlePacks": {"willModify": true, "priceBasedOn": "TPE", "baseMultiplier": 1.40, "weightMultiplier": 0.30},
+		 "multiPacks": {"willModify": false},
+		 "roundUpAmount": 99}
+	and may also set "excludedCategories", "inputDirectory", and "outputDirectory".
+	Called by main().
+	"""
+	if path.lower().endswith('.toml'):
+		if tomllib is None:
+			raise ValueError('TOML profiles need Python 3.11 or newer; use a JSON profile instead: ' + path)
+		with open(path, 'rb') as profileFile:
+			return tomllib.load(profileFile)
+	with open(path) as profileFile:
+		return json.load(profileFile)
+
+
+def readProfileChoices(profile):
+	"""
+	This function reads and checks the single-pack UserInputs, multi-pack UserInputs, and "round up" amount of a
+	pricing profile and returns them as a tuple.
+	Called by PricingSession.setChoicesFromProfile() and compareScenarios().
+	"""
+	singlePackInputs = makeUserInputs('single-pack', profile.get('singlePacks'))
+	multiPackInputs = makeUserInputs('multi-pack', profile.get('multiPacks'))
+
+	if profile.get('roundUpAmount') is None:
+		raise ValueError('The profile has no "roundUpAmount".')
+	roundUp = int(profile['roundUpAmount'])
+	if not (0 <= roundUp <= 99):
+		raise ValueError('The "round up" amount must be between 0 and 99, (inclusive).')
+	return singlePackInputs, multiPackInputs, roundUp
+
+
+def readMatchMode(profile):
+	"""
+	This function reads and checks the match mode of a pricing profile, which is 'exact' if the profile has none.
+	Called by PricingSession.setChoicesFromProfile() and main().
+	"""
+	matchMode = profile.get('matchMode') or 'exact'
+	if matchMode not in MATCH_MODES:
+		raise ValueError('The "matchMode" must be one of: ' + ', '.join(MATCH_MODES) + '.')
+	return matchMode
+
+
+def readMinMatchConfidence(profile):
+	"""
+	This function reads and checks the least confidence an approximate match is priced with in a pricing profile,
+	which is MIN_MATCH_CONFIDENCE if the profile has none.
+	Called by PricingSession.setChoicesFromProfile() and main().
+	"""
+	if profile.get('minMatchConfidence') is None:
+		return MIN_MATCH_CONFIDENCE
+	minMatchConfidence = readProfileNumber(profile, 'minMatchConfidence')
+	if not (0.0 <= minMatchConfidence <= 1.0):
+		raise ValueError('The "minMatchConfidence" must be between 0 and 1, (inclusive).')
+	return minMatchConfidence
+
+
+def readGuardRails(profile):
+	"""
+	This function reads and checks the "guardRails" section of a pricing profile, and returns it as GuardRails;
+	limits that are not given keep their defaults.
+	Called by PricingSession.setChoicesFromProfile() and main().
+	"""
+	limits = profile.get('guardRails') or {}
+	guardRails = GuardRails()
+	for name in ('maxChangePercent', 'maxChangeAmount'):
+		if limits.get(name) is not None:
+			setattr(guardRails, name, readProfileNumber(limits, name))
+			if not (getattr(guardRails, name) >= 0.0):
+				raise ValueError('The "' + name + '" guard rail must be a non-negative number.')
+	if limits.get('maxFlaggedShare') is not None:
+		guardRails.maxFlaggedShare = readProfileNumber(limits, 'maxFlaggedShare')
+		if not (0.0 <= guardRails.maxFlaggedShare <= 1.0):
+			raise ValueError('The "maxFlaggedShare" guard rail must be between 0 and 1, (inclusive).')
+	return guardRails
+
+
+def makeUserInputs(multiplicity, preferences):
+	"""
+	This function builds a UserInputs object for one product multiplicity from a profile section.
+	A missing section, or one with "willModify" set to false, leaves that category unmodified.
+	Called by readProfileChoices().
+	"""
+	if not preferences or not preferences.get('willModify', True):
+		return UserInputs(False, 'nothing', 0.0, 0.0)
+
+	priceBasedOn = str(preferences.get('priceBasedOn', '')).upper()
+	if priceBasedOn != 'TPE' and priceBasedOn != 'TISCO':
+		raise ValueError('Only \'TPE\' and \'Tisco\' are accepted ' + multiplicity + ' price bases.')
+	baseMultiplier = readProfileNumber(preferences, 'baseMultiplier')
+	if not (0.49 < baseMultiplier < 2.01):
+		raise ValueError('The ' + multiplicity + ' price multiplier must be between 0.5 (cutting prices in half) and ' +
+						 '2.0 (doubling prices).')
+	weightMultiplier = readProfileNumber(preferences, 'weightMultiplier')
+	if not (weightMultiplier >= 0.0):
+		raise ValueError('The ' + multiplicity + ' price increase per pound must be a non-negative number.')
+	return UserInputs(True, priceBasedOn, baseMultiplier, weightMultiplier)
+
+
+def readProfileNumber(section, name, default=0.0):
+	"""
+	This function returns a setting of a pricing profile section as a float (default if it is missing), and raises a
+	ValueError naming the setting if it is not a number.
+	Called by makeUserInputs(), readMinMatchConfidence(), and readGuardRails().
+	"""
+	value = section.get(name, default)
+	try:
+		return float(value)
+	except (TypeError, ValueError):
+		raise ValueError('The "' + name + '" must be a number, not ' + repr(value) + '.') from None
+
+
+def compareScenarios(session, profiles, outputDirectory='.'):
+	"""
+	This function prices the session's catalog under several pricing profiles without writing any upload files.
+	The catalog is categorized, using the session's excludedCategories, and matched once. New prices for every
+	scenario are then calculated in one batched calculatePrices() call over the stacked base-price columns, and each
+	scenario's slice is "polished up" with its own "round up" amount. Products are not modified.
+	A comparison table is printed and written to "OUT - Scenario Comparison.txt". The list of ScenarioResults is returned.
+	Called by main().
+	"""
+	classifier = ProductClassifier(session.excludedCategories)
+
+	# split the catalog into single- and multi-pack products once, and find their Tisco matches once
+	categories = {False: [], True: []}		# isMultiPack -> products in that category
+	for product in session.tpeProducts:
+		isMultiPack, isExcluded = classifier.classify(product.name)
+		if not isExcluded:
+			categories[isMultiPack].append(product)
+	bases = {isMultiPack: makeScenarioBases(products, session)
+			 for isMultiPack, products in categories.items()}
+
+	# stack the base columns of every scenario and category that is being modified
+	results = []
+	segments = []		# (result, old prices, start, end) for each stacked slice
+	basePrices, weights, baseMultipliers, weightMultipliers = [], [], [], []
+	stackedRows = 0
+	for number, profile in enumerate(profiles):
+		singlePackInputs, multiPackInputs, roundUp = readProfileChoices(profile)
+		result = ScenarioResult(profile.get('name', 'scenario ' + str(number + 1)), roundUp)
+		results.append(result)
+		for userInputs, isMultiPack in ((singlePackInputs, False), (multiPackInputs, True)):
+			if not userInputs.willModify:
+				continue
+			categoryBases = bases[isMultiPack]
+			basePriceList, weightList, oldPriceList = categoryBases[userInputs.priceBasedOn]
+			if userInputs.priceBasedOn == 'TISCO':
+				result.missingCount += categoryBases['missingCount']
+			basePrices.append(basePriceList)
+			weights.append(weightList)
+			baseMultipliers.append([userInputs.baseMultiplier] * len(basePriceList))
+			weightMultipliers.append([userInputs.weightMultiplier] * len(basePriceList))
+			segments.append((result, oldPriceList, stackedRows, stackedRows + len(basePriceList)))
+			stackedRows += len(basePriceList)
+
+	# calculate every scenario's prices in one pass
+	newPrices = calculatePrices(*[makePriceColumn([value for column in columns for value in column])
+								  for columns in (basePrices, weights, baseMultipliers, weightMultipliers)])
+
+	# polish each slice with its own "round up" amount and total up the differences
+	for result, oldPriceList, start, end in segments:
+		for oldPrice, finalPrice in zip(oldPriceList, polishPriceColumn(newPrices[start:end], result.roundUpAmount)):
+			finalPrice = float(finalPrice)
+			result.updatedCount += 1
+			result.revenueDelta += finalPrice - oldPrice
+			if finalPrice != oldPrice:
+				result.changedCount += 1
+
+	# print and save the comparison table
+	table = formatScenarioTable(results)
+	print(table)
+	comparisonFiles = renderOutputFiles([(os.path.join(outputDirectory, 'OUT - Scenario Comparison.txt'),
+										  writeScenarioTable, table)])
+	publishOutputFiles(comparisonFiles)
+	return results
+
+
+class ScenarioResult:
+	""" This class holds the totals for one pricing scenario evaluated by compareScenarios(). """
+	def __init__(self, name, roundUpAmount):
+		self.name = name
+		self.roundUpAmount = roundUpAmount
+		self.updatedCount = 0		# products that would be repriced
+		self.changedCount = 0		# repriced products whose price would actually change
+		self.missingCount = 0		# products with no Tisco match in a TISCO-based category
+		self.revenueDelta = 0.0		# sum of (new price - current price), i.e. the change for one sale of each product
+
+
+def makeScenarioBases(products, session):
+	"""
+	This function gathers the columns one product category needs for scenario pricing: for TPE-based pricing, every
+	product's current price and weight; for TISCO-based pricing, the Tisco price, weight, and current price of the
+	products that have a Tisco match (under the session's match mode); and the number of products without a match.
+	Called by compareScenarios().
+	"""
+	matched = []
+	for product in products:
+		tiscoItem, match = findSupplierMatch(session, product)
+		if tiscoItem is not None:
+			matched.append((tiscoItem.price, product))
+	return {'TPE': ([product.price for product in products], [product.weight for product in products],
+					[product.price for product in products]),
+			'TISCO': ([price for price, product in matched], [product.weight for price, product in matched],
+					  [product.price for price, product in matched]),
+			'missingCount': len(products) - len(matched)}
+
+
+def formatScenarioTable(results):
+	"""
+	This function lays out ScenarioResults as a text table, in the same column style as printAllInfo().
+	Called by compareScenarios().
+	"""
+	labels = ('SCENARIO     ', 'UPDATED     ', 'CHANGED     ', 'MISSING     ', 'REVENUE DELTA')
+	rows = [(result.name, str(result.updatedCount), str(result.changedCount), str(result.missingCount),
+			 format(result.revenueDelta, '+.2f')) for result in results]
+	widths = [findColumnWidth(label, [row[column] for row in rows]) for column, label in enumerate(labels)]
+	return ''.join([''.join([value.ljust(width) for value, width in zip(row, widths)]).rstrip() + '\n'
+					for row in [labels] + rows])
+
+
+def writeScenarioTable(table, outfile):
+	"""
+	This function writes a formatted scenario comparison table to an output file.
+	Called by compareScenarios().
+	"""
+	outfile.write(table)
+
+
+def parseArguments(argv):
+	"""
+	This function reads the command line options for batch mode.
+	Called by main().
+	"""
+	parser = argparse.ArgumentParser(description='Reprice TPE products. With no pricing options or profiles, '
+												 'the choices are asked for interactively.')
+	parser.add_argument('--profile', action='append', default=[], metavar='FILE',
+						help='JSON or TOML pricing profile; repeat to run several profiles back to back')
+	parser.add_argument('--single', nargs=3, metavar=('BASE', 'MULTIPLIER', 'PER_POUND'),
+						help='modify single-pack items, e.g. --single TPE 1.40 0.30')
+	parser.add_argument('--multi', nargs=3, metavar=('BASE', 'MULTIPLIER', 'PER_POUND'),
+						help='modify multi-pack items, e.g. --multi TISCO 1.20 0.50')
+	parser.add_argument('--round-up', type=int, metavar='CENTS', help='"round up" amount in cents (0-99)')
+	parser.add_argument('--compare', action='store_true',
+						help='evaluate every profile against data loaded once and write a comparison table '
+							 'instead of the upload files')
+	parser.add_argument('--incremental', action='store_true',
+						help='only reprice products whose inputs changed since the last run, and write just the '
+							 'changed rows to "OUT - Delta *.txt"')
+	parser.add_argument('--streaming', action='store_true',
+						help='stream the products through the pipeline in chunks, with disk-based sorting and indexing, '
+							 'so that memory use stays bounded for catalogs too large to fit in memory')
+	parser.add_argument('--spill-dir', metavar='DIR',
+						help='directory for the temporary files of streaming runs (default: the system temp directory)')
+	parser.add_argument('--workers', type=int, default=1, metavar='N',
+						help='reprice on N worker processes (default: 1, i.e. no extra processes)')
+	parser.add_argument('--supplier', action='append', default=[], metavar='NAME',
+						help='also price from supplier NAME\'s list ("IN - NAME Prices.txt", "IN - NAME Product '
+							 'Numbers.txt", and optionally "IN - NAME Discount ....txt"); repeat in order of preference, '
+							 'naming Tisco too to move it from first place')
+	parser.add_argument('--supplier-policy', choices=SUPPLIER_POLICIES, default='preferred',
+						help='which supplier\'s price each part number gets: the most preferred one carrying it '
+							 '(default), the cheapest, or the one whose files were updated last')
+	parser.add_argument('--match', choices=MATCH_MODES,
+						help='how TPE part numbers are matched to supplier ones: exactly (default), also ignoring '
+							 'formatting (case, dashes, periods, leading zeros, sku suffixes), or also one character '
+							 'apart; approximate matches are listed in "OUT - Approximate Matches.txt"')
+	parser.add_argument('--min-match-confidence', type=float, metavar='CONFIDENCE',
+						help='with --match, price approximate matches only from this confidence up (default: ' +
+							 str(MIN_MATCH_CONFIDENCE) + ', i.e. only formatting differences); less certain ones are '
+							 'held for review in "OUT - Approximate Matches.txt"')
+	parser.add_argument('--export', action='append', default=[], choices=EXPORT_FORMATS,
+						help='also write the upload rows to one ShopSite upload file, "OUT - ShopSite Upload.csv" or '
+							 '".xlsx" (needs openpyxl); repeat for both')
+	parser.add_argument('--export-changes', action='store_true',
+						help='with --export, also write "OUT - ShopSite Changes", holding only the rows whose price or '
+							 'name differs from the original product list')
+	parser.add_argument('--max-change-percent', type=float, metavar='PERCENT',
+						help='flag new prices that differ from the old ones by more than PERCENT%% (default: 50) in '
+							 '"OUT - Price Review.txt"')
+	parser.add_argument('--max-change-amount', type=float, metavar='DOLLARS',
+						help='flag new prices that differ from the old ones by more than DOLLARS (default: 50)')
+	parser.add_argument('--max-flagged-share', type=float, metavar='SHARE',
+						help='stop a run, writing only "OUT - Price Review.txt", if more than SHARE (0-1) of its new '
+							 'prices are flagged')
+	parser.add_argument('--watch', action='store_true',
+						help='keep running: reprice incrementally and publish fresh output files whenever input files '
+							 'change, until interrupted with Ctrl+C')
+	parser.add_argument('--poll-seconds', type=float, default=WATCH_POLL_SECONDS, metavar='SECONDS',
+						help='with --watch, how often to look at the input files (default: %(default)s)')
+	parser.add_argument('--settle-seconds', type=float, default=WATCH_SETTLE_SECONDS, metavar='SECONDS',
+						help='with --watch, how long changed input files must stay unchanged before they are read '
+							 '(default: %(default)s)')
+	parser.add_argument('--no-cache', action='store_true',
+						help='always re-read the Tisco and discount files instead of using "' + TISCO_CACHE_NAME + '"')
+	parser.add_argument('--cprofile', metavar='FILE', help='profile each run with cProfile and save the stats to FILE')
+	parser.add_argument('--trace-memory', action='store_true',
+						help='trace Python memory with tracemalloc and report the peak of each stage (slower)')
+	parser.add_argument('--input-dir', metavar='DIR', help='directory holding the "IN - *.txt" files')
+	parser.add_argument('--input-db', metavar='FILE',
+						help='read the inputs from an SQLite input database instead of the "IN - *.txt" files')
+	parser.add_argument('--write-input-db', metavar='FILE',
+						help='copy the "IN - *.txt" files (and those of any --supplier) into a new SQLite input '
+							 'database, then stop')
+	parser.add_argument('--output-dir', metavar='DIR', help='directory to write the "OUT - *.txt" files to')
+	parser.add_argument('--history', metavar='SKU',
+						help='print every price SKU was given, as recorded in "' + PRICE_HISTORY_NAME + '" in the '
+							 'output directory, then stop')
+	parser.add_argument('--rollback', nargs='?', const='last', metavar='RUN',
+						help='write "OUT - Rollback *.txt" upload files restoring the names and prices from before run '
+							 'RUN of the price history (default: the last run), then stop')
+	arguments = parser.parse_args(argv)
+	if arguments.streaming and (arguments.incremental or arguments.compare or set(arguments.supplier) - {'Tisco'} or
+								arguments.match not in (None, 'exact')):
+		parser.error('--streaming cannot be combined with --incremental, --compare, other suppliers, or --match')
+	if arguments.watch and (arguments.streaming or arguments.compare or len(arguments.profile) > 1 or
+							arguments.input_db is not None):
+		parser.error('--watch cannot be combined with --streaming, --compare, --input-db, or more than one profile')
+	if arguments.poll_seconds <= 0 or arguments.settle_seconds < 0:
+		parser.error('--poll-seconds must be positive, and --settle-seconds cannot be negative')
+	if arguments.workers < 1:
+		parser.error('--workers must be at least 1')
+	if arguments.input_dir is not None and arguments.input_db is not None:
+		parser.error('--input-dir and --input-db cannot be combined')
+	if arguments.rollback not in (None, 'last') and not arguments.rollback.isdigit():
+		parser.error('--rollback takes a run id from the price history')
+	if arguments.export_changes and not arguments.export:
+		parser.error('--export-changes needs --export')
+	if 'xlsx' in arguments.export and openpyxl is None:
+		parser.error('--export xlsx needs the openpyxl package')
+	return arguments
+
+
+def getProfileOverrides(arguments):
+	"""
+	This function turns pricing options given on the command line into a partial profile.
+	Called by main().
+	"""
+	overrides = {}
+	for option, section in (('single', 'singlePacks'), ('multi', 'multiPacks')):
+		values = getattr(arguments, option)
+		if values is not None:
+			overrides[section] = {'willModify': True, 'priceBasedOn': values[0], 'baseMultiplier': values[1],
+								  'weightMultiplier': values[2]}
+	if arguments.round_up is not None:
+		overrides['roundUpAmount'] = arguments.round_up
+	if arguments.match is not None:
+		overrides['matchMode'] = arguments.match
+	if arguments.min_match_confidence is not None:
+		overrides['minMatchConfidence'] = arguments.min_match_confidence
+	guardRails = {name: value for name, value in (('maxChangePercent', arguments.max_change_percent),
+												  ('maxChangeAmount', arguments.max_change_amount),
+												  ('maxFlaggedShare', arguments.max_flagged_share))
+				  if value is not None}
+	if guardRails:
+		overrides['guardRails'] = guardRails
+	if arguments.input_dir is not None:
+		overrides['inputDirectory'] = arguments.input_dir
+	if arguments.input_db is not None:
+		overrides['inputDirectory'] = arguments.input_db
+	if arguments.output_dir is not None:
+		overrides['outputDirectory'] = arguments.output_dir
+	return overrides
+
+
+def main(argv=None):
+	"""
+	This function is the entry point of the tool.
+	If profiles or pricing options are given on the command line, each profile (with the options applied on top) is run
+	unattended, one after another, on one PricingSession; with --compare they are evaluated side by side instead.
+	Otherwise the user is asked for their choices, as before. With --watch, the tool then keeps running on those
+	choices, repricing whenever the input files change (see watchInputs()).
+	Errors in the options, profiles, or input files, and runs stopped by the guard rails, end the tool with a one-line
+	message and exit status 1.
+	"""
+	arguments = parseArguments(argv)
+	try:
+		runCommand(arguments)
+	except GuardRailError as error:
+		sys.exit('Run stopped: ' + str(error))
+	except (ValueError, OSError, sqlite3.Error) as error:
+		sys.exit('Error: ' + str(error))
+
+
+def runCommand(arguments):
+	"""
+	This function does what the parsed command line options ask for: writes an input database, prints or rolls back
+	the price history, compares profiles, or runs the tool interactively or in batch mode.
+	Called by main().
+	"""
+	useCache = not arguments.no_cache
+	overrides = getProfileOverrides(arguments)
+	batchMode = arguments.profile or set(overrides) - {'inputDirectory', 'outputDirectory', 'matchMode',
+													   'minMatchConfidence', 'guardRails'}
+	suppliers = {'suppliers': arguments.supplier, 'supplierPolicy': arguments.supplier_policy}
+
+	if arguments.write_input_db:
+		writeInputDatabase(overrides.get('inputDirectory', '.'), arguments.write_input_db, arguments.supplier)
+		print('Input database written to ' + arguments.write_input_db + '.')
+		return
+	if arguments.history is not None:
+		printPriceHistory(arguments.history, findPriceHistory(overrides.get('outputDirectory', '.'), arguments.history))
+		return
+	if arguments.rollback is not None:
+		runId = writeRollbackFiles(overrides.get('outputDirectory', '.'),
+								   None if arguments.rollback == 'last' else int(arguments.rollback))
+		print('Rollback files for run ' + str(runId) + ' written.')
+		return
+
+	if arguments.compare:
+		profiles = [dict(loadProfile(path), **overrides) for path in arguments.profile] or [overrides]
+		for profile, path in zip(profiles, arguments.profile):
+			profile.setdefault('name', os.path.splitext(os.path.basename(path))[0])
+		session = PricingSession.fromFiles(profiles[0].get('inputDirectory', '.'), useCache,
+										   excludedCategories=profiles[0].get('excludedCategories'),
+										   matchMode=readMatchMode(profiles[0]),
+										   minMatchConfidence=readMinMatchConfidence(profiles[0]), **suppliers)
+		compareScenarios(session, profiles, profiles[0].get('outputDirectory', '.'))
+	elif not batchMode:
+		# ask user which types of products they want to modify and how
+		session = PricingSession(*getUserInputs(), matchMode=readMatchMode(overrides),
+								 minMatchConfidence=readMinMatchConfidence(overrides),
+								 guardRails=readGuardRails(overrides), **suppliers)
+		if arguments.watch:
+			watchInputs(session, overrides.get('inputDirectory', '.'), overrides.get('outputDirectory', '.'),
+						arguments.poll_seconds, arguments.settle_seconds, arguments.workers, arguments.export,
+						arguments.export_changes)
+			return
+		runPipeline(session, overrides.get('outputDirectory', '.'), arguments.incremental,
+					overrides.get('inputDirectory', '.'), useCache, arguments.cprofile, arguments.trace_memory,
+					arguments.streaming, arguments.spill_dir, arguments.workers, arguments.export, arguments.export_changes)
+	else:
+		# profiles reading the same input directory share the catalogs loaded for the first of them (streaming runs
+		# read their input files every time)
+		session = PricingSession(**suppliers)
+		loadedDirectory = None
+		profiles = [loadProfile(path) for path in arguments.profile] or [{}]
+		for profile in profiles:
+			profile = dict(profile, **overrides)
+			session.setChoicesFromProfile(profile)
+			printUserChoices(session.singlePacks, session.multiPacks, session.roundUpAmount)
+			inputDirectory = profile.get('inputDirectory', '.')
+			if arguments.watch:
+				watchInputs(session, inputDirectory, profile.get('outputDirectory', '.'), arguments.poll_seconds,
+							arguments.settle_seconds, arguments.workers, arguments.export, arguments.export_changes)
+				return
+			runPipeline(session, profile.get('outputDirectory', '.'), arguments.incremental,
+						None if inputDirectory == loadedDirectory else inputDirectory, useCache, arguments.cprofile,
+						arguments.trace_memory, arguments.streaming, arguments.spill_dir, arguments.workers,
+						arguments.export, arguments.export_changes)
+			if not arguments.streaming:
+				loadedDirectory = inputDirectory
+
+	print('\n'+'WORK COMPLETE!')
+
+
+##############################
+#           "MAIN"           #
+##############################
 
-print('\n'+'WORK COMPLETE!')
\ No newline at end of file
+if __name__ == '__main__':
+	main()